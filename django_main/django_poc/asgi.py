@@ -2,6 +2,8 @@
 ASGI config for django_poc project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server, e.g. ``uvicorn django_poc.asgi:application``, so
+the async cart and favourites views run on the event loop without a thread hop.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
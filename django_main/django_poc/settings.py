@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'sample_django.routers.PinToPrimaryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -63,6 +64,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'sample_django.context_processors.catalog',
+                'sample_django.context_processors.cart',
             ],
         },
     },
@@ -74,17 +77,120 @@ WSGI_APPLICATION = 'django_poc.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLITE_PATH points servers started by the load-test harness at a scratch file
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Connections are kept between requests and checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock at BEGIN, so busy_timeout applies to every writer
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
     }
 }
 
+# A read replica. Locally, REPLICA_PATH names a copy of the primary that
+# `manage.py sync_replica` refreshes; in tests it is the default database.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.environ.get('REPLICA_PATH', BASE_DIR / 'db.replica.sqlite3'),
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['sample_django.routers.PrimaryReplicaRouter']
+# Aliases that take reads; empty sends everything to the primary
+DATABASE_REPLICAS = ['replica'] if os.environ.get('REPLICA_PATH') else []
+# How long a visitor's reads stay on the primary after they write; keep it
+# above the replication lag (the sync_replica interval, locally)
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# Applied by sample_django.db.configure to every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative: KiB rather than pages
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Checkout transactions that still find the database locked are retried this
+# many times, after a pause starting at DATABASE_WRITE_RETRY_DELAY seconds and doubling
+DATABASE_WRITE_RETRIES = 4
+DATABASE_WRITE_RETRY_DELAY = 0.05
+
+
+# Cache
+# Local memory keeps this working without Redis. Point FRAGMENT_CACHE_BACKEND at
+# django.core.cache.backends.filebased.FileBasedCache to share fragments (and the
+# catalog generation that invalidates them) between worker processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('FRAGMENT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('FRAGMENT_CACHE_LOCATION', 'shopkart'),
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # Sessions get their own cache, so fragments never cull them; it must be
+    # shared between processes (SESSION_CACHE_BACKEND) when there are several
+    'sessions': {
+        'BACKEND': os.environ.get('SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', 'shopkart-sessions'),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+}
+
+# Sessions are read from the 'sessions' cache and written to the DB lazily
+SESSION_ENGINE = 'sample_django.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+# A changed session reaches django_session at most this often; logins and logouts at once.
+# Only with a shared SESSION_CACHE_BACKEND: over a per-process cache sessions go straight to the DB.
+SESSION_WRITEBACK_SECONDS = int(
+    os.environ.get('SESSION_WRITEBACK_SECONDS', 60 if 'SESSION_CACHE_BACKEND' in os.environ else 0)
+)
+
+# Seconds a rendered template fragment (product card, navbar...) is kept
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Seconds an anonymous catalog page is kept; catalog writes expire it sooner
+PAGE_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# Log in by username or contact number, with users cached between requests
+AUTHENTICATION_BACKENDS = ['sample_django.auth_backend.ContactNumberAuthBackend']
+
+# Cost of a password hash: PBKDF2-SHA256 iterations by tier. Logins rehash
+# stored passwords at the configured tier, so a change applies as users log in
+PASSWORD_HASH_TIERS = {'high': 1_500_000, 'standard': 1_000_000, 'reduced': 390_000}
+PASSWORD_HASH_TIER = os.environ.get('PASSWORD_HASH_TIER', 'standard')
+# Password checks run on this many threads per process, niced so request threads come first; 0 runs them inline
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_NICENESS = 19
+PASSWORD_HASHERS = [
+    'sample_django.hashers.TieredPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Password checks allowed per client IP, and per IP for one identifier, as
+# (attempts, seconds); attempts beyond them get a 429 without being hashed.
+# Total hashing cost is bounded by PASSWORD_HASH_WORKERS, not by a shared limit.
+LOGIN_RATE_LIMITS = {'ip': (10, 60), 'identifier': (5, 300)}
+# 'local' keeps the limits per process; 'cache' shares them through CACHES
+LOGIN_RATE_LIMIT_BACKEND = os.environ.get('LOGIN_RATE_LIMIT_BACKEND', 'local')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -117,15 +223,41 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# Where collectstatic puts the hashed, compressed assets that sample_django.views.serve_static serves
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Uploads live apart from the site's own assets, which collectstatic must not pick up
 MEDIA_URL = '/images/'
-MEDIA_ROOT = BASE_DIR / "static"
+MEDIA_ROOT = BASE_DIR / "media"
 
 STATICFILES_DIRS=[
     BASE_DIR/'static'
 ]
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Hashed names need collectstatic after every change, so only outside DEBUG
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'sample_django.assets.CompressedManifestStaticFilesStorage',
+    },
+    # Product and category images, stored once per distinct content
+    'uploads': {'BACKEND': 'sample_django.storage.ContentAddressedStorage'},
+}
+
+# Threads making responsive thumbnails of new uploads; 0 makes them inline
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# How long checkout holds stock for a user before it goes back on sale
+STOCK_RESERVATION_MINUTES = 15
+# Most of one product a single order, or hold, may take
+MAX_ORDER_QUANTITY = 10
+
+# Order numbers are allocated in-process; give every host its own node id
+ORDER_NUMBER_ALLOCATOR = 'sample_django.order_numbers.SnowflakeAllocator'
+ORDER_NUMBER_NODE_ID = int(os.environ.get('ORDER_NUMBER_NODE_ID', 0))
@@ -15,14 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,re_path,include
 from django.conf import settings
-from django.conf.urls.static import static
+import re
+
+from sample_django.views import serve_static, serve_upload
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('',include('sample_django.urls')),
+    # Assets and uploads are served in production too, with immutable headers on hashed names
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_static),
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_upload),
 ]
-
-if settings.DEBUG:
-    urlpatterns+=static(settings.MEDIA_URL,document_root=settings.MEDIA_ROOT)
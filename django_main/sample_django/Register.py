@@ -38,8 +38,8 @@ class CustomUserForm(UserCreationForm):
             attrs={'class': 'form-control', 'placeholder': 'Enter User Confirm Password'}
         )
     
-    # def clean_contact_number(self):
-        # contact_number = self.cleaned_data.get('contact_number')
-        # if UserProfile.objects.filter(contact_number=contact_number).exists():
-            # raise forms.ValidationError("This contact number is already registered.")
-        # return contact_number
+    def clean_contact_number(self):
+        contact_number = self.cleaned_data.get('contact_number')
+        if UserProfile.objects.filter(contact_number=contact_number).exists():
+            raise forms.ValidationError("This contact number is already registered.")
+        return contact_number
@@ -1,5 +1,6 @@
-from django.contrib import admin
-from .models import Catagory,Product,UserProfile,AddCart,Favourite,CustomerFeedback,Order,OrderItem
+from django.contrib import admin, messages
+from .models import Catagory,Product,UserProfile,AddCart,Favourite,CustomerFeedback,Order,OrderItem,StockReservation,Promotion
+from . import orders, stock
 
 
 # class CategoryAdmin(admin.ModelAdmin):
@@ -11,10 +12,48 @@ admin.site.register(Product)
 admin.site.register(AddCart)
 admin.site.register(Favourite)
 admin.site.register(CustomerFeedback)
-admin.site.register(Order)
 admin.site.register(OrderItem)
 
 
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ('product',)
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('order_number', 'user', 'total_amount', 'discount_amount', 'status', 'created_at')
+    list_select_related = ('user',)
+    inlines = [OrderItemInline]
+    actions = ['reorder']
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Keep the total in step with any line items edited inline
+        orders.refresh_total(form.instance)
+
+    @admin.action(description="Place the selected orders again")
+    def reorder(self, request, queryset):
+        for order in queryset.select_related('user'):
+            try:
+                new_order = orders.reorder(order)
+                self.message_user(request, f"Placed {new_order.order_number} from {order.order_number}")
+            except stock.OutOfStock:
+                self.message_user(request, f"Not enough stock to reorder {order.order_number}", messages.ERROR)
+admin.site.register(StockReservation)
+
+
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = (
+        'name', 'code', 'scope', 'kind', 'value', 'min_quantity', 'min_total', 'active', 'starts_at', 'ends_at',
+    )
+    list_filter = ('scope', 'kind', 'active')
+    search_fields = ('name', 'code')
+    raw_id_fields = ('product',)
+
+
 
 # admin.site.register(Register)
 
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SampleDjangoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sample_django'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,234 @@
+"""
+Static assets in production: collected, hashed, pre-compressed and served by the app.
+
+collectstatic with CompressedManifestStaticFilesStorage copies every asset to
+STATIC_ROOT under a name carrying a hash of its content (css/style.3f2a9c.css),
+rewrites the url() references between them, and writes a .gz (and a .br when
+the optional brotli package is installed) next to each text asset. serve_file()
+then answers with the smallest variant the client accepts, honours single byte
+ranges and If-Modified-Since, and marks hashed names cacheable for a year,
+since a changed file gets a new name.
+
+Bootstrap and Font Awesome are vendored under static/vendor/ by the
+vendor_assets command; {% vendor_asset %} links to the vendored copy when it
+is there and to the CDN until then.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from collections import namedtuple
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import storages
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # optional; assets are still gzipped without it
+    brotli = None
+
+from .storage import IMMUTABLE_MAX_AGE
+
+# Worth compressing: text, and the font formats that are not compressed already
+COMPRESSIBLE = ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.eot', '.ttf', '.otf')
+# A variant is kept only if it is at least this much smaller than the original
+MIN_SAVING = 0.05
+
+
+def _compressors():
+    if brotli is not None:
+        yield 'br', lambda data: brotli.compress(data, quality=11)
+    # mtime=0 keeps the output identical across collectstatic runs
+    yield 'gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+
+
+# Content-Encoding token for each variant suffix, in order of preference
+ENCODINGS = (('br', 'br'), ('gz', 'gzip'))
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes compressed variants of text assets"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if name.lower().endswith(COMPRESSIBLE) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        """Write name.br / name.gz where they save enough; returns the suffixes written"""
+        with self.open(name, 'rb') as f:
+            data = f.read()
+        written = []
+        for suffix, compress in _compressors():
+            compressed = compress(data)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                with open('%s.%s' % (self.path(name), suffix), 'wb') as out:
+                    out.write(compressed)
+                written.append(suffix)
+        return written
+
+
+_hashed = (None, frozenset())
+
+
+def is_hashed_static(name):
+    """Whether name is a manifest-hashed name of the configured static files storage"""
+    global _hashed
+    storage = storages['staticfiles']
+    if _hashed[0] is not storage:
+        _hashed = (storage, frozenset(getattr(storage, 'hashed_files', {}).values()))
+    return name in _hashed[1]
+
+
+def resolve(root, path):
+    """Absolute path of path under root, or 404 for anything outside it"""
+    try:
+        return safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404("Not found")
+
+
+def static_path(path):
+    """Where a static file served by the app is: STATIC_ROOT, or the finders when DEBUG"""
+    if settings.DEBUG:
+        return finders.find(path)
+    return resolve(settings.STATIC_ROOT, path)
+
+
+def _accepts(header, coding):
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        if token.strip().lower() == coding:
+            return not re.search(r'q\s*=\s*0(?:\.0*)?\s*$', params)
+    return False
+
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _byte_range(header, size):
+    """(start, end) inclusive for a single-range header, None to send it all, or () if unsatisfiable"""
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return ()
+    return start, end
+
+
+def _read(path, start, length, chunk=64 * 1024):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve_file(request, path, immutable=False):
+    """
+    The file at path: 304 if unchanged since If-Modified-Since, 206 for a
+    byte range, else the smallest pre-compressed variant the client accepts.
+    """
+    if not path or not os.path.isfile(path):
+        raise Http404("Not found")
+    stat = os.stat(path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = _file_response(request, path, stat.st_size)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if immutable:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+def _file_response(request, path, size):
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    variants = [(suffix, coding) for suffix, coding in ENCODINGS if os.path.isfile('%s.%s' % (path, suffix))]
+    header = request.META.get('HTTP_RANGE')
+    span = _byte_range(header, size) if header else None
+    if span == ():
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+    elif span:
+        # Ranges are of the identity encoding, so resumed downloads line up
+        start, end = span
+        response = StreamingHttpResponse(_read(path, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        accept = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        chosen = next(((suffix, coding) for suffix, coding in variants if _accepts(accept, coding)), None)
+        if chosen:
+            response = FileResponse(open('%s.%s' % (path, chosen[0]), 'rb'), content_type=content_type)
+            response['Content-Encoding'] = chosen[1]
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    if variants:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+Asset = namedtuple('Asset', 'path url integrity files')
+
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/'
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/'
+
+# The CDN assets layouts/main.html loads; files are further ones they
+# reference, relative to them, that collectstatic needs to resolve
+VENDOR = {
+    'bootstrap.css': Asset(
+        'vendor/bootstrap/css/bootstrap.min.css', BOOTSTRAP + 'css/bootstrap.min.css',
+        'sha384-EVSTQN3/azprG1Anm3QDgpJLIm9Nao0Yz1ztcQTwFspd3yD65VohhpuuCOmLASjC',
+        ('bootstrap.min.css.map',),
+    ),
+    'bootstrap.js': Asset(
+        'vendor/bootstrap/js/bootstrap.bundle.min.js', BOOTSTRAP + 'js/bootstrap.bundle.min.js',
+        'sha384-MrcW6ZMFYlzcLA8Nl+NtUVF0sA7MsXsP1UyJoMp4YLEuNSfAP+JcXn/tWtIaxVXM',
+        ('bootstrap.bundle.min.js.map',),
+    ),
+    'font-awesome.css': Asset(
+        'vendor/font-awesome/css/font-awesome.min.css', FONT_AWESOME + 'css/font-awesome.min.css', None,
+        tuple('../fonts/fontawesome-webfont.%s' % ext for ext in ('eot', 'woff2', 'woff', 'ttf', 'svg')),
+    ),
+}
+
+
+def vendor_files(asset):
+    """(static path, url) of the asset and every file it references"""
+    yield asset.path, asset.url
+    for relative in asset.files:
+        yield posixpath.normpath(posixpath.join(posixpath.dirname(asset.path), relative)), urljoin(asset.url, relative)
+
+
+def is_vendored(name):
+    """
+    Whether the vendor_assets command has put the named asset in the static
+    files. Looked up on every call, so running it takes effect without a restart.
+    """
+    return finders.find(VENDOR[name].path) is not None
@@ -1,7 +1,65 @@
+import hashlib
+
 from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.utils.crypto import get_random_string
+
+from . import hashers, ratelimit
+from .caching import shared
 from .models import UserProfile
 
+# Both are cached only when the cache is shared: a save in one worker must
+# reach the others, and junk identifiers must not crowd out its own entries.
+# Sessions resolve their user from the cache for this long; saves drop it sooner
+USER_TTL = 60
+# Identifiers that matched nobody are remembered, so repeating them costs no query
+UNKNOWN_TTL = 300
+
+_dummy = None
+
+
+def _dummy_password():
+    # Hashed once per process; unknown identifiers verify against it so they
+    # take as long as a wrong password for a real user
+    global _dummy
+    if _dummy is None:
+        _dummy = make_password(get_random_string(32))
+    return _dummy
+
+
+def user_key(user_id):
+    return 'auth:user:%s' % user_id
+
+
+def unknown_key(identifier):
+    return 'auth:unknown:%s' % hashlib.sha256(identifier.encode()).hexdigest()
+
+
+def forget_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+def forget_unknown(*identifiers):
+    """Let identifiers that now belong to someone log in"""
+    cache.delete_many([unknown_key(identifier) for identifier in identifiers if identifier])
+
+
+def candidates(identifier):
+    """
+    Users whose username or contact number is identifier, in one query over
+    the two unique indexes; contact number matches first.
+    """
+    matches = User.objects.filter(
+        Q(username=identifier)
+        | Q(pk__in=UserProfile.objects.filter(contact_number=identifier).values('user_id'))
+    )[:2]
+    return sorted(matches, key=lambda user: user.username == identifier)
+
+
 class ContactNumberAuthBackend(ModelBackend):
     """
     Custom authentication backend to allow login with contact number
@@ -10,28 +68,37 @@ class ContactNumberAuthBackend(ModelBackend):
         """
         Allow authentication with either username or contact number
         """
-        # Check if username is actually a contact number
-        try:
-            # Try to find user by contact number
-            profile = UserProfile.objects.get(contact_number=username)
-            user = profile.user
-            if user.check_password(password):
-                return user
-        except UserProfile.DoesNotExist:
-            pass
-        
-        # Fall back to username authentication
-        try:
-            user = User.objects.get(username=username)
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if not username or password is None:
             return None
-        
+        if request is not None and not ratelimit.allow_login(request, username):
+            # Stops authenticate() before any backend hashes the password
+            request.login_throttled = True
+            raise PermissionDenied
+        remember = shared()
+        users = [] if remember and cache.get(unknown_key(username)) else candidates(username)
+        if not users:
+            if remember:
+                cache.set(unknown_key(username), True, UNKNOWN_TTL)
+            hashers.verify(password, _dummy_password())
+            return None
+        for user in users:
+            if hashers.verify(password, user.password) and self.user_can_authenticate(user):
+                if hashers.needs_rehash(user.password):
+                    user.set_password(password)
+                    user.save(update_fields=['password'])
+                return user
         return None
 
     def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
+        if not shared():
+            return super().get_user(user_id)
+        user = cache.get(user_key(user_id))
+        if user is None:
+            try:
+                user = User.objects.get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(user_key(user_id), user, USER_TTL)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,96 @@
+"""Shared scaffolding for the bench_* management commands"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils.text import slugify
+
+from .models import Catagory, Product
+from .pricing import discount_percent
+
+ADJECTIVES = ['red', 'blue', 'green', 'classic', 'slim', 'cotton', 'leather', 'wireless', 'smart', 'kids',
+              'summer', 'winter', 'running', 'formal', 'casual', 'printed', 'silk', 'denim', 'steel', 'organic']
+NOUNS = ['shirt', 'shoe', 'kurti', 'watch', 'bag', 'toy', 'lipstick', 'headphones', 'jacket', 'saree',
+         'sneaker', 'wallet', 'bottle', 'lamp', 'speaker', 'backpack', 'dress', 'cap', 'sandal', 'belt']
+
+
+@contextmanager
+def scratch_database(verbosity=0, path=None):
+    """
+    Run against a throwaway test database so benchmarks never touch real data.
+    With path it is created as that file, so server processes can open it too.
+    """
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings.get('NAME')
+    if path:
+        test_settings['NAME'] = str(path)
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        # Replicas are copies of the real database, not of this one
+        with override_settings(DATABASE_REPLICAS=[]):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity)
+        test_settings['NAME'] = old_test_name
+
+
+def seed_catalog(products, categories=10, trending_every=10):
+    """Bulk-insert a synthetic catalog; returns the categories"""
+    cats = Catagory.objects.bulk_create([
+        Catagory(name=f"Category {i}", slug=f"category-{i}", description="Benchmark category",
+                 image='static/upload/bench.jpg')
+        for i in range(categories)
+    ])
+    batch = []
+    for i in range(products):
+        name = f"{ADJECTIVES[i % 20]} {NOUNS[i // 20 % 20]} {i}"
+        original_price, selling = 100 + i % 900, 90 + i % 800
+        batch.append(Product(
+            category=cats[i % categories],
+            name=name,
+            slug=slugify(name),
+            vendor=f"Vendor {i % 50}",
+            product_image='static/upload/bench.jpg',
+            quantity=i % 20,
+            original_price=original_price,
+            selling=selling,
+            discount=discount_percent(original_price, selling),
+            description=f"Benchmark product number {i} with a short description",
+            trending=i % trending_every == 0,
+        ))
+        if len(batch) == 5000:
+            Product.objects.bulk_create(batch)
+            batch = []
+    Product.objects.bulk_create(batch)
+    return cats
+
+
+def client():
+    # 'testserver' is only allowed once the test environment is set up, which
+    # would also instrument template rendering and skew the numbers
+    return Client(HTTP_HOST='localhost')
+
+
+def measure(fn, repeat, before=None):
+    """Call fn repeat times and return the wall time of each call in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summary(samples):
+    return "mean %.2fms  p50 %.2fms  p99 %.2fms" % (
+        statistics.mean(samples), statistics.median(samples), percentile(samples, 99)
+    )
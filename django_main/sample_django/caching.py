@@ -0,0 +1,138 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import CacheGeneration
+
+GENERATION_KEY = 'catalog:generation'
+# Bumped only when a selling price changes; cart summaries are keyed on it
+PRICE_GENERATION_KEY = 'catalog:prices'
+
+
+def shared(alias=DEFAULT_CACHE_ALIAS):
+    """Whether a cache is seen alike by every worker process"""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+# Generations must agree between processes, or a write in one never retires
+# what the others cached. They live in the cache when it is shared and in
+# CacheGeneration rows otherwise, read from the primary as replicas may lag.
+
+def _rows(key):
+    return CacheGeneration.objects.using(DEFAULT_DB_ALIAS).filter(key=key)
+
+
+def generation(key):
+    """Current value of a counter that cache keys include to expire together"""
+    if not shared():
+        value = _rows(key).values_list('value', flat=True).first()
+        return 1 if value is None else value
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, 1, timeout=None)
+        value = cache.get(key, 1)
+    return value
+
+
+def bump_generation(key):
+    if not shared():
+        if not _rows(key).update(value=F('value') + 1):
+            try:
+                with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                    CacheGeneration.objects.using(DEFAULT_DB_ALIAS).create(key=key, value=2)
+            except IntegrityError:
+                # Another process created the row first
+                _rows(key).update(value=F('value') + 1)
+        return generation(key)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+        return cache.incr(key)
+
+
+def catalog_generation():
+    """Counter bumped on every catalog write; part of every catalog cache key"""
+    return generation(GENERATION_KEY)
+
+
+def bump_catalog_generation():
+    """Retire every cached fragment built from the catalog as it was"""
+    return bump_generation(GENERATION_KEY)
+
+
+def _session_has(request, key):
+    session = getattr(request, 'session', None)
+    return bool(session is not None and session.session_key and session.get(key))
+
+
+def _has_pending_messages(request):
+    return bool(request.COOKIES.get('messages')) or _session_has(request, '_messages')
+
+
+def _finish(request, entry):
+    content, content_type, etag, last_modified = entry
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ('Cookie',))
+    # Cached HTML carries someone else's token; pages read the csrftoken cookie
+    # instead, so make sure this visitor has one.
+    get_token(request)
+    return response
+
+
+def cache_anonymous_page(view):
+    """
+    Serve whole catalog pages to anonymous visitors from the cache.
+
+    Entries are keyed by the catalog generation, so any catalog write retires
+    them all. Responses carry an ETag and Last-Modified and answer conditional
+    GETs with 304. Logged-in users, guests with a cart badge to show, requests
+    with flash messages waiting and anything but a plain 200 go straight to
+    the view.
+    """
+    # carts imports this module
+    from .carts import SESSION_KEY as CART_SESSION_KEY
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            request.method not in ('GET', 'HEAD') or request.user.is_authenticated
+            or _has_pending_messages(request) or _session_has(request, CART_SESSION_KEY)
+        ):
+            return view(request, *args, **kwargs)
+
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = 'page:%s:%s' % (catalog_generation(), path)
+        entry = cache.get(key)
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            storage = getattr(request, '_messages', None)
+            if response.status_code != 200 or response.streaming or response.cookies or (storage and storage.added_new):
+                return response
+            content = response.content
+            entry = (
+                content,
+                response['Content-Type'],
+                '"%s"' % hashlib.md5(content).hexdigest(),
+                int(time.time()),
+            )
+            cache.set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+        return _finish(request, entry)
+
+    return wrapper
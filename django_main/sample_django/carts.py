@@ -0,0 +1,346 @@
+"""
+Guest carts kept in the session, merged into AddCart on login, batched
+quantity updates for both kinds of cart, and the cart summary in the navbar.
+
+Anonymous shoppers can cart products without an account and without any
+AddCart writes: their lines live in the session as {"<product id>": qty},
+which stays small enough for the signed_cookies session engine as well as
+the database one. When they log in, the lines are written to AddCart with a
+single bulk upsert.
+"""
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, When, Value, IntegerField, Count, Sum
+
+from .models import Product, AddCart
+from .caching import generation, shared, PRICE_GENERATION_KEY
+from . import catalog, pricing, promotions
+from .stock import max_order_quantity
+
+SESSION_KEY = 'cart'
+SUMMARY_SESSION_KEY = 'cart_summary'
+
+# Keeps the session (or cookie) from growing without bound
+MAX_GUEST_LINES = 50
+
+class GuestCartItem(namedtuple('GuestCartItem', 'id product quantity')):
+    """Stands in for an AddCart row in cart.html; id is the product id"""
+
+    @property
+    def product_id(self):
+        return self.id
+
+    @property
+    def line_total(self):
+        return pricing.line_total(self.product.selling, self.quantity)
+
+
+def guest_lines(session):
+    """{product_id: quantity} for the guest cart in session"""
+    return {int(pid): quantity for pid, quantity in session.get(SESSION_KEY, {}).items()}
+
+
+async def aguest_lines(session):
+    return {int(pid): quantity for pid, quantity in (await session.aget(SESSION_KEY, {})).items()}
+
+
+def _stored(lines):
+    return {str(pid): quantity for pid, quantity in lines.items()}
+
+
+def add_guest_line(lines, product_id, quantity):
+    """
+    Add a line to lines in place. Returns False, like the unique constraint
+    on AddCart, when the product is already carted or the cart is full.
+    """
+    if product_id in lines or len(lines) >= MAX_GUEST_LINES:
+        return False
+    lines[product_id] = quantity
+    return True
+
+
+async def aadd_guest_line(session, product, quantity):
+    """Cart quantity of product for a guest, keeping their summary current"""
+    lines = await aguest_lines(session)
+    if not add_guest_line(lines, product.id, quantity):
+        return False
+    await session.aset(SESSION_KEY, _stored(lines))
+    current = await sync_to_async(price_generation)()
+    stored = await session.aget(SUMMARY_SESSION_KEY)
+    if len(lines) == 1:
+        stored = {'count': 0, 'quantity': 0, 'total_minor': 0, 'generation': current}
+    if stored and stored['generation'] == current:
+        stored = dict(stored)
+        stored['count'] += 1
+        stored['quantity'] += quantity
+        stored['total_minor'] += pricing.to_minor(product.selling) * quantity
+        await session.aset(SUMMARY_SESSION_KEY, stored)
+    else:
+        await session.apop(SUMMARY_SESSION_KEY, None)
+    return True
+
+
+async def aremove_guest_line(session, product_id):
+    lines = await aguest_lines(session)
+    if lines.pop(product_id, None) is None:
+        return False
+    await session.aset(SESSION_KEY, _stored(lines))
+    # The line's price is not kept, so let the next page recount
+    await session.apop(SUMMARY_SESSION_KEY, None)
+    return True
+
+
+def guest_cart_items(lines):
+    """Cart rows for cart.html, with every product fetched in one query"""
+    products = catalog.product_cards(Product.objects.filter(id__in=lines)).in_bulk()
+    return [
+        GuestCartItem(pid, products[pid], quantity)
+        for pid, quantity in lines.items() if pid in products
+    ]
+
+
+def add_lines(user, lines):
+    """
+    Write {product_id: quantity} to the user's cart in one INSERT ... ON
+    CONFLICT statement; lines already in the cart take the new quantity.
+    """
+    AddCart.objects.bulk_create(
+        [AddCart(user=user, product_id=pid, quantity=quantity) for pid, quantity in lines.items()],
+        update_conflicts=True,
+        unique_fields=['user', 'product'],
+        update_fields=['quantity'],
+    )
+
+
+def merge(session, user):
+    """Move the guest cart in session into the user's AddCart rows"""
+    lines = guest_lines(session)
+    session.pop(SUMMARY_SESSION_KEY, None)
+    if not lines:
+        return 0
+    # Products deleted since they were carted would fail the foreign key
+    existing = set(Product.objects.filter(id__in=lines).values_list('id', flat=True))
+    lines = {pid: quantity for pid, quantity in lines.items() if pid in existing}
+    if lines:
+        # bulk_create sends no signals for the summary to follow
+        add_lines(user, lines)
+        transaction.on_commit(lambda: forget_summary(user.pk))
+    del session[SESSION_KEY]
+    return len(lines)
+
+
+class NotEnoughStock(ValueError):
+    """Raised when a cart update asks for more units than are in stock or one order may take"""
+
+    def __init__(self, available):
+        # {item_id: units that can be ordered}, so the client can clamp its steppers
+        self.available = available
+        super().__init__("Not enough stock for cart item(s) %s" % sorted(available))
+
+
+def clean_changes(changes):
+    """Validate {item_id: quantity} from a request body; 0 means remove"""
+    cleaned = {}
+    for item_id, quantity in changes.items():
+        item_id, quantity = int(item_id), int(quantity)
+        if quantity < 0:
+            raise ValueError("Quantity cannot be negative")
+        cleaned[item_id] = quantity
+    return cleaned
+
+
+def _check_stock(changes, in_stock):
+    # stock.hold() refuses lines above the per-order limit, so the cart must too
+    allowed = {item_id: min(quantity, max_order_quantity()) for item_id, quantity in in_stock.items()}
+    short = {
+        item_id: allowed[item_id]
+        for item_id, quantity in changes.items()
+        if item_id in allowed and quantity > allowed[item_id]
+    }
+    if short:
+        raise NotEnoughStock(short)
+
+
+def totals(rows, code=None):
+    """
+    Cart totals from (item_id, product_id, category_id, quantity, unit_price)
+    rows, exact to the paisa, with promotions and the coupon code applied
+    """
+    rows = list(rows)
+    quote = promotions.quote(rows, code)
+    items = []
+    for item_id, _, _, quantity, _ in rows:
+        line_total, discount = quote.lines[item_id]
+        items.append({"id": item_id, "quantity": quantity, "line_total": line_total, "discount": discount})
+    return {
+        "items": items,
+        "count": len(items),
+        "quantity": sum(item["quantity"] for item in items),
+        "subtotal": quote.subtotal,
+        "discount": quote.discount,
+        "total": quote.total,
+        "promotions": quote.applied,
+    }
+
+
+def update_quantities(user, changes, code=None):
+    """
+    Apply {item_id: quantity} to the user's AddCart rows in one transaction.
+
+    Whatever the size of the batch this is one read for stock, at most one
+    UPDATE and one DELETE, and one read for the new totals. Ids that are not
+    in the user's cart are ignored; if any line asks for more than is in
+    stock, or than MAX_ORDER_QUANTITY, nothing is written and NotEnoughStock
+    is raised.
+    """
+    changes = clean_changes(changes)
+    with transaction.atomic():
+        in_stock = dict(
+            AddCart.objects.filter(user=user, id__in=changes).values_list('id', 'product__quantity')
+        )
+        _check_stock(changes, in_stock)
+        keep = {item_id: qty for item_id, qty in changes.items() if item_id in in_stock and qty}
+        drop = [item_id for item_id, qty in changes.items() if item_id in in_stock and not qty]
+        if keep:
+            AddCart.objects.filter(id__in=keep).update(quantity=Case(
+                *[When(id=item_id, then=Value(qty)) for item_id, qty in keep.items()],
+                output_field=IntegerField(),
+            ))
+        if drop:
+            AddCart.objects.filter(id__in=drop).delete()
+        result = totals(
+            AddCart.objects.filter(user=user).order_by('id').values_list(
+                'id', 'product_id', 'product__category_id', 'quantity', 'product__selling'
+            ),
+            code,
+        )
+    # The totals are exact, so they replace whatever the signals left behind
+    if shared():
+        transaction.on_commit(lambda: cache.set(_summary_key(user.pk), _summary_of(result)))
+    return result
+
+
+def update_guest_quantities(session, changes, code=None):
+    """update_quantities() for a guest cart, whose item ids are product ids"""
+    changes = clean_changes(changes)
+    lines = guest_lines(session)
+    products = {
+        pid: (quantity, selling, category_id)
+        for pid, quantity, selling, category_id in Product.objects.filter(id__in=lines).values_list(
+            'id', 'quantity', 'selling', 'category_id'
+        )
+    }
+    _check_stock(changes, {pid: products[pid][0] for pid in changes if pid in lines and pid in products})
+    for pid, quantity in changes.items():
+        if pid in lines:
+            if quantity:
+                lines[pid] = quantity
+            else:
+                del lines[pid]
+    session[SESSION_KEY] = _stored(lines)
+    result = totals(
+        ((pid, pid, products[pid][2], quantity, products[pid][1]) for pid, quantity in lines.items() if pid in products),
+        code,
+    )
+    _store_guest_summary(session, _summary_of(result))
+    return result
+
+
+# Cart summary (lines, units and amount) for the navbar badge. Logged-in
+# users' summaries are cached per user and adjusted as AddCart rows come and
+# go; guests' ride along in their session. Both are keyed by the price
+# generation, so a price change makes them recount once from the database.
+# A per-process cache would only see its own worker's adjustments, so
+# without a shared one logged-in summaries are counted on every page.
+
+EMPTY_SUMMARY = {'count': 0, 'quantity': 0, 'total': pricing.ZERO}
+
+
+def price_generation():
+    return generation(PRICE_GENERATION_KEY)
+
+
+def _summary_key(user_id):
+    return 'cart:summary:%s:%s' % (price_generation(), user_id)
+
+
+def _summary_of(result):
+    # The badge shows what the lines add up to, before promotions
+    return {'count': result['count'], 'quantity': result['quantity'], 'total': result['subtotal']}
+
+
+def _count(queryset):
+    summary = queryset.aggregate(
+        lines=Count('id'), units=Sum('quantity'), amount=pricing.minor_units_sum('quantity', 'product__selling')
+    )
+    return {
+        'count': summary['lines'],
+        'quantity': summary['units'] or 0,
+        'total': pricing.from_minor(summary['amount'] or 0),
+    }
+
+
+def summary(user):
+    """
+    A logged-in user's cart summary: from the cache, counted once on a miss.
+    Without a shared cache it is one aggregate query on every page.
+    """
+    if not shared():
+        return _count(AddCart.objects.filter(user=user))
+    key = _summary_key(user.pk)
+    cached = cache.get(key)
+    if cached is None:
+        cached = _count(AddCart.objects.filter(user=user))
+        cache.set(key, cached)
+    return cached
+
+
+def adjust_summary(user_id, count, quantity, total):
+    """Apply a change to a cached summary; without one there is nothing to adjust"""
+    if not shared():
+        return
+    key = _summary_key(user_id)
+    cached = cache.get(key)
+    if cached is not None:
+        cache.set(key, {
+            'count': cached['count'] + count,
+            'quantity': cached['quantity'] + quantity,
+            'total': cached['total'] + total,
+        })
+
+
+def forget_summary(user_id):
+    if shared():
+        cache.delete(_summary_key(user_id))
+
+
+def _store_guest_summary(session, summary):
+    # Sessions are JSON, so the amount is kept in minor units
+    session[SUMMARY_SESSION_KEY] = {
+        'count': summary['count'],
+        'quantity': summary['quantity'],
+        'total_minor': pricing.to_minor(summary['total']),
+        'generation': price_generation(),
+    }
+
+
+def guest_summary(session):
+    """A guest's cart summary, kept in the session next to the cart itself"""
+    if not session.get(SESSION_KEY):
+        return EMPTY_SUMMARY
+    stored = session.get(SUMMARY_SESSION_KEY)
+    if stored is None or stored['generation'] != price_generation():
+        lines = guest_lines(session)
+        prices = dict(Product.objects.filter(id__in=lines).values_list('id', 'selling'))
+        carted = {pid: qty for pid, qty in lines.items() if pid in prices}
+        summary = {
+            'count': len(carted),
+            'quantity': sum(carted.values()),
+            'total': pricing.total((qty, prices[pid]) for pid, qty in carted.items()),
+        }
+        _store_guest_summary(session, summary)
+        return summary
+    return {'count': stored['count'], 'quantity': stored['quantity'], 'total': pricing.from_minor(stored['total_minor'])}
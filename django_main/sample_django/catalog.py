@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Prefetch
+
+from .models import Catagory, Product, AddCart, Order, OrderItem
+
+# Columns rendered by the product cards in home.html and products/index.html
+# and by the JSON product feed.
+# Anything a template touches must be listed here, otherwise the deferred
+# field is loaded with one extra query per card.
+PRODUCT_CARD_FIELDS = (
+    'id',
+    'name',
+    'slug',
+    'vendor',
+    'description',
+    'product_image',
+    'original_price',
+    'selling',
+    'quantity',
+    'trending',
+    'discount',
+    'created_at',
+    'updated_at',
+    'category__id',
+    'category__name',
+    'category__slug',
+)
+
+
+def product_cards(queryset=None):
+    """Project a product queryset down to what a listing card needs"""
+    if queryset is None:
+        queryset = Product.objects.all()
+    return queryset.select_related('category').only(*PRODUCT_CARD_FIELDS)
+
+
+def active_products():
+    """All visible products (status=0) ready to be rendered as cards"""
+    return product_cards(Product.objects.filter(status=0))
+
+
+def trending_products():
+    """Visible products flagged as trending"""
+    return product_cards(Product.objects.filter(trending=1, status=0))
+
+
+def category_products(category):
+    """Products listed on a category page"""
+    return product_cards(Product.objects.filter(category=category))
+
+
+def visible_categories():
+    """Categories shown on the collections page"""
+    return Catagory.objects.filter(status=0)
+
+
+def visible_category(slug):
+    """The visible category with this slug, or None"""
+    return visible_categories().filter(slug=slug).first()
+
+
+def cart_items(user):
+    """A user's cart lines with their products and categories joined in"""
+    return AddCart.objects.filter(user=user).select_related('product', 'product__category')
+
+
+def order_items(order):
+    """Line items of an order with their products joined in"""
+    return OrderItem.objects.filter(order=order).select_related('product')
+
+
+def orders_with_items(user):
+    """A user's orders with order.items prefetched in a single extra query"""
+    return Order.objects.filter(user=user).prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
+
+
+class LRUCache:
+    """A small thread-safe least-recently-used mapping"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# (category slug, product slug) -> product id, cleared by signals on catalog writes
+product_ids_by_slug = LRUCache(getattr(settings, 'PRODUCT_SLUG_CACHE_SIZE', 4096))
+
+
+def _is_visible(product, cslug, pslug):
+    return (
+        product.slug == pslug and product.category.slug == cslug
+        and not product.status and not product.category.status
+    )
+
+
+def product_by_slugs(cslug, pslug):
+    """
+    The visible product at collections/<cslug>/<pslug>/, or None.
+
+    A cached slug pair costs one primary-key query; otherwise a single joined
+    query on the (category slug, product slug) indexes resolves it. Cached
+    ids are re-checked against the row, so an entry left stale by another
+    process is dropped rather than served.
+    """
+    key = (cslug, pslug)
+    products = Product.objects.select_related('category')
+    pk = product_ids_by_slug.get(key)
+    if pk is not None:
+        product = products.filter(pk=pk).first()
+        if product and _is_visible(product, cslug, pslug):
+            return product
+        product_ids_by_slug.pop(key)
+
+    product = products.filter(
+        slug=pslug, category__slug=cslug, status=0, category__status=0
+    ).first()
+    if product:
+        product_ids_by_slug.set(key, product.pk)
+    return product
@@ -0,0 +1,22 @@
+from django.conf import settings
+
+from . import carts
+
+
+def catalog(request):
+    """Fragment cache timeout for {% cache %}; card keys are the item's id and updated_at"""
+    return {
+        'fragment_ttl': settings.FRAGMENT_CACHE_TIMEOUT,
+    }
+
+
+def cart(request):
+    """The navbar cart badge; served from the cache or session, not counted per page"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        summary = carts.summary(user)
+    elif hasattr(request, 'session'):
+        summary = carts.guest_summary(request.session)
+    else:
+        summary = carts.EMPTY_SUMMARY
+    return {'cart_summary': summary}
@@ -0,0 +1,63 @@
+"""
+SQLite tuning: per-connection pragmas and retrying writes that meet a lock.
+
+configure() runs on every new SQLite connection (see signals.py) and
+applies settings.SQLITE_PRAGMAS: WAL lets readers carry on while a
+checkout writes, synchronous=NORMAL is durable across crashes of the
+process in WAL mode, busy_timeout makes a writer wait for the lock rather
+than fail, and mmap/cache size keep hot pages out of read() calls. Write
+transactions BEGIN IMMEDIATE (OPTIONS['transaction_mode']), so two writers
+queue on busy_timeout instead of deadlocking when both try to upgrade a
+read lock.
+
+retry_locked() retries a whole write transaction, with jittered
+exponential backoff, if the lock still could not be had in time.
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+LOCKED_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+
+def configure(connection):
+    """Apply settings.SQLITE_PRAGMAS to a new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+def is_locked(error):
+    return isinstance(error, OperationalError) and any(m in str(error) for m in LOCKED_MESSAGES)
+
+
+def retry_locked(fn):
+    """
+    Run fn again, after a growing random pause, while it fails on a locked
+    database; up to settings.DATABASE_WRITE_RETRIES more times. fn must be
+    its own transaction: inside an outer atomic block it runs once and the
+    outermost retry_locked, if any, retries the whole thing.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if connection.in_atomic_block:
+            return fn(*args, **kwargs)
+        retries = settings.DATABASE_WRITE_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == retries or not is_locked(e):
+                    raise
+                delay = settings.DATABASE_WRITE_RETRY_DELAY * 2 ** attempt
+                logger.info("%s: %s, retrying in %.0fms", fn.__qualname__, e, delay * 1000)
+                time.sleep(random.uniform(delay / 2, delay))
+    return wrapper
@@ -0,0 +1,209 @@
+"""
+Faceted filtering and sorting for collection pages.
+
+Facet counts are not computed per request. ProductFacet keeps one row per
+(category, facet, value) with the number of products under it, and signals
+move a product between rows as it is saved or deleted. Stock changes made
+with queryset.update() go through stock_moved(); anything else that
+bypasses save() should be followed by rebuild().
+
+Counts are per category and do not narrow as filters are applied.
+"""
+from collections import Counter
+
+from django.db import transaction, IntegrityError
+from django.db.models import F, Value
+from django.http import QueryDict
+
+from .models import Product, ProductFacet
+
+# Lower bounds of the buckets; each bucket runs up to the next bound
+PRICE_BOUNDS = (0, 500, 1000, 2500, 5000, 10000)
+DISCOUNT_BOUNDS = (0, 10, 25, 50)
+
+# Product columns the facet values are derived from
+FACET_FIELDS = ('category_id', 'vendor', 'selling', 'discount', 'quantity', 'trending')
+
+SORTS = {
+    'newest': ('-created_at', '-id'),
+    'price_asc': ('selling', 'id'),
+    'price_desc': ('-selling', '-id'),
+    'discount': ('-discount', '-id'),
+}
+DEFAULT_SORT = 'newest'
+
+
+def bucket(bounds, value):
+    """The lower bound of the bucket value falls in"""
+    floor = bounds[0]
+    for bound in bounds:
+        if value >= bound:
+            floor = bound
+    return str(floor)
+
+
+def facet_keys(row):
+    """(category_id, facet, value) keys a product is counted under, from its FACET_FIELDS"""
+    category_id = row['category_id']
+    return [
+        (category_id, 'vendor', row['vendor']),
+        (category_id, 'price', bucket(PRICE_BOUNDS, row['selling'])),
+        (category_id, 'discount', bucket(DISCOUNT_BOUNDS, row['discount'])),
+        (category_id, 'stock', 'in' if row['quantity'] > 0 else 'out'),
+        (category_id, 'trending', 'yes' if row['trending'] else 'no'),
+    ]
+
+
+def product_keys(product):
+    return facet_keys({field: getattr(product, field) for field in FACET_FIELDS})
+
+
+def apply(changes):
+    """Add {(category_id, facet, value): delta} to the stored counts"""
+    for (category_id, facet, value), delta in changes.items():
+        if not delta:
+            continue
+        rows = ProductFacet.objects.filter(category_id=category_id, facet=facet, value=value)
+        if rows.update(count=F('count') + delta) or delta < 0:
+            continue
+        try:
+            with transaction.atomic():
+                ProductFacet.objects.create(category_id=category_id, facet=facet, value=value, count=delta)
+        except IntegrityError:
+            # Another writer created the row first
+            rows.update(count=F('count') + delta)
+
+
+def move(before, after):
+    """Shift counts from the facet keys in before to those in after"""
+    changes = Counter(after)
+    changes.subtract(Counter(before))
+    apply(changes)
+
+
+def stock_moved(category_ids, in_stock):
+    """Record products (one category id each) going in or out of stock"""
+    old, new = ('out', 'in') if in_stock else ('in', 'out')
+    move(
+        [(category_id, 'stock', old) for category_id in category_ids],
+        [(category_id, 'stock', new) for category_id in category_ids],
+    )
+
+
+def rebuild():
+    """Recount every facet from the product table"""
+    counts = Counter()
+    for row in Product.objects.values(*FACET_FIELDS).iterator(chunk_size=5000):
+        counts.update(facet_keys(row))
+    with transaction.atomic():
+        ProductFacet.objects.all().delete()
+        ProductFacet.objects.bulk_create(
+            [
+                ProductFacet(category_id=category_id, facet=facet, value=value, count=count)
+                for (category_id, facet, value), count in counts.items()
+            ],
+            batch_size=1000,
+        )
+
+
+def counts(category):
+    """{facet: {value: count}} for a category, read from the precomputed rows"""
+    result = {'vendor': {}, 'price': {}, 'discount': {}, 'stock': {}, 'trending': {}}
+    if category is None:
+        return result
+    rows = ProductFacet.objects.filter(category=category, count__gt=0).values_list('facet', 'value', 'count')
+    for facet, value, count in rows:
+        result.setdefault(facet, {})[value] = count
+    result['vendor'] = dict(sorted(result['vendor'].items(), key=lambda item: item[0].lower()))
+    for facet in ('price', 'discount'):
+        result[facet] = dict(sorted(result[facet].items(), key=lambda item: float(item[0])))
+    return result
+
+
+def options(counted):
+    """
+    Shape counts() for the filter sidebar: price buckets as (min, max) ranges
+    and discounts as "at least" thresholds, which sum the buckets above them.
+    """
+    prices = []
+    for i, bound in enumerate(PRICE_BOUNDS):
+        count = counted['price'].get(str(bound))
+        if count:
+            upper = PRICE_BOUNDS[i + 1] if i + 1 < len(PRICE_BOUNDS) else None
+            prices.append({'min': bound, 'max': upper, 'count': count})
+    discounts = []
+    for bound in DISCOUNT_BOUNDS[1:]:
+        count = sum(n for value, n in counted['discount'].items() if float(value) >= bound)
+        if count:
+            discounts.append({'min': bound, 'count': count})
+    return {
+        'vendor': counted['vendor'],
+        'price': prices,
+        'discount': discounts,
+        'in_stock': counted['stock'].get('in', 0),
+        'trending': counted['trending'].get('yes', 0),
+    }
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number == number and abs(number) != float('inf') else None
+
+
+def parse(params):
+    """Clean filter and sort choices out of request.GET, dropping anything invalid"""
+    # ?price=500-1000 is what the sidebar's bucket choices submit
+    low, _, high = params.get('price', '').partition('-')
+    return {
+        'min_price': _number(params.get('min_price', low)),
+        'max_price': _number(params.get('max_price', high)),
+        'vendor': [vendor for vendor in params.getlist('vendor') if vendor],
+        'in_stock': params.get('in_stock') == '1',
+        'trending': params.get('trending') == '1',
+        'discount': _number(params.get('discount')),
+        'sort': params.get('sort') if params.get('sort') in SORTS else DEFAULT_SORT,
+    }
+
+
+def apply_filters(queryset, selected):
+    """Narrow a product queryset to the selected filters; returns (queryset, ordering)"""
+    if selected['min_price'] is not None:
+        queryset = queryset.filter(selling__gte=selected['min_price'])
+    if selected['max_price'] is not None:
+        queryset = queryset.filter(selling__lt=selected['max_price'])
+    if selected['vendor']:
+        queryset = queryset.filter(vendor__in=selected['vendor'])
+    if selected['in_stock']:
+        queryset = queryset.filter(quantity__gt=0)
+    if selected['trending']:
+        queryset = queryset.filter(trending=True)
+    if selected['discount'] and selected['sort'] == 'discount':
+        queryset = queryset.filter(discount__gte=selected['discount'])
+    elif selected['discount']:
+        # "At least n% off" matches much of a category. Written as discount + 0
+        # it cannot use the discount index, which keeps SQLite on the index
+        # that already yields the requested order instead of sorting a range.
+        queryset = queryset.alias(discount_floor=F('discount') + Value(0.0)).filter(
+            discount_floor__gte=selected['discount']
+        )
+    return queryset, SORTS[selected['sort']]
+
+
+def querystring(selected):
+    """The selected filters as a query string, for links to further pages"""
+    query = QueryDict(mutable=True)
+    for key in ('min_price', 'max_price', 'discount'):
+        if selected[key] is not None:
+            value = selected[key]
+            query[key] = '%d' % value if value.is_integer() else repr(value)
+    if selected['vendor']:
+        query.setlist('vendor', selected['vendor'])
+    for key in ('in_stock', 'trending'):
+        if selected[key]:
+            query[key] = '1'
+    if selected['sort'] != DEFAULT_SORT:
+        query['sort'] = selected['sort']
+    return query.urlencode()
@@ -0,0 +1,65 @@
+"""
+Password hashing cost control.
+
+TieredPBKDF2PasswordHasher sets the iteration count from
+settings.PASSWORD_HASH_TIER. verify() runs password checks in a small pool
+of threads at a lower scheduling priority (on Linux, niceness is per
+thread), so a burst of logins queues behind PASSWORD_HASH_WORKERS checks and
+yields the CPU to request threads instead of stalling them. With 0 workers
+checks run inline, as Django's own check_password does.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, get_hasher, identify_hasher
+
+
+class TieredPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 at the iteration count of settings.PASSWORD_HASH_TIER.
+
+    Hashes keep the pbkdf2_sha256 format, so existing passwords verify
+    unchanged; a successful login rehashes one made at another tier.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_TIERS[settings.PASSWORD_HASH_TIER]
+
+
+def _lower_priority():
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), settings.PASSWORD_HASH_NICENESS)
+    except (AttributeError, OSError):
+        # Not Linux, or not allowed; the pool still bounds concurrent hashes
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash',
+                initializer=_lower_priority,
+            )
+        return _pool
+
+
+def verify(password, encoded):
+    """check_password in the hashing pool, or inline with no workers; the caller waits without holding the GIL"""
+    if settings.PASSWORD_HASH_WORKERS == 0:
+        return check_password(password, encoded)
+    return pool().submit(check_password, password, encoded).result()
+
+
+def needs_rehash(encoded):
+    """Whether a verified hash should be remade with the preferred hasher and tier"""
+    preferred = get_hasher('default')
+    return identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded)
@@ -0,0 +1,162 @@
+import http.client
+import importlib.util
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from sample_django import benchmarks
+from sample_django.models import Product, AddCart, Favourite
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _server(kind, port, options):
+    if kind == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', 'django_poc.wsgi:application',
+            '--bind', '127.0.0.1:%d' % port,
+            '--workers', str(options['workers']), '--threads', str(options['threads']),
+            '--log-level', 'warning',
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'django_poc.asgi:application',
+        '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(options['workers']),
+        '--log-level', 'warning', '--no-access-log',
+    ]
+
+
+def _wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/products/feed/?size=1', headers={'Host': 'localhost'})
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError("Server on port %d did not come up" % port)
+
+
+def _prepare(options):
+    """Seed shoppers and build the request plan the load test replays"""
+    products = list(Product.objects.values_list('id', flat=True))
+    plans = []
+    for n in range(options['users']):
+        user = User.objects.create_user('shopper%d' % n)
+        client = Client()
+        client.force_login(user)
+        token = get_random_string(32)
+        headers = {
+            'Host': 'localhost',
+            'Cookie': 'sessionid=%s; csrftoken=%s' % (client.cookies['sessionid'].value, token),
+            'X-CSRFToken': token,
+            'X-Requested-With': 'XMLHttpRequest',
+            'Content-Type': 'application/json',
+        }
+        # Rows for the remove endpoints to take away again
+        mine = products[n::options['users']]
+        carted = AddCart.objects.bulk_create([AddCart(user=user, product_id=pid, quantity=1) for pid in mine[:50]])
+        faved = Favourite.objects.bulk_create([Favourite(user=user, product_id=pid) for pid in mine[:50]])
+        plan = []
+        for i, pid in enumerate(mine[50:]):
+            body = json.dumps({'pid': pid, 'product_qty': 1})
+            plan.append(('POST', '/addtocart/', body, headers))
+            plan.append(('POST', '/fav_page', body, headers))
+            if i < len(carted):
+                plan.append(('GET', '/remove-from-cart/%d/' % carted[i].id, None, headers))
+                plan.append(('GET', '/remove-from-favourites/%d/' % faved[i].id, None, headers))
+        plans.append(plan)
+    # Interleave shoppers so concurrent connections do not all queue on one of them
+    return [step for steps in itertools.zip_longest(*plans) for step in steps if step]
+
+
+def _replay(port, plan, concurrency):
+    """Send plan over concurrency keep-alive connections; returns (latencies in ms, statuses, seconds)"""
+    steps = iter(plan)
+    lock = threading.Lock()
+    latencies, statuses = [], Counter()
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        while True:
+            with lock:
+                step = next(steps, None)
+            if step is None:
+                break
+            method, path, body, headers = step
+            start = time.perf_counter()
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Load-test the cart and favourites endpoints under WSGI (gunicorn) and ASGI (uvicorn)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per WSGI worker")
+
+    def handle(self, *args, **options):
+        missing = [name for name in ('gunicorn', 'uvicorn') if importlib.util.find_spec(name) is None]
+        if missing:
+            raise CommandError("bench_asgi needs %s: pip install %s" % (', '.join(missing), ' '.join(missing)))
+
+        results = []
+        for kind in ('wsgi', 'asgi'):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / 'bench.sqlite3'
+                with benchmarks.scratch_database(path=path):
+                    benchmarks.seed_catalog(options['products'])
+                    plan = _prepare(options)
+                    port = _free_port()
+                    env = dict(os.environ, SQLITE_PATH=str(path), DJANGO_SETTINGS_MODULE='django_poc.settings')
+                    server = subprocess.Popen(_server(kind, port, options), cwd=settings.BASE_DIR, env=env)
+                    try:
+                        _wait_until_up(port)
+                        results.append((kind, _replay(port, plan, options['concurrency'])))
+                    finally:
+                        server.terminate()
+                        server.wait(timeout=30)
+
+        for kind, (latencies, statuses, seconds) in results:
+            errors = sum(n for status, n in statuses.items() if status >= 400)
+            self.stdout.write("%s: %5.0f req/s  %s  errors %d of %d" % (
+                kind, len(latencies) / seconds, benchmarks.summary(latencies), errors, len(latencies)
+            ))
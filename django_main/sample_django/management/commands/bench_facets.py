@@ -0,0 +1,55 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from sample_django import benchmarks, facets
+
+QUERIES = [
+    '',
+    '?sort=price_asc',
+    '?sort=price_desc&in_stock=1',
+    '?sort=discount',
+    '?price=500-1000&sort=price_asc',
+    '?vendor=Vendor+7&vendor=Vendor+8',
+    '?vendor=Vendor+7&in_stock=1&sort=price_desc',
+    '?trending=1&discount=10',
+    '?discount=25&sort=discount',
+]
+
+
+class Command(BaseCommand):
+    help = "Measure filtered and sorted collection page latency on one large category"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--p99-ms', type=float, default=50.0)
+
+    def handle(self, *args, **options):
+        with benchmarks.scratch_database():
+            benchmarks.seed_catalog(options['products'], categories=1)
+            recount = benchmarks.measure(facets.rebuild, 1)
+            client = benchmarks.client()
+            results = []
+            for path in ('/collections/category-0/', '/products/feed/'):
+                for query in QUERIES:
+                    if path == '/products/feed/':
+                        query = (query + '&' if query else '?') + 'category=category-0'
+
+                    def get():
+                        response = client.get(path + query)
+                        assert response.status_code == 200, response.status_code
+
+                    get()
+                    # The page cache would otherwise answer every repeat
+                    results.append((path + query, benchmarks.measure(get, options['repeat'], before=cache.clear)))
+
+        self.stdout.write("facet recount (%d products): %.0fms" % (options['products'], recount[0]))
+        slow = []
+        for url, samples in results:
+            self.stdout.write("%-70s %s" % (url, benchmarks.summary(samples)))
+            if benchmarks.percentile(samples, 99) > options['p99_ms']:
+                slow.append(url)
+        for url in slow:
+            self.stdout.write(self.style.ERROR("%s misses the %.0fms p99 target" % (url, options['p99_ms'])))
+        if not slow:
+            self.stdout.write(self.style.SUCCESS("All latency targets met"))
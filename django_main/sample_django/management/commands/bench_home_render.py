@@ -0,0 +1,28 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from sample_django import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Compare home page render time with the fragment cache cold and warm"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with benchmarks.scratch_database():
+            benchmarks.seed_catalog(options['products'])
+            client = benchmarks.client()
+
+            def get():
+                response = client.get('/')
+                assert response.status_code == 200, response.status_code
+
+            cold = benchmarks.measure(get, options['repeat'], before=cache.clear)
+            get()
+            warm = benchmarks.measure(get, options['repeat'])
+
+        self.stdout.write("cold: %s" % benchmarks.summary(cold))
+        self.stdout.write("warm: %s" % benchmarks.summary(warm))
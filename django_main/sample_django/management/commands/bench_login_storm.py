@@ -0,0 +1,123 @@
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from sample_django import benchmarks, ratelimit
+
+CATALOG_PATHS = ('/products/feed/?size=20', '/collections/category-0/', '/collections/category-1/?sort=price_asc')
+
+
+def _attack(stop, statuses, lock, identifiers, ips, seed, interval):
+    """
+    Post guessed passwords for known identifiers from a pool of IPs, one every
+    interval seconds (or back to back once behind), until stop is set.
+    """
+    rng = random.Random(seed)
+    client = benchmarks.client()
+    due = time.monotonic()
+    try:
+        while not stop.is_set():
+            due += interval
+            stop.wait(max(0, due - time.monotonic()))
+            response = client.post(
+                '/login/', {'username': rng.choice(identifiers), 'password': 'guess-%d' % rng.random()},
+                REMOTE_ADDR=rng.choice(ips),
+            )
+            with lock:
+                statuses[response.status_code] += 1
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Measure catalog latency while login attempts hammer the password hasher, with and without rate limits"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--ips', type=int, default=500, help="Distinct addresses the attack comes from")
+        parser.add_argument('--attackers', type=int, default=8, help="Concurrent login attempts")
+        parser.add_argument('--rate', type=float, default=40, help="Login attempts per second the attack sends")
+        parser.add_argument('--seconds', type=float, default=10, help="Length of each phase")
+        parser.add_argument('--catalog-rate', type=float, default=100, help="Catalog requests per second")
+        parser.add_argument('--max-ratio', type=float, default=2.0,
+                            help="Allowed p99 under a protected attack, relative to no attack")
+
+    def phase(self, attackers, identifiers, ips, options):
+        client = benchmarks.client()
+        for path in CATALOG_PATHS:
+            client.get(path)
+        stop, lock, statuses = threading.Event(), threading.Lock(), Counter()
+        threads = [
+            threading.Thread(
+                target=_attack, args=(stop, statuses, lock, identifiers, ips, n, attackers / options['rate'])
+            )
+            for n in range(attackers)
+        ]
+        for thread in threads:
+            thread.start()
+        paths = itertools.cycle(CATALOG_PATHS)
+        samples = []
+        # Shoppers arrive at a steady rate, leaving the CPU idle in between as a real server would be
+        due = time.monotonic()
+        deadline = due + options['seconds']
+        try:
+            while due < deadline:
+                time.sleep(max(0, due - time.monotonic()))
+                samples += benchmarks.measure(lambda: client.get(next(paths)), 1)
+                due += 1 / options['catalog_rate']
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        return samples, statuses
+
+    def handle(self, *args, **options):
+        # Every throttled attempt would log a 429 warning
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with benchmarks.scratch_database():
+            benchmarks.seed_catalog(options['products'])
+            # One hash for everyone; seeding should not take minutes of PBKDF2
+            password = make_password('not-the-guess')
+            users = User.objects.bulk_create(
+                [User(username='member%d' % n, password=password) for n in range(options['users'])]
+            )
+            identifiers = [user.username for user in users]
+            ips = ['10.%d.%d.%d' % (n >> 16 & 255, n >> 8 & 255, n & 255) for n in range(options['ips'])]
+
+            attackers = options['attackers']
+            results = [("no attack", self.phase(0, identifiers, ips, options))]
+            # As Django does it out of the box: every attempt hashed, inline
+            with override_settings(LOGIN_RATE_LIMITS={}, PASSWORD_HASH_WORKERS=0):
+                results.append(("attack, unprotected", self.phase(attackers, identifiers, ips, options)))
+            ratelimit.local.clear()
+            results.append(("attack, protected", self.phase(attackers, identifiers, ips, options)))
+
+        self.stdout.write("hash tier %s, %d hashing thread(s), limits %s" % (
+            settings.PASSWORD_HASH_TIER, settings.PASSWORD_HASH_WORKERS, settings.LOGIN_RATE_LIMITS
+        ))
+        for name, (samples, statuses) in results:
+            attempts = sum(statuses.values())
+            self.stdout.write("%-22s %s  login attempts %d, throttled %d" % (
+                name, benchmarks.summary(samples), attempts, statuses[429]
+            ))
+        baseline = benchmarks.percentile(results[0][1][0], 99)
+        limited = benchmarks.percentile(results[-1][1][0], 99)
+        if limited > baseline * options['max_ratio']:
+            self.stdout.write(self.style.ERROR(
+                "Catalog p99 under a protected attack is %.1fx the baseline" % (limited / baseline)
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                "Catalog p99 under a protected attack stays within %.1fx the baseline" % options['max_ratio']
+            ))
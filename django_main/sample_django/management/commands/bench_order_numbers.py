@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from sample_django.order_numbers import get_allocator
+
+
+def _generate(count):
+    allocate = get_allocator()
+    return [allocate() for _ in range(count)]
+
+
+class Command(BaseCommand):
+    help = "Measure order number throughput and check for collisions across processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2_000_000, help="Numbers to generate in this process")
+        parser.add_argument('--workers', type=int, default=4, help="Processes for the collision check")
+        parser.add_argument('--per-worker', type=int, default=250_000)
+
+    def handle(self, *args, **options):
+        allocate = get_allocator()
+        count = options['count']
+
+        start = time.perf_counter()
+        previous = allocate()
+        for _ in range(count):
+            current = allocate()
+            if current <= previous:
+                raise AssertionError("Order numbers went backwards: %s after %s" % (current, previous))
+            previous = current
+        elapsed = time.perf_counter() - start
+        self.stdout.write("%d numbers in %.2fs (%.0f/s, %.2f us each)" % (
+            count, elapsed, count / elapsed, elapsed / count * 1e6
+        ))
+
+        workers, per_worker = options['workers'], options['per_worker']
+        start = time.perf_counter()
+        with ProcessPoolExecutor(workers) as pool:
+            batches = list(pool.map(_generate, [per_worker] * workers))
+        elapsed = time.perf_counter() - start
+        total = sum(len(batch) for batch in batches)
+        unique = len(set().union(*batches))
+        self.stdout.write("%d numbers from %d processes in %.2fs, %d collision(s)" % (
+            total, workers, elapsed, total - unique
+        ))
+        if unique != total:
+            raise AssertionError("Order number collision detected")
+        self.stdout.write(self.style.SUCCESS("No collisions"))
@@ -0,0 +1,86 @@
+import random
+import statistics
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import F, Sum, FloatField
+from django.db.models.functions import Cast
+
+from sample_django import benchmarks, pricing
+from sample_django.models import Product, Order, OrderItem
+
+
+def _seed_order(items):
+    """One order with items lines at cent prices; returns it"""
+    user = User.objects.create_user('bench')
+    order = Order.objects.create(user=user, order_number='BENCH', total_amount=0)
+    products = list(Product.objects.values_list('id', flat=True))
+    rng = random.Random(0)
+    OrderItem.objects.bulk_create(
+        [
+            OrderItem(order=order, product_id=products[i % len(products)], quantity=rng.randint(1, 9),
+                      price=Decimal(rng.randint(100, 999_999)).scaleb(-2))
+            for i in range(items)
+        ],
+        batch_size=5000,
+    )
+    return order
+
+
+class Command(BaseCommand):
+    help = "Compare Decimal pricing with the float arithmetic it replaced, in memory and over the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=50_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--max-ratio', type=float, default=1.25,
+                            help="Slowest acceptable Decimal/float median time for the database paths")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        float_lines = [(rng.randint(1, 9), rng.randint(100, 999_999) / 100) for _ in range(options['lines'])]
+        decimal_lines = [(quantity, Decimal(repr(price))) for quantity, price in float_lines]
+        repeat = options['repeat']
+
+        results = [(
+            "cart total, %d lines in memory" % options['lines'],
+            benchmarks.measure(lambda: sum(price * quantity for quantity, price in float_lines), repeat),
+            benchmarks.measure(lambda: pricing.total(decimal_lines), repeat),
+            False,
+        )]
+        with benchmarks.scratch_database():
+            benchmarks.seed_catalog(1000, categories=1)
+            items = _seed_order(options['lines']).items.all()
+            results.append((
+                "order export, %d items summed in Python" % options['lines'],
+                benchmarks.measure(lambda: sum(
+                    price * quantity
+                    for quantity, price in items.annotate(p=Cast('price', FloatField())).values_list('quantity', 'p')
+                ), repeat),
+                benchmarks.measure(
+                    lambda: pricing.minor_total(items.values_list('quantity', pricing.minor_units('price'))), repeat
+                ),
+                True,
+            ))
+            results.append((
+                "order total, %d items aggregated in SQL" % options['lines'],
+                benchmarks.measure(lambda: items.aggregate(
+                    total=Sum(F('quantity') * F('price'), output_field=FloatField())
+                ), repeat),
+                benchmarks.measure(lambda: items.aggregate(total=pricing.minor_units_sum('quantity', 'price')), repeat),
+                True,
+            ))
+
+        slow = []
+        for name, floats, decimals, gated in results:
+            ratio = statistics.median(decimals) / statistics.median(floats)
+            self.stdout.write(name)
+            self.stdout.write("  float    %s" % benchmarks.summary(floats))
+            self.stdout.write("  decimal  %s  (%.2fx)" % (benchmarks.summary(decimals), ratio))
+            if gated and ratio > options['max_ratio']:
+                slow.append(name)
+        for name in slow:
+            self.stdout.write(self.style.ERROR("%s is more than %.2fx the float path" % (name, options['max_ratio'])))
+        if not slow:
+            self.stdout.write(self.style.SUCCESS("No regression against the float path"))
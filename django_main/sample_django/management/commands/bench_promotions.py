@@ -0,0 +1,81 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from sample_django import benchmarks, promotions
+from sample_django.models import Product, Promotion
+
+
+def _seed_rules(count, products, categories, rng):
+    """A mix of tiered product and category rules, cart thresholds and coupons"""
+    rules = []
+    for i in range(count):
+        kind = rng.choice([Promotion.PERCENT, Promotion.AMOUNT])
+        value = rng.randint(1, 40) if kind == Promotion.PERCENT else rng.randint(5, 200)
+        roll = rng.random()
+        if roll < 0.6:
+            scope = dict(scope=Promotion.PRODUCT, product_id=rng.choice(products), min_quantity=rng.randint(1, 5))
+        elif roll < 0.85:
+            scope = dict(scope=Promotion.CATEGORY, category_id=rng.choice(categories), min_quantity=rng.randint(1, 10))
+        else:
+            scope = dict(scope=Promotion.CART, min_total=rng.randint(0, 50_000))
+        code = 'CODE%d' % (i % 20) if i % 20 == 0 else ''
+        rules.append(Promotion(name='Rule %d' % i, code=code, kind=kind, value=value, **scope))
+    Promotion.objects.bulk_create(rules, batch_size=1000)
+
+
+class Command(BaseCommand):
+    help = "Measure compiling thousands of active promotions and pricing large carts against them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20_000)
+        parser.add_argument('--rules', type=int, default=5000)
+        parser.add_argument('--lines', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--p99-ms', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with benchmarks.scratch_database():
+            benchmarks.seed_catalog(options['products'], categories=50)
+            rows = list(Product.objects.values_list('id', 'category_id', 'selling'))
+            _seed_rules(
+                options['rules'], [row[0] for row in rows], sorted({row[1] for row in rows}), rng
+            )
+
+            def recompile():
+                promotions.expire_plan()
+                promotions.plan()
+
+            compile_samples = benchmarks.measure(recompile, 5)
+            carted = rng.sample(rows, options['lines'])
+            cart = [(i, pid, cid, rng.randint(1, 10), price) for i, (pid, cid, price) in enumerate(carted)]
+            order = [(pid, quantity, price) for _, pid, _, quantity, price in cart]
+            categories = {pid: cid for _, pid, cid, _, _ in cart}
+
+            with CaptureQueriesContext(connection) as queries:
+                promotions.quote(cart, 'CODE0')
+            results = [
+                ("cart quote, %d lines" % options['lines'],
+                 benchmarks.measure(lambda: promotions.quote(cart), options['repeat'])),
+                ("cart quote with a coupon",
+                 benchmarks.measure(lambda: promotions.quote(cart, 'CODE0'), options['repeat'])),
+                ("order quote, as checkout places it",
+                 benchmarks.measure(lambda: promotions.quote_products(order, 'CODE0', categories), options['repeat'])),
+            ]
+
+        self.stdout.write("compile %d rules: %s" % (options['rules'], benchmarks.summary(compile_samples)))
+        self.stdout.write("queries per cart quote once compiled: %d" % len(queries))
+        slow = []
+        for name, samples in results:
+            self.stdout.write("%-40s %s" % (name, benchmarks.summary(samples)))
+            if benchmarks.percentile(samples, 99) > options['p99_ms']:
+                slow.append(name)
+        for name in slow:
+            self.stdout.write(self.style.ERROR("%s misses the %.0fms p99 target" % (name, options['p99_ms'])))
+        if queries.captured_queries:
+            self.stdout.write(self.style.ERROR("Pricing a cart should not query the database"))
+        elif not slow:
+            self.stdout.write(self.style.SUCCESS("All latency targets met"))
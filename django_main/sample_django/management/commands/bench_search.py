@@ -0,0 +1,48 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from sample_django import benchmarks, search
+
+
+class Command(BaseCommand):
+    help = "Measure product search and autocomplete latency on a large synthetic catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=300)
+        parser.add_argument('--search-p99-ms', type=float, default=50.0)
+        parser.add_argument('--suggest-p99-ms', type=float, default=20.0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        phrases = [
+            "%s %s" % (rng.choice(benchmarks.ADJECTIVES), rng.choice(benchmarks.NOUNS))
+            for _ in range(options['queries'])
+        ]
+        prefixes = [phrase[:rng.randint(2, len(phrase))] for phrase in phrases]
+
+        with benchmarks.scratch_database():
+            benchmarks.seed_catalog(options['products'])
+            rebuild = benchmarks.measure(search.rebuild, 1)
+
+            it = iter(phrases)
+            searched = benchmarks.measure(lambda: search.search(next(it)), len(phrases))
+            it = iter(prefixes)
+            suggested = benchmarks.measure(lambda: search.suggest(next(it)), len(prefixes))
+
+        self.stdout.write("index build (%d products): %.0fms" % (options['products'], rebuild[0]))
+        self.stdout.write("search:  %s" % benchmarks.summary(searched))
+        self.stdout.write("suggest: %s" % benchmarks.summary(suggested))
+
+        ok = True
+        for label, samples, target in (
+            ('search', searched, options['search_p99_ms']),
+            ('suggest', suggested, options['suggest_p99_ms']),
+        ):
+            p99 = benchmarks.percentile(samples, 99)
+            if p99 > target:
+                ok = False
+                self.stdout.write(self.style.ERROR("%s p99 %.2fms misses the %.0fms target" % (label, p99, target)))
+        if ok:
+            self.stdout.write(self.style.SUCCESS("All latency targets met"))
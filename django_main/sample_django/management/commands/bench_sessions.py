@@ -0,0 +1,58 @@
+import itertools
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from sample_django import benchmarks
+
+ENGINES = (
+    ('db', 'django.contrib.sessions.backends.db'),
+    ('cached, lazy writeback', 'sample_django.sessions'),
+)
+CATALOG_PATHS = ('/', '/collections/', '/collections/category-0/', '/products/feed/?size=20')
+
+
+class Command(BaseCommand):
+    help = "Compare catalog requests per second for signed-in shoppers under the DB and cached session engines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def run(self, engine, user, requests, cache_dir):
+        # Lazy writeback needs a cache every worker shares; a file cache stands in for Redis or memcached
+        shared = dict(settings.CACHES, sessions={
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir,
+        })
+        with override_settings(SESSION_ENGINE=engine, CACHES=shared, SESSION_WRITEBACK_SECONDS=60):
+            caches['sessions'].clear()
+            client = benchmarks.client()
+            client.force_login(user)
+            paths = itertools.cycle(CATALOG_PATHS)
+            for path in CATALOG_PATHS:
+                client.get(path)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                samples = benchmarks.measure(lambda: client.get(next(paths)), requests)
+                seconds = time.perf_counter() - start
+        session_queries = sum(1 for q in queries.captured_queries if 'django_session' in q['sql'])
+        return samples, requests / seconds, session_queries / requests
+
+    def handle(self, *args, **options):
+        with benchmarks.scratch_database(), tempfile.TemporaryDirectory() as cache_dir:
+            benchmarks.seed_catalog(options['products'])
+            user = User.objects.create_user('shopper')
+            results = [(name, self.run(engine, user, options['requests'], cache_dir)) for name, engine in ENGINES]
+
+        for name, (samples, rate, per_request) in results:
+            self.stdout.write("%-24s %6.0f req/s  %s  session queries/request %.2f" % (
+                name, rate, benchmarks.summary(samples), per_request
+            ))
+        self.stdout.write(self.style.SUCCESS("%.2fx the requests per second" % (results[1][1][1] / results[0][1][1])))
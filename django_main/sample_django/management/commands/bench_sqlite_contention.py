@@ -0,0 +1,91 @@
+import multiprocessing
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.test import override_settings
+
+from sample_django import benchmarks, orders
+from sample_django.models import Product
+
+# Django's SQLite defaults: rollback journal, deferred transactions, no pragmas, no retries
+BARE = dict(options={}, conn_max_age=0, settings={'SQLITE_PRAGMAS': {}, 'DATABASE_WRITE_RETRIES': 0})
+
+
+@contextmanager
+def _profile(profile):
+    """Run with a profile's connection settings, here and in processes forked meanwhile"""
+    if profile is None:
+        yield
+        return
+    settings_dict = connection.settings_dict
+    saved = settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE']
+    connections.close_all()
+    settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE'] = profile['options'], profile['conn_max_age']
+    try:
+        with override_settings(**profile['settings']):
+            yield
+    finally:
+        connections.close_all()
+        settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE'] = saved
+
+
+def _buyer(args):
+    """Place checkouts one after another as one user; returns (latencies in ms, locked errors)"""
+    user_id, products, checkouts, seed = args
+    rng = random.Random(seed)
+    user = User.objects.get(pk=user_id)
+    latencies, locked = [], 0
+    for _ in range(checkouts):
+        product_id, price = rng.choice(products)
+        start = time.perf_counter()
+        try:
+            orders.place_order(user, [(product_id, 1, price)], shipping_address='1, Main St')
+            latencies.append((time.perf_counter() - start) * 1000)
+        except OperationalError:
+            locked += 1
+        # The end of a request: closes the connection unless it is persistent
+        close_old_connections()
+    connections.close_all()
+    return latencies, locked
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent checkouts from several processes under bare and tuned SQLite settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--checkouts', type=int, default=100, help="Checkouts per process")
+        parser.add_argument('--products', type=int, default=500)
+
+    def run(self, profile, options):
+        with tempfile.TemporaryDirectory() as tmp, _profile(profile):
+            with benchmarks.scratch_database(path=Path(tmp) / 'contention.sqlite3'):
+                benchmarks.seed_catalog(options['products'])
+                Product.objects.update(quantity=10 ** 9)
+                products = list(Product.objects.values_list('id', 'selling'))
+                users = [User.objects.create_user('buyer%d' % n).pk for n in range(options['processes'])]
+                journal = connection.cursor().execute('PRAGMA journal_mode').fetchone()[0]
+                # Children must open their own connections, not share this one
+                connections.close_all()
+                work = [(user_id, products, options['checkouts'], n) for n, user_id in enumerate(users)]
+                start = time.perf_counter()
+                with multiprocessing.get_context('fork').Pool(options['processes']) as pool:
+                    results = pool.map(_buyer, work)
+                seconds = time.perf_counter() - start
+        latencies = [ms for samples, _ in results for ms in samples]
+        return journal, latencies, sum(locked for _, locked in results), seconds
+
+    def handle(self, *args, **options):
+        total = options['processes'] * options['checkouts']
+        for name, profile in (('bare', BARE), ('tuned', None)):
+            journal, latencies, locked, seconds = self.run(profile, options)
+            self.stdout.write("%-6s journal %-7s %5.0f orders/s  %s  locked %d of %d" % (
+                name, journal, len(latencies) / seconds,
+                benchmarks.summary(latencies) if latencies else "no orders", locked, total,
+            ))
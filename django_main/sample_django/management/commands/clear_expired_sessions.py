@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from sample_django.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in small batches, so requests are never kept waiting on the table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05, help="Seconds to wait between batches")
+
+    def handle(self, *args, **options):
+        deleted = SessionStore.clear_expired(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS("Deleted %d expired session(s)" % deleted))
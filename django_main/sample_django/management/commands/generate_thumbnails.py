@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from sample_django import thumbnails
+from sample_django.caching import bump_catalog_generation
+from sample_django.models import Catagory, Product
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+
+def _uploads(directory):
+    """Image files under directory in default storage, recursively"""
+    if not default_storage.exists(directory):
+        return
+    subdirectories, files = default_storage.listdir(directory)
+    for name in files:
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            yield '%s/%s' % (directory, name)
+    for subdirectory in subdirectories:
+        yield from _uploads('%s/%s' % (directory, subdirectory))
+
+
+class Command(BaseCommand):
+    help = "Make the responsive thumbnails of uploaded images that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default='upload', help="Uploads directory, relative to MEDIA_ROOT")
+        parser.add_argument('--workers', type=int, default=thumbnails.workers() or 1)
+        parser.add_argument('--force', action='store_true', help="Remake thumbnails that already exist")
+
+    def handle(self, *args, **options):
+        names = set(_uploads(options['directory']))
+        # Images referenced from elsewhere in storage too
+        names.update(Product.objects.exclude(product_image='').values_list('product_image', flat=True))
+        names.update(Catagory.objects.exclude(image='').values_list('image', flat=True))
+        names.discard(None)
+
+        def make(name):
+            try:
+                return thumbnails.generate(name, force=options['force'])
+            except Exception as e:
+                self.stderr.write("%s: %s" % (name, e))
+                return 0
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            written = list(pool.map(make, sorted(names)))
+        if any(written):
+            bump_catalog_generation()
+        self.stdout.write(self.style.SUCCESS(
+            "Wrote %d variant(s) of %d of %d image(s) in %.1fs" % (
+                sum(written), sum(1 for n in written if n), len(names), time.perf_counter() - start
+            )
+        ))
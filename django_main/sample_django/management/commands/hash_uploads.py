@@ -0,0 +1,72 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sample_django import storage as uploads, thumbnails
+from sample_django.caching import bump_catalog_generation
+from sample_django.models import Catagory, Product
+
+# (model, ImageField name) pairs whose files move to content-addressed names
+FIELDS = ((Product, 'product_image'), (Catagory, 'image'))
+
+
+def _referenced():
+    """Every distinct stored name the image fields point at"""
+    names = set()
+    for model, field in FIELDS:
+        names.update(model.objects.exclude(**{field: ''}).exclude(**{field: None}).values_list(field, flat=True))
+    return names
+
+
+class Command(BaseCommand):
+    help = "Move uploaded images to content-addressed names, repointing image fields and removing duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would move without changing anything")
+
+    def handle(self, *args, **options):
+        target = uploads.upload_storage()
+        dry_run = options['dry_run']
+        renames, seen, missing = {}, set(), 0
+        saved = 0
+        for name in sorted(_referenced()):
+            if uploads.is_hashed(name):
+                seen.add(name)
+                continue
+            if not target.exists(name):
+                missing += 1
+                self.stderr.write("%s: referenced but not in storage" % name)
+                continue
+            with target.open(name, 'rb') as content:
+                new = uploads.hashed_name(name, uploads.digest(content))
+                if new in seen or target.exists(new):
+                    saved += target.size(name)
+                elif not dry_run:
+                    new = target.save(name, content)
+            seen.add(new)
+            renames[name] = new
+        if not dry_run and renames:
+            with transaction.atomic():
+                for model, field in FIELDS:
+                    for old, new in renames.items():
+                        model.objects.filter(**{field: old}).update(**{field: new})
+                transaction.on_commit(lambda: self._remove(renames))
+            bump_catalog_generation()
+
+        self.stdout.write(self.style.SUCCESS(
+            "%s %d file(s) to %d content-addressed name(s), %d byte(s) of duplicates%s" % (
+                "Would move" if dry_run else "Moved", len(renames), len(set(renames.values())), saved,
+                "; %d missing" % missing if missing else "",
+            )
+        ))
+        if renames and not dry_run:
+            self.stdout.write("Run generate_thumbnails to make the thumbnails of the new names")
+
+    def _remove(self, renames):
+        """Delete the old files and their thumbnails once nothing points at them"""
+        target = uploads.upload_storage()
+        for old in renames:
+            target.delete(old)
+            for width in thumbnails.WIDTHS:
+                for extension in thumbnails.FORMATS:
+                    default_storage.delete(thumbnails.variant_name(old, width, extension))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sample_django import facets
+
+
+class Command(BaseCommand):
+    help = "Recount the collection page facets from the product table"
+
+    def handle(self, *args, **options):
+        facets.rebuild()
+        self.stdout.write(self.style.SUCCESS("Facet counts rebuilt"))
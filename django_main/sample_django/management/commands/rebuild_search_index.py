@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from sample_django import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch"
+
+    def handle(self, *args, **options):
+        if not search.enabled():
+            self.stdout.write("Full-text index needs SQLite FTS5; searches use the fallback filter")
+            return
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sample_django import stock
+
+
+class Command(BaseCommand):
+    help = "Return expired checkout stock holds to Product.quantity"
+
+    def handle(self, *args, **options):
+        released = stock.release_expired()
+        self.stdout.write(self.style.SUCCESS("Released %d expired reservation(s)" % released))
@@ -0,0 +1,39 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_database(source, target):
+    """Snapshot one SQLite file into another, consistently even while it is written to"""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+class Command(BaseCommand):
+    help = "Stand in for replication locally: copy the primary SQLite database over each replica"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Keep copying every this many seconds; 0 copies once")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured; set REPLICA_PATH")
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replicas = [connections[alias].settings_dict for alias in settings.DATABASE_REPLICAS]
+        if any(db['ENGINE'] != 'django.db.backends.sqlite3' for db in [primary] + replicas):
+            raise CommandError("sync_replica only copies SQLite databases")
+        while True:
+            for replica in replicas:
+                copy_database(primary['NAME'], replica['NAME'])
+            self.stdout.write("Copied %s to %s" % (primary['NAME'], ', '.join(str(r['NAME']) for r in replicas)))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,45 @@
+import base64
+import hashlib
+import os
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sample_django import assets
+
+
+def _integrity(data, algorithm):
+    return '%s-%s' % (algorithm, base64.b64encode(hashlib.new(algorithm, data).digest()).decode())
+
+
+class Command(BaseCommand):
+    help = "Download the CDN assets the layout uses into static/vendor/ so pages load them from this site"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Download files that are already vendored")
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        root = settings.STATICFILES_DIRS[0]
+        written = 0
+        for name, asset in assets.VENDOR.items():
+            for path, url in assets.vendor_files(asset):
+                target = os.path.join(root, *path.split('/'))
+                if os.path.exists(target) and not options['force']:
+                    continue
+                try:
+                    with urlopen(url, timeout=options['timeout']) as response:
+                        data = response.read()
+                except OSError as e:
+                    raise CommandError("Could not download %s: %s" % (url, e))
+                if path == asset.path and asset.integrity:
+                    actual = _integrity(data, asset.integrity.split('-', 1)[0])
+                    if actual != asset.integrity:
+                        raise CommandError("%s does not match its pinned integrity (got %s)" % (url, actual))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(data)
+                written += 1
+                self.stdout.write("%s -> %s" % (url, path))
+        self.stdout.write(self.style.SUCCESS("Vendored %d file(s) under %s" % (written, root)))
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:18
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """Keep the oldest row of each (user, product) pair so the unique constraints apply"""
+    for name in ('AddCart', 'Favourite'):
+        model = apps.get_model('sample_django', name)
+        keep = (
+            model.objects.values('user', 'product')
+            .annotate(keep_id=Min('id'))
+            .values_list('keep_id', flat=True)
+        )
+        model.objects.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_django', '0021_stockreservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='catagory',
+            index=models.Index(condition=models.Q(('status', False)), fields=['name'], name='catagory_visible_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerfeedback',
+            index=models.Index(fields=['is_read', '-created_at'], name='feedback_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('status', False), ('trending', True)), fields=['-created_at', '-id'], name='product_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'status'], name='product_category_status_idx'),
+        ),
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='addcart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_cart_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='favourite',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_favourite_product'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def populate_slugs(apps, schema_editor):
+    Catagory = apps.get_model('sample_django', 'Catagory')
+    Product = apps.get_model('sample_django', 'Product')
+
+    def assign(rows, scope_of):
+        taken = set()
+        for row in rows.order_by('id'):
+            base = slugify(row.name)[:150] or 'item'
+            slug, n = base, 1
+            while (scope_of(row), slug) in taken:
+                n += 1
+                slug = f"{base}-{n}"
+            taken.add((scope_of(row), slug))
+            row.slug = slug
+            row.save(update_fields=['slug'])
+
+    assign(Catagory.objects.all(), lambda row: None)
+    assign(Product.objects.all(), lambda row: row.category_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_django', '0022_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catagory',
+            name='slug',
+            field=models.SlugField(blank=True, db_index=False, max_length=160),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(blank=True, db_index=False, max_length=160),
+        ),
+        migrations.RunPython(populate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='catagory',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=160, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('category', 'slug'), name='unique_product_slug'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS sample_django_product_fts USING fts5("
+        "name, vendor, description, category, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO sample_django_product_fts (rowid, name, vendor, description, category) "
+        "SELECT p.id, p.name, p.vendor, p.description, c.name "
+        "FROM sample_django_product p JOIN sample_django_catagory c ON c.id = p.category_id "
+        "WHERE NOT p.status AND NOT c.status"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS sample_django_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_django', '0024_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
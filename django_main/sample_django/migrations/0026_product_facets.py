@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:32
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Value
+
+
+def fill_discounts(apps, schema_editor):
+    Product = apps.get_model('sample_django', 'Product')
+    Product.objects.filter(original_price__gt=0).update(
+        discount=(F('original_price') - F('selling')) * Value(100.0) / F('original_price')
+    )
+
+
+# Facet buckets as they stood when ProductFacet was added
+PRICE_BOUNDS = (0, 500, 1000, 2500, 5000, 10000)
+DISCOUNT_BOUNDS = (0, 10, 25, 50)
+
+
+def bucket(bounds, value):
+    floor = bounds[0]
+    for bound in bounds:
+        if value >= bound:
+            floor = bound
+    return str(floor)
+
+
+def count_facets(apps, schema_editor):
+    Product = apps.get_model('sample_django', 'Product')
+    ProductFacet = apps.get_model('sample_django', 'ProductFacet')
+    counts = Counter()
+    rows = Product.objects.values('category_id', 'vendor', 'selling', 'discount', 'quantity', 'trending')
+    for row in rows.iterator(chunk_size=5000):
+        category_id = row['category_id']
+        counts.update([
+            (category_id, 'vendor', row['vendor']),
+            (category_id, 'price', bucket(PRICE_BOUNDS, row['selling'])),
+            (category_id, 'discount', bucket(DISCOUNT_BOUNDS, row['discount'])),
+            (category_id, 'stock', 'in' if row['quantity'] > 0 else 'out'),
+            (category_id, 'trending', 'yes' if row['trending'] else 'no'),
+        ])
+    ProductFacet.objects.bulk_create(
+        [
+            ProductFacet(category_id=category_id, facet=facet, value=value, count=count)
+            for (category_id, facet, value), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_django', '0025_product_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=150)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='discount',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_discounts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'selling', 'id'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'vendor'], name='product_category_vendor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-discount', '-id'], name='product_category_discount_idx'),
+        ),
+        migrations.AddField(
+            model_name='productfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sample_django.catagory'),
+        ),
+        migrations.AddConstraint(
+            model_name='productfacet',
+            constraint=models.UniqueConstraint(fields=('category', 'facet', 'value'), name='unique_product_facet'),
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:46
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def round_to_cents(apps, schema_editor):
+    # Float prices may carry binary noise past the second place
+    Product = apps.get_model('sample_django', 'Product')
+    Product.objects.update(original_price=Round(F('original_price'), 2), selling=Round(F('selling'), 2))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_django', '0026_product_facets'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='original_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='selling',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.RunPython(round_to_cents, migrations.RunPython.noop),
+    ]
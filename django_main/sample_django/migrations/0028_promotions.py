@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_django', '0027_decimal_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='coupon_code',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150)),
+                ('code', models.CharField(blank=True, help_text='Coupon code; blank applies automatically', max_length=30)),
+                ('scope', models.CharField(choices=[('product', 'Product'), ('category', 'Category'), ('cart', 'Cart total')], max_length=10)),
+                ('kind', models.CharField(choices=[('percent', 'Percent off'), ('amount', 'Amount off')], default='percent', max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('min_quantity', models.PositiveIntegerField(default=1, help_text='Units of a line needed to qualify')),
+                ('min_total', models.DecimalField(decimal_places=2, default=0, help_text='Cart subtotal needed to qualify (cart rules)', max_digits=10)),
+                ('active', models.BooleanField(default=True)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sample_django.catagory')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sample_django.product')),
+            ],
+        ),
+    ]
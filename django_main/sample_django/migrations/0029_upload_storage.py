@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:08
+
+import sample_django.models
+import sample_django.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_django', '0028_promotions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='catagory',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=sample_django.storage.upload_storage, upload_to=sample_django.models.getFileName),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='product_image',
+            field=models.ImageField(blank=True, null=True, storage=sample_django.storage.upload_storage, upload_to=sample_django.models.getFileName),
+        ),
+    ]
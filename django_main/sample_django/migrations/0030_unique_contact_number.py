@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:14
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def clear_duplicates(apps, schema_editor):
+    """Blank numbers become NULL, and a number shared by several profiles stays with the oldest"""
+    UserProfile = apps.get_model('sample_django', 'UserProfile')
+    UserProfile.objects.filter(contact_number='').update(contact_number=None)
+    shared = (
+        UserProfile.objects.exclude(contact_number=None).values('contact_number')
+        .annotate(count=Count('id'), keep_id=Min('id')).filter(count__gt=1)
+    )
+    for row in shared:
+        UserProfile.objects.filter(contact_number=row['contact_number']).exclude(id=row['keep_id']).update(
+            contact_number=None
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_django', '0029_upload_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='contact_number',
+            field=models.CharField(blank=True, max_length=20, null=True, unique=True),
+        ),
+    ]
@@ -1,47 +1,124 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
+from django.urls import reverse
+from django.utils.text import slugify
 import os
 
+from . import pricing
+from .storage import upload_storage
+
 def getFileName(instance, filename):
     """Helper function to generate upload path for images"""
     return os.path.join('static/upload', filename)
 
+def unique_slug(name, queryset, max_length=160):
+    """Slugify name, adding -2, -3... until it is not taken within queryset"""
+    base = slugify(name)[:max_length - 10] or 'item'
+    slug, n = base, 1
+    while queryset.filter(slug=slug).exists():
+        n += 1
+        slug = f"{base}-{n}"
+    return slug
+
 class Catagory(models.Model):
     name = models.CharField(max_length=150)
-    image = models.ImageField(upload_to=getFileName, blank=True, null=True)
+    slug = models.SlugField(max_length=160, unique=True, blank=True)
+    image = models.ImageField(upload_to=getFileName, storage=upload_storage, blank=True, null=True)
     description = models.TextField(max_length=500)
     status = models.BooleanField(default=False, help_text='0-show,1-Hidden')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Partial on visible rows; serves both the collections list and name lookups
+            models.Index(fields=['name'], condition=models.Q(status=False), name='catagory_visible_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = unique_slug(self.name, Catagory.objects.exclude(pk=self.pk))
+        super().save(*args, **kwargs)
+
+    def get_absolute_url(self):
+        return reverse('collections', args=[self.slug])
+
 class Product(models.Model):
     category = models.ForeignKey(Catagory, on_delete=models.CASCADE)
     name = models.CharField(max_length=150)
+    # Unique per category; the (category, slug) constraint doubles as its index
+    slug = models.SlugField(max_length=160, blank=True, db_index=False)
     vendor = models.CharField(max_length=150)
-    product_image = models.ImageField(upload_to=getFileName, blank=True, null=True)
+    product_image = models.ImageField(upload_to=getFileName, storage=upload_storage, blank=True, null=True)
     quantity = models.IntegerField()
-    original_price = models.FloatField()
-    selling = models.FloatField()
+    original_price = models.DecimalField(max_digits=10, decimal_places=2)
+    selling = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(max_length=500)
     status = models.BooleanField(default=False, help_text='0-show,1-Hidden')
     trending = models.BooleanField(default=False, help_text='0-default,1-Trending')
+    # Stored so collection pages can sort and filter on it with an index
+    discount = models.FloatField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (created_at, id) within these filters
+            models.Index(fields=['status', '-created_at', '-id'], name='product_listing_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_listing_idx'),
+            # Partial index: SQLite cannot seek on the NOT "status" term Django emits for status=0
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(status=False, trending=True),
+                name='product_trending_idx',
+            ),
+            models.Index(fields=['category', 'status'], name='product_category_status_idx'),
+            # Price sorts and ranges on collection pages
+            models.Index(fields=['category', 'selling', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['category', 'vendor'], name='product_category_vendor_idx'),
+            models.Index(fields=['category', '-discount', '-id'], name='product_category_discount_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'slug'], name='unique_product_slug'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = unique_slug(
+                self.name, Product.objects.filter(category_id=self.category_id).exclude(pk=self.pk)
+            )
+        self.discount = pricing.discount_percent(self.original_price, self.selling)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'original_price', 'selling'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'discount'}
+        super().save(*args, **kwargs)
+
+    def get_absolute_url(self):
+        return reverse('product_details', args=[self.category.slug, self.slug])
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    contact_number = models.CharField(max_length=20, blank=True, null=True)
+    # Unique, so logging in by contact number is an index lookup for one user
+    contact_number = models.CharField(max_length=20, blank=True, null=True, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.user.username
 
+    def save(self, *args, **kwargs):
+        # Blank is "no number", stored as NULL so any number of profiles can leave it out
+        self.contact_number = (self.contact_number or '').strip() or None
+        super().save(*args, **kwargs)
+
 
 class AddCart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -49,9 +126,88 @@ class AddCart(models.Model):
     quantity = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
 
+    @property
+    def line_total(self):
+        return pricing.line_total(self.product.selling, self.quantity)
+
+class ProductFacet(models.Model):
+    """How many products of a category fall under one facet value, kept current by signals"""
+    category = models.ForeignKey(Catagory, on_delete=models.CASCADE)
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=150)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'facet', 'value'], name='unique_product_facet'),
+        ]
+
+    def __str__(self):
+        return f"{self.category.name} {self.facet}={self.value}: {self.count}"
+
+class Promotion(models.Model):
+    """A discount rule; promotions.py compiles the active ones into an evaluation plan"""
+    PRODUCT, CATEGORY, CART = 'product', 'category', 'cart'
+    SCOPE_CHOICES = [
+        (PRODUCT, 'Product'),
+        (CATEGORY, 'Category'),
+        (CART, 'Cart total'),
+    ]
+    PERCENT, AMOUNT = 'percent', 'amount'
+    KIND_CHOICES = [
+        (PERCENT, 'Percent off'),
+        (AMOUNT, 'Amount off'),
+    ]
+
+    name = models.CharField(max_length=150)
+    code = models.CharField(max_length=30, blank=True, help_text='Coupon code; blank applies automatically')
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
+    category = models.ForeignKey(Catagory, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=PERCENT)
+    # Percent, or amount off per unit (product and category) or per cart
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+    # Tiers: several rules on one product or category with rising minimums
+    min_quantity = models.PositiveIntegerField(default=1, help_text='Units of a line needed to qualify')
+    min_total = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                    help_text='Cart subtotal needed to qualify (cart rules)')
+    active = models.BooleanField(default=True)
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if self.scope == self.PRODUCT and not self.product_id:
+            raise ValidationError({'product': "A product promotion needs a product"})
+        if self.scope == self.CATEGORY and not self.category_id:
+            raise ValidationError({'category': "A category promotion needs a category"})
+        if self.kind == self.PERCENT and not 0 < self.value <= 100:
+            raise ValidationError({'value': "A percentage must be between 0 and 100"})
+        self.code = self.code.strip().upper()
+
+class StockReservation(models.Model):
+    """Stock set aside for a user during checkout, returned to Product.quantity on expiry"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.product.name} x {self.quantity}"
+
 class Order(models.Model):
     PAYMENT_METHOD_CHOICES = [
         ('credit_card', 'Credit Card'),
@@ -63,6 +219,9 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     order_number = models.CharField(max_length=20, unique=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Promotions taken off the sum of the item prices to arrive at total_amount
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    coupon_code = models.CharField(max_length=30, blank=True)
     status = models.CharField(
         max_length=20,
         choices=[
@@ -105,6 +264,11 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ]
+
     def __str__(self):
         return self.order_number
 
@@ -123,6 +287,11 @@ class Favourite(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_favourite_product'),
+        ]
+
 class CustomerFeedback(models.Model):
     RATING_CHOICES = [
         (1, '1 - Poor'),
@@ -144,6 +313,18 @@ class CustomerFeedback(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_read', '-created_at'], name='feedback_unread_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.subject}"
+
+
+class CacheGeneration(models.Model):
+    """A cache generation counter, kept here when the cache is not shared between processes"""
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
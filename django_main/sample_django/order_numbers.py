@@ -0,0 +1,89 @@
+import base64
+import os
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Crockford base32: no I, L, O or U, so numbers read back unambiguously.
+# Its digits sort in the same order as their values, so the encoded strings
+# sort the same way as the integers behind them.
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_FROM_RFC4648 = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', ALPHABET.encode())
+
+
+def base32_80(value):
+    """Encode an 80-bit integer as 16 Crockford base32 characters"""
+    return base64.b32encode(value.to_bytes(10, 'big')).translate(_FROM_RFC4648).decode()
+
+
+class SnowflakeAllocator:
+    """
+    Time-sortable order numbers generated in-process, without a DB round-trip.
+
+    Each number packs 80 bits into 16 base32 characters:
+
+        42 bits  milliseconds since EPOCH_MS (good for ~139 years)
+         8 bits  node id, from settings.ORDER_NUMBER_NODE_ID (one per host)
+        22 bits  process id (Linux pid_max is at most 2**22)
+         8 bits  sequence within the millisecond
+
+    Process ids are unique among live processes on a host and node ids are
+    unique across hosts, so workers never need to coordinate. Within a
+    process a lock serialises the sequence; when it runs out, or the clock
+    steps backwards, the allocator moves on to the next millisecond instead
+    of repeating one.
+    """
+    EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+    NODE_BITS = 8
+    PID_BITS = 22
+    SEQUENCE_BITS = 8
+    PREFIX = 'ORD-'
+
+    def __init__(self, node_id=None):
+        if node_id is None:
+            node_id = getattr(settings, 'ORDER_NUMBER_NODE_ID', 0)
+        if not 0 <= node_id < 1 << self.NODE_BITS:
+            raise ValueError("ORDER_NUMBER_NODE_ID must be between 0 and %d" % ((1 << self.NODE_BITS) - 1))
+        self.node_id = node_id
+        self._lock = threading.Lock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid() & ((1 << self.PID_BITS) - 1)
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_int(self):
+        with self._lock:
+            now = time.time_ns() // 1_000_000 - self.EPOCH_MS
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence >> self.SEQUENCE_BITS:
+                    self._last_ms += 1
+                    self._sequence = 0
+            value = self._last_ms
+            value = (value << self.NODE_BITS) | self.node_id
+            value = (value << self.PID_BITS) | self._pid
+            return (value << self.SEQUENCE_BITS) | self._sequence
+
+    def __call__(self):
+        return self.PREFIX + base32_80(self.next_int())
+
+
+@lru_cache(maxsize=None)
+def get_allocator():
+    """The allocator named by settings.ORDER_NUMBER_ALLOCATOR"""
+    path = getattr(settings, 'ORDER_NUMBER_ALLOCATOR', 'sample_django.order_numbers.SnowflakeAllocator')
+    return import_string(path)()
+
+
+def allocate():
+    return get_allocator()()
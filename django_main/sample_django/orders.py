@@ -0,0 +1,102 @@
+from functools import partial
+
+from django.db import transaction
+
+from .models import AddCart, Order, OrderItem
+from . import stock, order_numbers, pricing, promotions
+from .db import retry_locked
+
+
+class EmptyOrder(ValueError):
+    pass
+
+
+def new_order_number():
+    return order_numbers.allocate()
+
+
+@retry_locked
+def place_order(user, lines, coupon=None, categories=None, **fields):
+    """
+    Create an order from (product_id, quantity, unit_price) lines.
+
+    Stock is taken with one conditional UPDATE, the order with one INSERT and
+    its items with one bulk INSERT, so the number of queries does not depend
+    on how many lines the order has. The total has the promotions in force,
+    and those of the coupon code if one is given, taken off; categories, a
+    {product_id: category_id} map, saves looking them up for category rules.
+    Extra keyword arguments are set on the Order (shipping address, customer
+    details, payment method...).
+    """
+    return _create_order(user, lines, partial(stock.purchase, user), coupon, categories, **fields)
+
+
+def _create_order(user, lines, take_stock, coupon=None, categories=None, **fields):
+    lines = list(lines)
+    if not lines:
+        raise EmptyOrder("Cannot place an order without items")
+
+    with transaction.atomic():
+        take_stock([(product_id, quantity) for product_id, quantity, _ in lines])
+        quote = promotions.quote_products(lines, coupon, categories)
+        order = Order.objects.create(
+            user=user,
+            order_number=new_order_number(),
+            total_amount=quote.total,
+            discount_amount=quote.discount,
+            coupon_code=quote.code or '',
+            **fields
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=quantity, price=price)
+            for product_id, quantity, price in lines
+        ])
+    return order
+
+
+@retry_locked
+def place_cart_order(user, coupon=None, **fields):
+    """Turn the user's whole cart into an order and empty the cart"""
+    with transaction.atomic():
+        rows = list(AddCart.objects.filter(user=user).values_list(
+            'id', 'product_id', 'quantity', 'product__selling', 'product__category_id'
+        ))
+        order = place_order(
+            user, [row[1:4] for row in rows], coupon, {row[1]: row[4] for row in rows}, **fields
+        )
+        # Only drop the lines that went into the order, not ones added meanwhile
+        AddCart.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return order
+
+
+@retry_locked
+def reorder(order):
+    """
+    Place a new order with the same lines and shipping details at today's
+    prices. Staff do this on the customer's behalf, so it takes fresh stock
+    and leaves whatever the customer is holding at checkout alone.
+    """
+    lines = order.items.values_list('product_id', 'quantity', 'product__selling')
+    return _create_order(
+        order.user,
+        lines,
+        stock.reserve,
+        customer_name=order.customer_name,
+        customer_email=order.customer_email,
+        customer_contact=order.customer_contact,
+        payment_method=order.payment_method,
+        shipping_address=order.shipping_address,
+        status='pending',
+    )
+
+
+def refresh_total(order):
+    """
+    Recompute order.total_amount from its items with a single aggregate,
+    keeping the discount the order was placed with
+    """
+    minor = order.items.aggregate(total=pricing.minor_units_sum('quantity', 'price'))['total'] or 0
+    total = max(pricing.from_minor(minor) - order.discount_amount, pricing.ZERO)
+    Order.objects.filter(pk=order.pk).update(total_amount=total)
+    order.total_amount = total
+    return total
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Newest first; id breaks ties between rows created in the same microsecond
+NEWEST_FIRST = ('-created_at', '-id')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _field_type(queryset, name):
+    try:
+        field = queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = queryset.query.annotations[name].output_field
+    return field.get_internal_type()
+
+
+def encode_cursor(obj, order=NEWEST_FIRST):
+    """Build an opaque cursor pointing just after obj in the given order"""
+    parts = []
+    for field in order:
+        value = getattr(obj, field.lstrip('-'))
+        if isinstance(value, datetime):
+            parts.append('%d' % ((value - _EPOCH) // timedelta(microseconds=1)))
+        elif isinstance(value, Decimal):
+            parts.append(str(value))
+        else:
+            parts.append(repr(value))
+    return '_'.join(parts)
+
+
+def decode_cursor(cursor, queryset, order=NEWEST_FIRST):
+    """Turn a cursor back into the seek key for order, one value per field"""
+    try:
+        parts = cursor.split('_')
+        if len(parts) != len(order):
+            raise ValueError
+        values = []
+        for field, part in zip(order, parts):
+            kind = _field_type(queryset, field.lstrip('-'))
+            if kind == 'DateTimeField':
+                values.append(_EPOCH + timedelta(microseconds=int(part)))
+            elif kind == 'FloatField':
+                values.append(float(part))
+            elif kind == 'DecimalField':
+                values.append(Decimal(part))
+            else:
+                values.append(int(part))
+        return tuple(values)
+    except (AttributeError, ValueError, OverflowError, InvalidOperation):
+        raise InvalidCursor("Invalid cursor: %r" % (cursor,))
+
+
+def _seek(order, values):
+    """WHERE clause matching the rows that come after values in order"""
+    condition = Q()
+    for i, field in enumerate(order):
+        ties = {f.lstrip('-'): v for f, v in zip(order[:i], values[:i])}
+        past = {field.lstrip('-') + ('__lt' if field.startswith('-') else '__gt'): values[i]}
+        condition |= Q(**ties, **past)
+    return condition
+
+
+def keyset_page(queryset, cursor=None, size=PAGE_SIZE, order=NEWEST_FIRST):
+    """
+    Return (items, next_cursor) for the page following cursor.
+
+    Rows are ordered by order (newest first on (created_at, id) by default,
+    which must end in a unique column) and the page is found by seeking past
+    the cursor rather than with OFFSET, so the cost of a page does not depend
+    on how deep into the listing it is.
+    """
+    size = max(1, min(int(size), MAX_PAGE_SIZE))
+    queryset = queryset.order_by(*order)
+    if cursor:
+        queryset = queryset.filter(_seek(order, decode_cursor(cursor, queryset, order)))
+    items = list(queryset[:size + 1])
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor(items[-1], order)
+    return items, next_cursor
@@ -0,0 +1,113 @@
+"""
+Money arithmetic in Decimal and integer minor units (paise).
+
+Prices are DecimalFields with two places. Line and cart totals, discounts and
+taxes are computed here so that no amount ever passes through a float. Large
+totals take the fast path: total() sums a whole batch of lines in one pass,
+and minor_units_sum() has the database add integer minor units instead of
+floats.
+"""
+import itertools
+import operator
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import F, Sum, Value, FloatField, IntegerField
+from django.db.models.expressions import CombinedExpression
+from django.db.models.functions import Cast, Round
+
+CENT = Decimal('0.01')
+MINOR_PER_UNIT = 100
+ZERO = Decimal('0.00')
+
+
+def to_money(value):
+    """Decimal rounded half-up to the cent; floats go through their shortest repr"""
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_minor(value):
+    """Integer minor units (paise) for an amount"""
+    return int(to_money(value).scaleb(2))
+
+
+def from_minor(minor):
+    return (Decimal(minor) / MINOR_PER_UNIT).quantize(CENT)
+
+
+def line_total(unit_price, quantity):
+    return to_money(unit_price) * int(quantity)
+
+
+def _exact(lines):
+    for quantity, unit_price in lines:
+        # DecimalField values are already exact; only floats and strings need converting
+        yield int(quantity), unit_price if type(unit_price) is Decimal else to_money(unit_price)
+
+
+def total(lines):
+    """
+    Sum of (quantity, unit_price) lines, rounded once at the end.
+
+    Products and sums of two-place Decimals are exact, so nothing is rounded
+    per line and the batch is multiplied and added by starmap() and sum(),
+    whose loops run in C. This is the path for long carts and order exports.
+    """
+    return to_money(sum(itertools.starmap(operator.mul, _exact(lines)), ZERO))
+
+
+def minor_units(field):
+    """SQL expression for a decimal price column in integer minor units"""
+    return Cast(Round(_float(F(field), CombinedExpression.MUL, Value(MINOR_PER_UNIT))), IntegerField())
+
+
+def minor_total(rows):
+    """
+    Sum of (quantity, minor_units) integer rows, as fetched with
+    values_list('quantity', minor_units('price')). Exports of many order
+    items take this path: the database hands back plain integers, so there
+    is no Decimal to build per row and the sum is integer arithmetic.
+    """
+    return from_minor(sum(itertools.starmap(operator.mul, rows)))
+
+
+def _float(lhs, connector, rhs):
+    # A FloatField result skips the CAST(... AS NUMERIC) that SQLite wraps
+    # decimal expressions in
+    return CombinedExpression(lhs, connector, rhs, output_field=FloatField())
+
+
+def minor_units_sum(quantity_field, price_field):
+    """
+    Aggregate of quantity * price in integer minor units, computed by the
+    database: each price is rounded to whole paise before it is multiplied
+    and summed, so the sum itself is integer arithmetic.
+    """
+    return Sum(CombinedExpression(minor_units(price_field), CombinedExpression.MUL, F(quantity_field),
+                                  output_field=IntegerField()))
+
+
+def discount_percent(original_price, selling):
+    """How far selling is below original_price, in percent"""
+    original_price, selling = to_money(original_price), to_money(selling)
+    if original_price <= 0:
+        return 0.0
+    return float((original_price - selling) * 100 / original_price)
+
+
+def discounted(amount, percent):
+    """amount less percent off, to the cent"""
+    return to_money(to_money(amount) * (100 - Decimal(str(percent))) / 100)
+
+
+def tax_rate():
+    """Tax as a percentage, from settings.TAX_RATE_PERCENT"""
+    return Decimal(str(getattr(settings, 'TAX_RATE_PERCENT', 0)))
+
+
+def tax(amount, rate=None):
+    """Tax due on amount at rate percent (settings.TAX_RATE_PERCENT by default)"""
+    rate = tax_rate() if rate is None else Decimal(str(rate))
+    return to_money(to_money(amount) * rate / 100)
@@ -0,0 +1,245 @@
+"""
+Promotions: product, category and cart-total discounts, applied
+automatically or unlocked by a coupon code.
+
+Active Promotion rows are compiled into a plan when they change, and each
+process keeps the plan it compiled until signals retire it. The plan indexes
+rules by product and by category and, within each, by the minimum quantity
+(or cart subtotal) that unlocks them, with the best percentage and the best
+flat amount precomputed for every tier. Pricing a cart is then one pass over
+its lines with a dictionary lookup and a bisect each: no queries, and no
+looking at rules that cannot apply.
+
+Rules do not stack. Each line gets the single best product or category rule
+it qualifies for, then the discounted subtotal gets the best cart rule.
+"""
+import bisect
+import uuid
+from collections import defaultdict, namedtuple
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .caching import bump_generation, generation, shared
+from .models import Product, Promotion
+from . import pricing
+
+VERSION_KEY = 'promotions:version'
+SESSION_KEY = 'coupon'
+
+Rule = namedtuple('Rule', 'id name kind value threshold')
+
+# lines: {key: (line_total, discount)}; applied: names of the rules used
+Quote = namedtuple('Quote', 'lines subtotal discount total applied code')
+
+
+class Tiers:
+    """The rules for one product, category or the cart, by the threshold that unlocks them"""
+
+    def __init__(self, rules):
+        rules = sorted(rules, key=lambda rule: rule.threshold)
+        self.thresholds = [rule.threshold for rule in rules]
+        # Best rule of each kind among those unlocked at thresholds[i]
+        self.percent, self.amount = [], []
+        percent = amount = None
+        for rule in rules:
+            if rule.kind == Promotion.PERCENT:
+                if percent is None or rule.value > percent.value:
+                    percent = rule
+            elif amount is None or rule.value > amount.value:
+                amount = rule
+            self.percent.append(percent)
+            self.amount.append(amount)
+
+    def best(self, reached, base, units=1):
+        """(discount, rule) for the best rule unlocked at reached, on base; amounts are per unit"""
+        i = bisect.bisect_right(self.thresholds, reached) - 1
+        if i < 0:
+            return pricing.ZERO, None
+        best = pricing.ZERO, None
+        percent, amount = self.percent[i], self.amount[i]
+        if percent is not None:
+            best = pricing.to_money(base * percent.value / 100), percent
+        if amount is not None:
+            off = min(base, amount.value * units)
+            if off > best[0]:
+                best = off, amount
+        return best
+
+
+NO_TIERS = Tiers([])
+
+
+class Plan:
+    """Automatic rules, or the rules of one coupon code, compiled for evaluation"""
+
+    def __init__(self, promotions):
+        products, categories, cart = defaultdict(list), defaultdict(list), []
+        for promotion in promotions:
+            if promotion.scope == Promotion.CART:
+                cart.append(Rule(promotion.id, promotion.name, promotion.kind, promotion.value, promotion.min_total))
+                continue
+            rule = Rule(promotion.id, promotion.name, promotion.kind, promotion.value, promotion.min_quantity)
+            if promotion.scope == Promotion.PRODUCT:
+                products[promotion.product_id].append(rule)
+            else:
+                categories[promotion.category_id].append(rule)
+        self.products = {pid: Tiers(rules) for pid, rules in products.items()}
+        self.categories = {cid: Tiers(rules) for cid, rules in categories.items()}
+        self.cart = Tiers(cart) if cart else NO_TIERS
+
+    def line(self, product_id, category_id, quantity, base):
+        best = pricing.ZERO, None
+        for tiers in (self.products.get(product_id), self.categories.get(category_id)):
+            if tiers is not None:
+                found = tiers.best(quantity, base, quantity)
+                if found[0] > best[0]:
+                    best = found
+        return best
+
+
+Compiled = namedtuple('Compiled', 'version automatic coupons uses_categories expires')
+
+
+def _live(promotion, now):
+    return (promotion.starts_at is None or promotion.starts_at <= now) and (
+        promotion.ends_at is None or promotion.ends_at > now
+    )
+
+
+# Promotion columns a plan is compiled from; rows need not be model instances
+RULE_FIELDS = (
+    'id', 'name', 'code', 'scope', 'product_id', 'category_id', 'kind', 'value',
+    'min_quantity', 'min_total', 'active', 'starts_at', 'ends_at',
+)
+
+
+def compile_plan(promotions, version=None, now=None):
+    """Compile Promotion rows into a Compiled plan; only those live at now take part"""
+    now = now or timezone.now()
+    automatic, coupons, boundaries = [], defaultdict(list), []
+    for promotion in promotions:
+        boundaries += [moment for moment in (promotion.starts_at, promotion.ends_at) if moment and moment > now]
+        if not promotion.active or not _live(promotion, now):
+            continue
+        if promotion.code:
+            coupons[promotion.code.upper()].append(promotion)
+        else:
+            automatic.append(promotion)
+    automatic = Plan(automatic)
+    coupons = {code: Plan(rules) for code, rules in coupons.items()}
+    return Compiled(
+        version,
+        automatic,
+        coupons,
+        any(candidate.categories for candidate in [automatic, *coupons.values()]),
+        # A rule starting or ending is a change too
+        min(boundaries, default=None),
+    )
+
+
+def _version():
+    if not shared():
+        # A per-process cache cannot tell other processes to recompile; the DB can
+        return generation(VERSION_KEY)
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Not a counter: after a cache flush a counter would restart at a
+        # value some process may still have a stale plan for
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def expire_plan():
+    """Make every process recompile on its next evaluation; signals call this"""
+    if not shared():
+        bump_generation(VERSION_KEY)
+        return
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+_compiled = None
+
+
+def plan():
+    """The compiled plan for this process, recompiled when promotions have changed"""
+    global _compiled
+    version, compiled = _version(), _compiled
+    if compiled is None or compiled.version != version or (compiled.expires and compiled.expires <= timezone.now()):
+        now = timezone.now()
+        rows = Promotion.objects.filter(active=True).exclude(ends_at__lte=now).values_list(*RULE_FIELDS, named=True)
+        compiled = compile_plan(rows, version, now)
+        _compiled = compiled
+    return compiled
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+def is_coupon(code):
+    return normalize_code(code) in plan().coupons
+
+
+def session_code(session):
+    return session.get(SESSION_KEY)
+
+
+def quote(lines, code=None, compiled=None):
+    """
+    Price (key, product_id, category_id, quantity, unit_price) lines with the
+    promotions in force. code unlocks that coupon's rules, if it has any.
+    """
+    compiled = compiled or plan()
+    code = normalize_code(code)
+    coupon = compiled.coupons.get(code)
+    plans = (compiled.automatic, coupon) if coupon else (compiled.automatic,)
+    priced, applied = {}, {}
+    subtotal = discount = pricing.ZERO
+    for key, product_id, category_id, quantity, unit_price in lines:
+        base = pricing.line_total(unit_price, quantity)
+        best = pricing.ZERO, None
+        for candidate in plans:
+            found = candidate.line(product_id, category_id, quantity, base)
+            if found[0] > best[0]:
+                best = found
+        priced[key] = (base, best[0])
+        subtotal += base
+        discount += best[0]
+        if best[1] is not None:
+            applied[best[1].id] = best[1].name
+    remaining = subtotal - discount
+    best = pricing.ZERO, None
+    for candidate in plans:
+        found = candidate.cart.best(remaining, remaining)
+        if found[0] > best[0]:
+            best = found
+    if best[1] is not None:
+        applied[best[1].id] = best[1].name
+        discount += best[0]
+    return Quote(priced, subtotal, discount, subtotal - discount, list(applied.values()), code if coupon else None)
+
+
+def quote_products(lines, code=None, categories=None):
+    """
+    quote() for (product_id, quantity, unit_price) lines, as orders take them.
+    Without a {product_id: category_id} map categories are looked up, in one
+    query, if a category rule is live.
+    """
+    lines = list(lines)
+    compiled = plan()
+    if categories is None:
+        categories = {}
+        if compiled.uses_categories:
+            categories = dict(
+                Product.objects.filter(id__in=[line[0] for line in lines]).values_list('id', 'category_id')
+            )
+    return quote(
+        (
+            (i, product_id, categories.get(product_id), quantity, price)
+            for i, (product_id, quantity, price) in enumerate(lines)
+        ),
+        code,
+        compiled,
+    )
@@ -0,0 +1,99 @@
+"""
+Login rate limits: how many password checks a client IP, and an IP against
+one identifier, may start in a period.
+
+The identifier budget is kept per address, so guessing at someone's
+account from one address never locks them out from theirs. There is no
+budget shared by everyone: a flood of junk would spend it and turn real
+users away. The CPU that hashing can take is bounded by the hashing pool
+instead (see hashers.py), where excess checks wait rather than fail.
+
+Each scope in settings.LOGIN_RATE_LIMITS is (attempts, seconds). The default
+'local' backend keeps a token bucket per key in this process: it holds up to
+`attempts` tokens and refills continuously at attempts/seconds, so the limit
+applies over any sliding window of that length. The 'cache' backend shares a
+sliding-window counter between processes through the default cache. A
+rejected attempt costs a dictionary or cache lookup instead of a hash.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class TokenBuckets:
+    """Token buckets by key in this process; the least recently used are dropped past max_keys"""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, attempts, seconds, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (attempts, now))
+            tokens = min(attempts, tokens + (now - updated) * attempts / seconds)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheWindows:
+    """
+    Sliding-window counters in the shared cache: the count of the previous
+    fixed window, weighted by how much of it the sliding window still
+    covers, plus the count of the current one.
+    """
+
+    def take(self, key, attempts, seconds, now=None):
+        now = time.time() if now is None else now
+        window = int(now // seconds)
+        current, previous = 'ratelimit:%s:%d' % (key, window), 'ratelimit:%s:%d' % (key, window - 1)
+        counts = cache.get_many([current, previous])
+        overlap = 1 - (now % seconds) / seconds
+        if counts.get(previous, 0) * overlap + counts.get(current, 0) >= attempts:
+            return False
+        cache.add(current, 0, timeout=int(seconds * 2) + 1)
+        try:
+            cache.incr(current)
+        except ValueError:
+            # Evicted in between; count this attempt in a new window
+            cache.add(current, 1, timeout=int(seconds * 2) + 1)
+        return True
+
+    def clear(self):
+        pass
+
+
+local = TokenBuckets()
+shared = CacheWindows()
+
+
+def backend():
+    return shared if settings.LOGIN_RATE_LIMIT_BACKEND == 'cache' else local
+
+
+def _key(scope, value):
+    return '%s:%s' % (scope, hashlib.sha256(value.encode()).hexdigest()[:32])
+
+
+def allow_login(request, identifier):
+    """Take an attempt from every scope's budget; False if any is spent"""
+    limits = settings.LOGIN_RATE_LIMITS
+    ip = request.META.get('REMOTE_ADDR') or ''
+    keys = (
+        ('ip', ip),
+        ('identifier', '%s|%s' % ((identifier or '').strip().lower(), ip)),
+    )
+    buckets = backend()
+    return all(buckets.take(_key(scope, value), *limits[scope]) for scope, value in keys if scope in limits)
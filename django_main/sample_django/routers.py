@@ -0,0 +1,112 @@
+"""
+Primary/replica routing with read-your-writes.
+
+Writes, and every query inside a transaction on the primary, go to
+'default'. Other reads go to one of settings.DATABASE_REPLICAS, picked at
+random; with none configured everything stays on 'default'.
+
+A replica lags the primary, so a visitor who has just written (added to
+their cart, checked out, logged in) must not read from one until it has
+caught up. PinToPrimaryMiddleware notes when a request writes: its
+remaining reads go to the primary, and a cookie keeps that visitor's reads
+there for REPLICA_PIN_SECONDS more, which must outlast the replication lag.
+Work outside a request (management commands, jobs) reads from replicas
+unless run inside pinned().
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'pin_primary'
+
+
+class _Pin:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Mutable, so a write noticed in a sync_to_async thread is seen by the middleware
+_pin = ContextVar('sample_django.routers.pin', default=None)
+
+
+def _pinned():
+    pin = _pin.get()
+    return pin is not None and (pin.pinned or pin.wrote)
+
+
+@contextmanager
+def pinned():
+    """Send every read in the block to the primary"""
+    token = _pin.set(_Pin(pinned=True))
+    try:
+        yield
+    finally:
+        _pin.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        pin = _pin.get()
+        if pin is not None:
+            pin.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema along with their data, from the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+class PinToPrimaryMiddleware:
+    """Keep a visitor's reads on the primary for a while after they write"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        pin = self.pin(request)
+        token = _pin.set(pin)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pin.reset(token)
+        return self.finish(pin, response)
+
+    async def __acall__(self, request):
+        pin = self.pin(request)
+        token = _pin.set(pin)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pin.reset(token)
+        return self.finish(pin, response)
+
+    def pin(self, request):
+        return _Pin(pinned=PIN_COOKIE in request.COOKIES)
+
+    def finish(self, pin, response):
+        if pin.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,139 @@
+"""
+Product search backed by an SQLite FTS5 index.
+
+sample_django_product_fts holds one row per visible product, keyed by the
+product id, with the name, vendor, description and category name. Signals
+keep it in step with Product and Catagory writes; rebuild() recreates it
+wholesale after bulk imports or queryset.update() calls that bypass them.
+On databases without FTS5 search falls back to icontains filters.
+"""
+import re
+
+from django.db import connection
+
+from .models import Product
+from . import catalog
+
+TABLE = 'sample_django_product_fts'
+
+# bm25 column weights, in table column order: name, vendor, description, category
+WEIGHTS = (10.0, 3.0, 1.0, 3.0)
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+_VISIBLE_ROWS = """
+    SELECT p.id, p.name, p.vendor, p.description, c.name
+    FROM sample_django_product p
+    JOIN sample_django_catagory c ON c.id = p.category_id
+    WHERE NOT p.status AND NOT c.status
+"""
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(text, prefix_last=True):
+    """
+    Turn free text into an FTS5 query: every word must match, the last one
+    as a prefix so results follow the user while they type.
+    """
+    words = _WORD.findall(text.lower())
+    if prefix_last and len(words) > 1 and len(words[-1]) < 2:
+        # A one-letter fragment is not in the prefix index and matches nearly
+        # everything; wait for the next keystroke instead
+        words.pop()
+    if not words:
+        return None
+    terms = ['"%s"' % word for word in words]
+    if prefix_last:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def index_products(product_ids):
+    """(Re)index the given products, dropping any that are no longer visible"""
+    product_ids = list(product_ids)
+    if not enabled() or not product_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (TABLE, placeholders), product_ids)
+        cursor.execute(
+            'INSERT INTO %s (rowid, name, vendor, description, category) %s AND p.id IN (%s)'
+            % (TABLE, _VISIBLE_ROWS, placeholders),
+            product_ids,
+        )
+
+
+def remove_products(product_ids):
+    product_ids = list(product_ids)
+    if not enabled() or not product_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (TABLE, placeholders), product_ids)
+
+
+def rebuild():
+    """Recreate the whole index from the product table"""
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % TABLE)
+        cursor.execute('INSERT INTO %s (rowid, name, vendor, description, category) %s' % (TABLE, _VISIBLE_ROWS))
+        cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (TABLE, TABLE))
+
+
+# Autocomplete only ranks this many matches. A two-letter prefix can match a
+# large share of the catalog and scoring all of it is what makes it slow.
+SUGGEST_CANDIDATES = 500
+
+
+def ranked_ids(text, limit=24, offset=0, candidates=None):
+    """
+    Product ids matching text, best bm25 rank first. With candidates, only
+    the first that many matches are ranked.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    sql = 'SELECT rowid, bm25({table}, {weights}) AS score FROM {table} WHERE {table} MATCH %s'
+    params = [expression]
+    if candidates:
+        sql += ' LIMIT %s'
+        params.append(candidates)
+    sql = 'SELECT rowid FROM (' + sql + ') ORDER BY score LIMIT %s OFFSET %s'
+    params += [limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(table=TABLE, weights=', '.join(map(str, WEIGHTS))), params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search(text, limit=24, offset=0):
+    """Visible products matching text as card-ready instances, in rank order"""
+    if match_expression(text) is None:
+        return []
+    if not enabled():
+        return _fallback(text)[offset:offset + limit]
+    ids = ranked_ids(text, limit, offset)
+    products = {p.id: p for p in catalog.product_cards(Product.objects.filter(id__in=ids))}
+    return [products[pk] for pk in ids if pk in products]
+
+
+def suggest(text, limit=8):
+    """Product names for the autocomplete dropdown"""
+    if match_expression(text) is None:
+        return []
+    if not enabled():
+        return list(_fallback(text).values_list('name', flat=True)[:limit])
+    ids = ranked_ids(text, limit, candidates=SUGGEST_CANDIDATES)
+    names = dict(Product.objects.filter(id__in=ids).values_list('id', 'name'))
+    return [names[pk] for pk in ids if pk in names]
+
+
+def _fallback(text):
+    queryset = catalog.active_products().filter(category__status=0)
+    for word in _WORD.findall(text):
+        queryset = queryset.filter(name__icontains=word)
+    return queryset
@@ -0,0 +1,126 @@
+"""
+Session engine: cached_db with reads from the cache and lazy writes to the DB.
+
+Sessions are read from the SESSION_CACHE_ALIAS cache and only fall back to
+django_session when an entry is missing. A modified session is written to
+the cache on every save, but to the database at most once per
+SESSION_WRITEBACK_SECONDS, so a visitor paging through the catalog with a
+message or a cart summary in their session does not rewrite its row on
+every request. A new session, and any change to who is logged in, is
+written through at once, so the row always knows whose session it is; what
+a lost cache entry can take with it is at most the last few seconds of cart
+or message changes.
+
+All of this needs a cache every worker shares. With a process-local one
+(LocMemCache) a logout in one worker would leave the others serving the
+session from their own copies, so the engine then skips the cache and reads
+and writes django_session directly; lazy writeback with such a cache is a
+configuration error.
+
+clear_expired() deletes expired rows in small batches, each in its own
+transaction, so the cleanup job never holds the table for long.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router, transaction
+from django.utils import timezone
+
+from .caching import shared
+
+KEY_PREFIX = 'sample_django.sessions'
+
+
+def _auth(data):
+    return data.get(SESSION_KEY), data.get(HASH_SESSION_KEY)
+
+
+def shared_cache():
+    """Whether SESSION_CACHE_ALIAS is seen alike by every worker process"""
+    return shared(settings.SESSION_CACHE_ALIAS)
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._shared = shared_cache()
+        if settings.SESSION_WRITEBACK_SECONDS and not self._shared:
+            raise ImproperlyConfigured(
+                "SESSION_WRITEBACK_SECONDS needs a SESSION_CACHE_ALIAS cache shared by every process"
+            )
+        # When the DB row was last written and who it said was logged in
+        self._db_saved_at = None
+        self._db_auth = (None, None)
+
+    def load(self):
+        if not self._shared:
+            return DBStore.load(self)
+        try:
+            entry = self._cache.get(self.cache_key)
+        except Exception:
+            # Invalid key for the backend; treat as no session, as cached_db does
+            entry = None
+        if entry is not None:
+            data, self._db_saved_at, self._db_auth = entry
+            return data
+        s = self._get_session_from_db()
+        if not s:
+            return {}
+        data = self.decode(s.session_data)
+        self._db_saved_at, self._db_auth = time.time(), _auth(data)
+        self._cache.set(
+            self.cache_key, (data, self._db_saved_at, self._db_auth), self.get_expiry_age(expiry=s.expire_date)
+        )
+        return data
+
+    def _writeback_due(self, must_create):
+        return (
+            must_create
+            or self._db_saved_at is None
+            or _auth(self._session) != self._db_auth
+            or time.time() - self._db_saved_at >= settings.SESSION_WRITEBACK_SECONDS
+        )
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if not self._shared:
+            return DBStore.save(self, must_create)
+        if self._writeback_due(must_create):
+            DBStore.save(self, must_create)
+            self._db_saved_at, self._db_auth = time.time(), _auth(self._session)
+        self._cache.set(self.cache_key, (self._session, self._db_saved_at, self._db_auth), self.get_expiry_age())
+
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
+
+    @classmethod
+    def clear_expired(cls, batch_size=500, pause=0):
+        """Delete expired rows batch_size at a time; returns how many went"""
+        model = cls.get_model_class()
+        using = router.db_for_write(model)
+        deleted = 0
+        while True:
+            with transaction.atomic(using=using):
+                keys = list(
+                    model.objects.using(using).filter(expire_date__lt=timezone.now())
+                    .values_list('session_key', flat=True)[:batch_size]
+                )
+                if keys:
+                    model.objects.using(using).filter(session_key__in=keys).delete()
+            deleted += len(keys)
+            if len(keys) < batch_size:
+                return deleted
+            if pause:
+                # Let writers waiting on the database lock in between batches
+                time.sleep(pause)
@@ -0,0 +1,146 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Catagory, Product, AddCart, Promotion, UserProfile
+from . import auth_backend, catalog, db, search, facets, carts, pricing, promotions, thumbnails
+from .caching import bump_catalog_generation, bump_generation, PRICE_GENERATION_KEY
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Catagory)
+def forget_product_slugs(sender, **kwargs):
+    # A rename or hide can move or retire any slug pair, so drop them all
+    catalog.product_ids_by_slug.clear()
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Catagory)
+def expire_catalog_fragments(sender, **kwargs):
+    bump_catalog_generation()
+
+
+@receiver(post_save, sender=Catagory)
+def touch_category_products(sender, instance, created, **kwargs):
+    # Product cards link through the category slug and are keyed on the product's updated_at
+    if not created:
+        instance.product_set.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Catagory)
+def index_category(sender, instance, created, **kwargs):
+    # Name and visibility of the category are part of every product row
+    if not created:
+        search.index_products(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Product)
+def remember_facets(sender, instance, **kwargs):
+    # The row as stored, so post_save knows which counts the product leaves
+    before = None
+    if not instance._state.adding:
+        before = Product.objects.filter(pk=instance.pk).values(*facets.FACET_FIELDS).first()
+    instance._facet_keys = facets.facet_keys(before) if before else []
+    instance._selling_before = before['selling'] if before else None
+
+
+@receiver(post_save, sender=Product)
+def count_facets(sender, instance, **kwargs):
+    facets.move(getattr(instance, '_facet_keys', []), facets.product_keys(instance))
+
+
+@receiver(post_delete, sender=Product)
+def uncount_facets(sender, instance, **kwargs):
+    facets.move(facets.product_keys(instance), [])
+
+
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        carts.merge(request.session, user)
+
+
+@receiver(post_save, sender=Product)
+def reprice_carts(sender, instance, created, **kwargs):
+    # Cart summaries hold totals at the old price
+    if not created and getattr(instance, '_selling_before', instance.selling) != instance.selling:
+        bump_generation(PRICE_GENERATION_KEY)
+
+
+def _line_delta(instance, sign):
+    # Only when the product came along with the row; never query for it here
+    if not AddCart.product.is_cached(instance) or 'selling' in instance.product.get_deferred_fields():
+        return None
+    return sign, sign * instance.quantity, sign * pricing.line_total(instance.product.selling, instance.quantity)
+
+
+@receiver(post_save, sender=AddCart)
+def count_cart_line(sender, instance, created, **kwargs):
+    delta = _line_delta(instance, 1) if created else None
+    if delta:
+        transaction.on_commit(lambda: carts.adjust_summary(instance.user_id, *delta))
+    else:
+        # A changed quantity does not say what it was before; recount once
+        transaction.on_commit(lambda: carts.forget_summary(instance.user_id))
+
+
+@receiver(post_delete, sender=AddCart)
+def uncount_cart_line(sender, instance, **kwargs):
+    delta = _line_delta(instance, -1)
+    if delta:
+        transaction.on_commit(lambda: carts.adjust_summary(instance.user_id, *delta))
+    else:
+        transaction.on_commit(lambda: carts.forget_summary(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=Promotion)
+def recompile_promotions(sender, **kwargs):
+    transaction.on_commit(promotions.expire_plan)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Catagory)
+def make_thumbnails(sender, instance, **kwargs):
+    image = instance.product_image if sender is Product else instance.image
+    if image:
+        name = image.name
+        transaction.on_commit(lambda: thumbnails.schedule(name, done=lambda: thumbnails_made(name)))
+
+
+def thumbnails_made(name):
+    # Cards and pages cached meanwhile have no srcset; touching the rows re-renders their cards
+    now = timezone.now()
+    Product.objects.filter(product_image=name).update(updated_at=now)
+    Catagory.objects.filter(image=name).update(updated_at=now)
+    bump_catalog_generation()
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # Password, is_active and is_staff are read from the cached copy
+    auth_backend.forget_user(instance.pk)
+    auth_backend.forget_unknown(instance.username)
+
+
+@receiver(post_save, sender=UserProfile)
+def forget_unknown_contact(sender, instance, **kwargs):
+    auth_backend.forget_unknown(instance.contact_number)
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    db.configure(connection)
@@ -0,0 +1,173 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, F, IntegerField
+from django.utils import timezone
+
+from .models import Product, StockReservation
+from .caching import bump_catalog_generation
+from .db import retry_locked
+from . import facets
+
+
+class OutOfStock(Exception):
+    """Raised when one or more products cannot cover the requested quantity"""
+
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__("Not enough stock for product(s) %s" % self.product_ids)
+
+
+class _Short(Exception):
+    pass
+
+
+def reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+
+
+def merge_lines(lines):
+    """Normalise {product_id: qty} or (product_id, qty) pairs, summing repeats"""
+    if hasattr(lines, 'items'):
+        lines = lines.items()
+    merged = Counter()
+    for product_id, quantity in lines:
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        merged[int(product_id)] += quantity
+    return dict(merged)
+
+
+def cart_lines(cart_items):
+    """Stock lines for a queryset or list of AddCart rows"""
+    return merge_lines((item.product_id, item.quantity) for item in cart_items)
+
+
+def _per_product(lines):
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in lines.items()],
+        output_field=IntegerField(),
+    )
+
+
+def _stock_moved(category_ids, in_stock):
+    # Only once the quantities are committed, so a rolled-back order leaves caches alone.
+    # Robust callbacks: the stock has moved by now, so a failure here must not
+    # make the caller think it did not (rebuild_facet_counts repairs the counts).
+    facets.stock_moved(category_ids, in_stock)
+    bump_catalog_generation()
+
+
+def max_order_quantity():
+    return getattr(settings, 'MAX_ORDER_QUANTITY', 10)
+
+
+def reserve(lines):
+    """
+    Take every line out of stock in a single conditional UPDATE.
+
+    The WHERE clause only matches rows that still hold enough stock, so the
+    check and the decrement cannot be interleaved with another buyer. If any
+    line misses, the whole statement is rolled back and OutOfStock names the
+    products that could not be covered.
+    """
+    lines = merge_lines(lines)
+    if not lines:
+        return
+    quantity = _per_product(lines)
+    try:
+        with transaction.atomic():
+            # updated_at too: cached product cards are keyed on it
+            updated = Product.objects.filter(id__in=lines, quantity__gte=quantity).update(
+                quantity=F('quantity') - quantity, updated_at=timezone.now()
+            )
+            if updated != len(lines):
+                raise _Short
+            # Cached pages and the in-stock facet follow quantity, which UPDATE
+            # does not signal. Every line had stock before, so these just ran out.
+            sold_out = list(
+                Product.objects.filter(id__in=lines, quantity__lte=0).values_list('category_id', flat=True)
+            )
+            if sold_out:
+                transaction.on_commit(lambda: _stock_moved(sold_out, in_stock=False), robust=True)
+    except _Short:
+        # Only look up the offenders once the partial update is rolled back
+        available = dict(Product.objects.filter(id__in=lines).values_list('id', 'quantity'))
+        raise OutOfStock(pid for pid, qty in lines.items() if available.get(pid, 0) < qty)
+
+
+def restock(lines):
+    """Put quantities back into stock in a single UPDATE"""
+    lines = merge_lines(lines)
+    if lines:
+        back_in_stock = [
+            category_id
+            for pid, category_id, quantity in Product.objects.filter(id__in=lines, quantity__lte=0)
+            .values_list('id', 'category_id', 'quantity')
+            if quantity + lines[pid] > 0
+        ]
+        Product.objects.filter(id__in=lines).update(
+            quantity=F('quantity') + _per_product(lines), updated_at=timezone.now()
+        )
+        if back_in_stock:
+            transaction.on_commit(lambda: _stock_moved(back_in_stock, in_stock=True), robust=True)
+
+
+def _release(reservations):
+    reservations = list(reservations.select_for_update().values_list('id', 'product_id', 'quantity'))
+    if not reservations:
+        return 0
+    StockReservation.objects.filter(id__in=[r[0] for r in reservations]).delete()
+    restock((product_id, quantity) for _, product_id, quantity in reservations)
+    return len(reservations)
+
+
+def release_holds(user):
+    """Return all of a user's held stock to the shelf"""
+    with transaction.atomic():
+        return _release(StockReservation.objects.filter(user=user))
+
+
+def release_expired(now=None):
+    """Return every expired hold to stock; safe to run from cron"""
+    with transaction.atomic():
+        return _release(StockReservation.objects.filter(expires_at__lte=now or timezone.now()))
+
+
+@retry_locked
+def hold(user, lines, ttl=None):
+    """
+    Set aside stock for a user while they fill in the checkout form.
+
+    Any earlier holds of the same user are replaced. Holds that are not
+    turned into an order by purchase() go back into stock once they expire.
+    No line may hold more than MAX_ORDER_QUANTITY, so nobody can take a
+    product off sale by holding all of it.
+    """
+    lines = merge_lines(lines)
+    if any(quantity > max_order_quantity() for quantity in lines.values()):
+        raise ValueError("Quantity is above the per-order limit")
+    expires_at = timezone.now() + (ttl or reservation_ttl())
+    with transaction.atomic():
+        release_expired()
+        _release(StockReservation.objects.filter(user=user))
+        reserve(lines)
+        StockReservation.objects.bulk_create([
+            StockReservation(user=user, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in lines.items()
+        ])
+
+
+def purchase(user, lines):
+    """
+    Commit lines as sold, consuming the user's holds.
+
+    Must run inside the same transaction that writes the order so that a
+    failed order puts the stock back.
+    """
+    with transaction.atomic():
+        _release(StockReservation.objects.filter(user=user))
+        reserve(lines)
@@ -0,0 +1,71 @@
+"""
+Content-addressed storage for uploaded images.
+
+A file is stored under the SHA-256 of its bytes, sharded two levels deep so
+no directory grows too large: upload/3f/a2/3fa2...e1.jpeg. Uploading bytes
+that are already stored writes nothing and returns the existing name, so
+identical images are kept once however often they are uploaded. Since a
+name can only ever hold one content, files under it are served as
+immutable.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage, storages
+
+PREFIX = 'upload'
+# A year, the most HTTP caches honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+_HASHED = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:-\d+w)?\.\w+$')
+
+
+def digest(content):
+    """SHA-256 of a file's content, leaving it rewound for whoever reads it next"""
+    sha = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks() if hasattr(content, 'chunks') else iter(lambda: content.read(65536), b''):
+        sha.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()
+
+
+def hashed_name(name, sha):
+    extension = os.path.splitext(name)[1].lower()
+    return '%s/%s/%s/%s%s' % (PREFIX, sha[:2], sha[2:4], sha, extension)
+
+
+def is_hashed(name):
+    """Whether name is content-addressed, itself or as a thumbnail of one"""
+    return bool(name and _HASHED.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by their content and stores each content once"""
+
+    def save(self, name, content, max_length=None):
+        name = hashed_name(name or content.name, digest(content))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # The name is the content, so there is never another file to avoid
+        return name
+
+    def _save(self, name, content):
+        # Write beside the final name and rename into place, so a concurrent
+        # save of the same bytes or a reader never sees a partial file
+        temporary = '%s.%s.part' % (name, uuid.uuid4().hex)
+        super()._save(temporary, content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+def upload_storage():
+    """The storage ImageFields save to; STORAGES['uploads'] in settings"""
+    return storages['uploads']
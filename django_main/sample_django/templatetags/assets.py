@@ -0,0 +1,23 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from sample_django import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendor_asset(name):
+    """
+    {% vendor_asset 'bootstrap.css' %}
+
+    A <link> or <script> for a third-party asset: the copy vendored by the
+    vendor_assets command, or the pinned CDN file until it has been run.
+    """
+    asset = assets.VENDOR[name]
+    url = static(asset.path) if assets.is_vendored(name) else asset.url
+    integrity = format_html(' integrity="{}" crossorigin="anonymous"', asset.integrity) if asset.integrity else ''
+    if asset.path.endswith('.css'):
+        return format_html('<link rel="stylesheet" href="{}"{}>', url, integrity)
+    return format_html('<script src="{}"{}></script>', url, integrity)
@@ -0,0 +1,30 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from sample_django import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', **attrs):
+    """
+    {% responsive_image product.product_image sizes="25vw" alt=product.name class="card-img-top" %}
+
+    A <picture> with WebP and JPEG srcsets over the thumbnails of an
+    ImageField file, or a plain <img> of the original until they are made.
+    """
+    attrs.setdefault('loading', 'lazy')
+    extra = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+    if not image:
+        return ''
+    if not thumbnails.is_ready(image.name):
+        return format_html('<img src="{}" {}>', image.url, extra)
+    fallback = default_storage.url(thumbnails.variant_name(image.name, thumbnails.WIDTHS[1], 'jpg'))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" {}></picture>',
+        thumbnails.srcset(image.name, 'webp'), sizes,
+        fallback, thumbnails.srcset(image.name, 'jpg'), sizes, extra,
+    )
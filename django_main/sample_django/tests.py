@@ -1,3 +1,1607 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import multiprocessing
+import shutil
+import sqlite3
+import tempfile
+import os
+import threading
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.db import connection, connections, transaction, OperationalError
+from django.db.models import F, Sum
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.template import Context, Template
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .models import (
+    Catagory, Product, AddCart, Order, OrderItem, StockReservation, Favourite, CustomerFeedback, Promotion,
+    UserProfile, CacheGeneration,
+)
+from . import stock, orders, catalog, search, facets, carts, pricing, promotions, thumbnails
+from . import storage as uploads, assets, auth_backend, db, hashers, ratelimit, routers
+from .Register import CustomUserForm
+from .management.commands import sync_replica
+from .sessions import SessionStore
+from .caching import bump_catalog_generation, catalog_generation
+from .order_numbers import SnowflakeAllocator, get_allocator
+from .pagination import keyset_page, PAGE_SIZE
+
+
+def make_category(name='Shoes', **kwargs):
+    return Catagory.objects.create(name=name, description='desc', image='static/upload/c.jpg', **kwargs)
+
+
+def make_product(category, name, **kwargs):
+    fields = {
+        'vendor': 'ACME',
+        'quantity': 10,
+        'original_price': 200,
+        'selling': 150,
+        'description': 'A product',
+        'product_image': 'static/upload/p.jpg',
+    }
+    fields.update(kwargs)
+    return Product.objects.create(category=category, name=name, **fields)
+
+
+def share_cache(test):
+    """Swap the default cache for a file cache, which every worker process would share"""
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location, ignore_errors=True)
+    override = override_settings(CACHES=dict(settings.CACHES, default={
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+    }))
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+class NPlusOneMixin:
+    """Fails a test when a view issues more queries as its result set grows"""
+
+    def assertConstantQueries(self, url, grow):
+        # Warm up so one-off work (session creation, checkout holds) is not counted
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        grow()
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+        self.assertEqual(
+            len(small), len(large),
+            "%s went from %d to %d queries as results grew" % (url, len(small), len(large))
+        )
+
+
+class CatalogQueryTests(NPlusOneMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.categories = [make_category('Shoes'), make_category('Bags')]
+        for i in range(2):
+            make_product(self.categories[i % 2], 'p%d' % i, trending=True)
+        # Logged in so the anonymous page cache does not hide the queries
+        self.login()
+
+    def add_products(self, count=6):
+        start = Product.objects.count()
+        for i in range(start, start + count):
+            make_product(self.categories[i % 2], 'p%d' % i, trending=True)
+
+    def login(self):
+        self.client.login(username='buyer', password='secret-pass-123')
+
+    def test_home(self):
+        self.assertConstantQueries(reverse('home'), self.add_products)
+
+    def test_collections(self):
+        self.assertConstantQueries(reverse('collections'), lambda: make_category('Hats'))
+
+    def test_collectionsview(self):
+        self.assertConstantQueries(reverse('collections', args=['shoes']), self.add_products)
+
+    def test_cart(self):
+        self.login()
+
+        def grow():
+            for product in Product.objects.exclude(addcart__user=self.user):
+                AddCart.objects.create(user=self.user, product=product, quantity=1)
+            self.add_products()
+            for product in Product.objects.exclude(addcart__user=self.user):
+                AddCart.objects.create(user=self.user, product=product, quantity=1)
+
+        self.assertConstantQueries(reverse('cart'), grow)
+
+    def test_checkout(self):
+        self.login()
+        for product in Product.objects.all():
+            AddCart.objects.create(user=self.user, product=product, quantity=1)
+
+        def grow():
+            self.add_products()
+            for product in Product.objects.exclude(addcart__user=self.user):
+                AddCart.objects.create(user=self.user, product=product, quantity=1)
+
+        self.assertConstantQueries(reverse('checkout'), grow)
+
+    def test_order_confirmation(self):
+        self.login()
+        order = Order.objects.create(
+            user=self.user, order_number='ORD-T-1', total_amount=0, shipping_address='1, Main St'
+        )
+
+        def grow():
+            self.add_products()
+            for product in Product.objects.exclude(orderitem__order=order):
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.selling)
+
+        grow()
+        self.assertConstantQueries(reverse('order_confirmation', args=[order.id]), grow)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = make_category('Shoes')
+        for i in range(PAGE_SIZE * 2 + 3):
+            make_product(category, 'p%d' % i)
+
+    def test_walks_every_product_once(self):
+        seen, cursor = [], None
+        while True:
+            items, cursor = keyset_page(Product.objects.all(), cursor, size=10)
+            seen.extend(p.id for p in items)
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), sorted(Product.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_home_renders_one_page(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(len(response.context['products']), PAGE_SIZE)
+        cursor = response.context['next_cursor']
+        response = self.client.get(reverse('home'), {'after': cursor})
+        self.assertEqual(len(response.context['products']), PAGE_SIZE)
+
+    def test_feed(self):
+        data = self.client.get(reverse('product_feed'), {'category': 'shoes', 'size': 5}).json()
+        self.assertEqual(len(data['products']), 5)
+        more = self.client.get(reverse('product_feed'), {'category': 'shoes', 'after': data['next']}).json()
+        self.assertNotIn(data['products'][0]['id'], [p['id'] for p in more['products']])
+
+    def test_feed_rejects_bad_cursor(self):
+        response = self.client.get(reverse('product_feed'), {'after': 'nonsense'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        category = make_category()
+        self.a = make_product(category, 'a', quantity=5)
+        self.b = make_product(category, 'b', quantity=1)
+
+    def quantities(self):
+        return dict(Product.objects.values_list('name', 'quantity'))
+
+    def test_reserve_is_all_or_nothing(self):
+        with self.assertRaises(stock.OutOfStock) as caught:
+            stock.reserve({self.a.id: 3, self.b.id: 2})
+        self.assertEqual(caught.exception.product_ids, [self.b.id])
+        self.assertEqual(self.quantities(), {'a': 5, 'b': 1})
+        stock.reserve({self.a.id: 3, self.b.id: 1})
+        self.assertEqual(self.quantities(), {'a': 2, 'b': 0})
+
+    def test_hold_replaces_and_expires(self):
+        stock.hold(self.user, {self.a.id: 2})
+        stock.hold(self.user, {self.a.id: 3})
+        self.assertEqual(self.quantities()['a'], 2)
+        self.assertEqual(stock.release_expired(timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(self.quantities()['a'], 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_purchase_consumes_hold(self):
+        stock.hold(self.user, {self.a.id: 5})
+        stock.purchase(self.user, {self.a.id: 5})
+        self.assertEqual(self.quantities()['a'], 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_only_an_explicit_post_holds_stock(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('checkout_buy_now', args=[self.a.id, 5])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('checkout_hold')).status_code, 302)
+        self.assertFalse(StockReservation.objects.exists())
+
+        response = self.client.post(reverse('checkout_hold'), {'product_id': self.a.id, 'quantity': 2})
+        self.assertRedirects(response, reverse('checkout_buy_now', args=[self.a.id, 2]))
+        self.assertEqual(self.quantities()['a'], 3)
+
+    @override_settings(MAX_ORDER_QUANTITY=3)
+    def test_holds_are_capped_per_order(self):
+        with self.assertRaises(ValueError):
+            stock.hold(self.user, {self.a.id: 4})
+        self.client.force_login(self.user)
+        self.client.post(reverse('checkout_hold'), {'product_id': self.a.id, 'quantity': 4})
+        self.assertEqual(self.quantities()['a'], 5)
+        self.assertEqual(self.client.get(reverse('checkout_buy_now', args=[self.a.id, 4])).status_code, 302)
+
+    def test_rolled_back_sell_out_leaves_caches_alone(self):
+        generation = catalog_generation()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                stock.reserve({self.b.id: 1})
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(catalog_generation(), generation)
+        self.assertEqual(self.quantities()['b'], 1)
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    buyers = 24
+    stock_level = 10
+
+    def test_parallel_checkout_never_oversells(self):
+        product = make_product(make_category(), 'hot', quantity=self.stock_level)
+        users = [User.objects.create_user('buyer%d' % n) for n in range(self.buyers)]
+        AddCart.objects.bulk_create([AddCart(user=user, product=product, quantity=1) for user in users])
+        barrier = threading.Barrier(self.buyers)
+        placed = []
+
+        def buy(user, holds_first):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        # Half check out straight from the cart, half hold stock at the form first
+                        if holds_first:
+                            stock.hold(user, {product.id: 1})
+                        placed.append(orders.place_cart_order(user, shipping_address='1, Main St'))
+                        return
+                    except stock.OutOfStock:
+                        return
+                    except OperationalError:
+                        # Still locked once retry_locked gave up; start this checkout over
+                        continue
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy, args=(user, n % 2)) for n, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertGreaterEqual(product.quantity, 0)
+        self.assertEqual(len(placed), self.stock_level)
+        self.assertEqual(Order.objects.count(), self.stock_level)
+        # Every unit taken off the shelf went into exactly one order
+        sold = OrderItem.objects.aggregate(units=Sum('quantity'))['units']
+        self.assertEqual((sold, product.quantity), (self.stock_level, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class OrderPlacementTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.client.login(username='buyer', password='secret-pass-123')
+        self.category = make_category()
+
+    def fill_cart(self, lines):
+        AddCart.objects.filter(user=self.user).delete()
+        for i in range(lines):
+            product = make_product(self.category, 'p%d-%d' % (lines, i), quantity=5, selling=10 + i)
+            AddCart.objects.create(user=self.user, product=product, quantity=2)
+
+    def checkout_queries(self, lines):
+        self.fill_cart(lines)
+        # Compiled once per process when promotions change, not per checkout
+        promotions.plan()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('checkout'), {'shipping_address': '1, Main St'})
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_query_count_independent_of_cart_size(self):
+        self.assertEqual(self.checkout_queries(5), self.checkout_queries(50))
+
+    def test_cart_order(self):
+        self.fill_cart(3)
+        order = orders.place_cart_order(self.user, shipping_address='1, Main St')
+        self.assertEqual(order.total_amount, (10 + 11 + 12) * 2)
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(AddCart.objects.filter(user=self.user).exists())
+        self.assertEqual(set(Product.objects.values_list('quantity', flat=True)), {3})
+
+    def test_empty_cart(self):
+        with self.assertRaises(orders.EmptyOrder):
+            orders.place_cart_order(self.user, shipping_address='1, Main St')
+
+    def test_reorder_leaves_the_customers_holds(self):
+        self.fill_cart(1)
+        product = Product.objects.get()
+        order = orders.place_cart_order(self.user, shipping_address='1, Main St')
+        stock.hold(self.user, {product.id: 1})
+        again = orders.reorder(order)
+        self.assertEqual(again.shipping_address, '1, Main St')
+        self.assertEqual(list(StockReservation.objects.values_list('product_id', 'quantity')), [(product.id, 1)])
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 5 - 2 - 1 - 2)
+
+    def test_refresh_total(self):
+        self.fill_cart(2)
+        order = orders.place_cart_order(self.user, shipping_address='1, Main St')
+        order.items.update(quantity=1)
+        self.assertEqual(orders.refresh_total(order), 21)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, 21)
+
+
+def _order_numbers(count):
+    allocate = get_allocator()
+    return [allocate() for _ in range(count)]
+
+
+class OrderNumberTests(TestCase):
+    def test_numbers_are_sortable_and_fit_the_column(self):
+        allocate = SnowflakeAllocator(node_id=3)
+        numbers = [allocate() for _ in range(5000)]
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(len(set(numbers)), len(numbers))
+        max_length = Order._meta.get_field('order_number').max_length
+        self.assertTrue(all(len(n) <= max_length for n in numbers))
+
+    def test_sequence_overflow_moves_to_next_millisecond(self):
+        allocate = SnowflakeAllocator()
+        first = allocate.next_int()
+        ids = [allocate.next_int() for _ in range(1000)]
+        self.assertEqual(len(set(ids + [first])), 1001)
+        self.assertEqual(ids, sorted(ids))
+
+    def test_no_collisions_across_processes(self):
+        get_allocator()
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            batches = pool.map(_order_numbers, [20000] * 4)
+        numbers = [n for batch in batches for n in batch]
+        self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_same_second_orders_do_not_clash(self):
+        user = User.objects.create_user('buyer')
+        product = make_product(make_category(), 'a', quantity=10)
+        first = orders.place_order(user, [(product.id, 1, 5)], shipping_address='1, Main St')
+        second = orders.place_order(user, [(product.id, 1, 5)], shipping_address='1, Main St')
+        self.assertNotEqual(first.order_number, second.order_number)
+        self.assertLess(first.order_number, second.order_number)
+
+
+class IndexUsageTests(TestCase):
+    """Runs EXPLAIN QUERY PLAN over every filtered query a view issues"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123', is_staff=True)
+        self.client.login(username='staff', password='secret-pass-123')
+        category = make_category('Shoes')
+        product = make_product(category, 'a', trending=True)
+        AddCart.objects.create(user=self.user, product=product, quantity=1)
+        Favourite.objects.create(user=self.user, product=product)
+        Order.objects.create(user=self.user, order_number='ORD-T-1', total_amount=1, shipping_address='1, Main St')
+        CustomerFeedback.objects.create(name='n', email='e@x.com', subject='s', message='m')
+
+    def assertUsesIndexes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or ' WHERE ' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            scans = [step for step in plan if step.startswith('SCAN sample_django_') and 'USING' not in step]
+            self.assertFalse(scans, "%s scans a table without an index:\n%s\n%s" % (url, sql, plan))
+
+    def test_catalog_views(self):
+        self.assertUsesIndexes(reverse('home'))
+        self.assertUsesIndexes(reverse('collections'))
+        self.assertUsesIndexes(reverse('collections', args=['shoes']))
+        self.assertUsesIndexes(reverse('collections', args=['shoes']) + '?sort=price_asc&in_stock=1')
+        self.assertUsesIndexes(reverse('collections', args=['shoes']) + '?vendor=ACME&discount=10')
+        self.assertUsesIndexes(reverse('product_details', args=['shoes', 'a']))
+
+    def test_user_views(self):
+        self.assertUsesIndexes(reverse('cart'))
+        self.assertUsesIndexes(reverse('favourites'))
+        self.assertUsesIndexes(reverse('my_orders'))
+        self.assertUsesIndexes(reverse('admin_feedback_list'))
+
+
+class DuplicateInsertTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.client.login(username='buyer', password='secret-pass-123')
+        self.product = make_product(make_category(), 'a')
+
+    def post(self, name, body):
+        return self.client.post(
+            reverse(name), json.dumps(body), content_type='application/json',
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ).json()['status']
+
+    def test_add_to_cart_twice(self):
+        body = {'pid': self.product.id, 'product_qty': 1}
+        self.assertEqual(self.post('addtocart', body), "Product added to cart")
+        self.assertEqual(self.post('addtocart', body), "Product already in cart")
+        self.assertEqual(AddCart.objects.count(), 1)
+
+    def test_favourite_twice(self):
+        body = {'pid': self.product.id}
+        self.assertEqual(self.post('fav_page', body), "Product added to favourites")
+        self.assertEqual(self.post('fav_page', body), "Product already in favourites")
+        self.assertEqual(Favourite.objects.count(), 1)
+
+
+class SlugRoutingTests(TestCase):
+    def setUp(self):
+        self.category = make_category('Running Shoes')
+        self.product = make_product(self.category, 'Trail Runner 2')
+        catalog.product_ids_by_slug.clear()
+
+    def test_slugs_are_generated_and_unique(self):
+        self.assertEqual(self.category.slug, 'running-shoes')
+        self.assertEqual(self.product.slug, 'trail-runner-2')
+        twin = make_product(self.category, 'Trail Runner 2')
+        self.assertEqual(twin.slug, 'trail-runner-2-2')
+        other = make_product(make_category('Boots'), 'Trail Runner 2')
+        self.assertEqual(other.slug, 'trail-runner-2')
+
+    def test_lookup_is_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(catalog.product_by_slugs('running-shoes', 'trail-runner-2'), self.product)
+        self.assertEqual(len(catalog.product_ids_by_slug), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(catalog.product_by_slugs('running-shoes', 'trail-runner-2'), self.product)
+
+    def test_product_scoped_to_category(self):
+        make_category('Boots')
+        self.assertIsNone(catalog.product_by_slugs('boots', 'trail-runner-2'))
+
+    def test_save_invalidates_cache(self):
+        catalog.product_by_slugs('running-shoes', 'trail-runner-2')
+        self.product.status = True
+        self.product.save()
+        self.assertEqual(len(catalog.product_ids_by_slug), 0)
+        self.assertIsNone(catalog.product_by_slugs('running-shoes', 'trail-runner-2'))
+
+    def test_stale_entry_is_dropped(self):
+        catalog.product_ids_by_slug.set(('running-shoes', 'gone'), self.product.pk)
+        self.assertIsNone(catalog.product_by_slugs('running-shoes', 'gone'))
+        self.assertIsNone(catalog.product_ids_by_slug.get(('running-shoes', 'gone')))
+
+    def test_detail_page(self):
+        response = self.client.get(self.product.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['products'], self.product)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = make_category('Shoes')
+        self.product = make_product(self.category, 'Old Name')
+
+    def test_cards_are_cached(self):
+        self.client.get(reverse('home'))
+        Product.objects.filter(pk=self.product.pk).update(description='changed behind the cache')
+        self.assertNotContains(self.client.get(reverse('home')), 'changed behind the cache')
+
+    def test_product_save_invalidates_card(self):
+        self.client.get(reverse('home'))
+        self.product.name = 'New Name'
+        self.product.save()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'New Name')
+        self.assertNotContains(response, 'Old Name')
+
+    def test_generations_agree_between_processes(self):
+        before = catalog_generation()
+        bump_catalog_generation()
+        # Another process has its own LocMemCache; the generation it sees is the same
+        cache.clear()
+        self.assertEqual(catalog_generation(), before + 1)
+        shared = dict(settings.CACHES, default={'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                 'LOCATION': tempfile.mkdtemp()})
+        self.addCleanup(shutil.rmtree, shared['default']['LOCATION'], ignore_errors=True)
+        with override_settings(CACHES=shared), self.assertNumQueries(0):
+            self.assertEqual(bump_catalog_generation(), catalog_generation())
+
+    def test_category_save_invalidates_card(self):
+        self.client.get(reverse('home'))
+        self.category.slug = 'sneakers'
+        self.category.save()
+        self.assertContains(self.client.get(reverse('home')), '/collections/sneakers/old-name/')
+
+    def test_other_writes_keep_card(self):
+        self.client.get(reverse('home'))
+        Product.objects.filter(pk=self.product.pk).update(description='changed behind the cache')
+        make_product(self.category, 'Another')
+        bump_catalog_generation()
+        self.assertNotContains(self.client.get(reverse('home')), 'changed behind the cache')
+
+    def test_stock_changes_refresh_card(self):
+        before = self.product.updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.reserve({self.product.id: 1})
+        reserved = Product.objects.get(pk=self.product.pk).updated_at
+        self.assertGreater(reserved, before)
+        stock.restock({self.product.id: 1})
+        self.assertGreater(Product.objects.get(pk=self.product.pk).updated_at, reserved)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(make_category('Shoes'), 'a')
+        User.objects.create_user('buyer', password='secret-pass-123')
+
+    def test_anonymous_hits_are_served_from_cache(self):
+        first = self.client.get(reverse('home'))
+        self.assertEqual(first.status_code, 200)
+        # Only the catalog generation, which lives in the DB while the cache is per process
+        with self.assertNumQueries(1):
+            second = self.client.get(reverse('home'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Cookie', second['Vary'])
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.product.get_absolute_url())['ETag']
+        response = self.client.get(self.product.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_catalog_write_expires_pages(self):
+        self.client.get(reverse('home'))
+        self.product.name = 'Renamed'
+        self.product.save()
+        self.assertContains(self.client.get(reverse('home')), 'Renamed')
+
+    def test_selling_out_expires_pages(self):
+        self.client.get(self.product.get_absolute_url())
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.reserve({self.product.id: self.product.quantity})
+        self.assertContains(self.client.get(self.product.get_absolute_url()), 'Out of Stock')
+
+    def test_authenticated_users_bypass_cache(self):
+        self.client.get(reverse('home'))
+        self.client.login(username='buyer', password='secret-pass-123')
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'buyer')
+        self.assertIsNotNone(response.context)
+
+    def test_pending_messages_bypass_cache(self):
+        self.client.get(reverse('collections'))
+        # Unknown category: flashes a warning and redirects to collections
+        response = self.client.get(reverse('collections', args=['nope']), follow=True)
+        self.assertIsNotNone(response.context)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.shoes = make_category('Footwear')
+        self.runner = make_product(self.shoes, 'Trail Runner', vendor='Asics', description='Grippy sole')
+        self.boot = make_product(self.shoes, 'Hiking Boot', vendor='Merrell', description='For trail hiking')
+        make_product(make_category('Watches'), 'Smart Watch', vendor='Noise')
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(search.search('trail'), [self.runner, self.boot])
+
+    def test_prefix_and_category(self):
+        self.assertEqual(search.suggest('hik'), ['Hiking Boot'])
+        self.assertEqual(len(search.search('footwear')), 2)
+        self.assertEqual(search.search('asics runner'), [self.runner])
+
+    def test_index_follows_writes(self):
+        self.runner.name = 'Road Racer'
+        self.runner.save()
+        self.assertEqual(search.suggest('road'), ['Road Racer'])
+        self.assertEqual(search.search('trail'), [self.boot])
+
+        self.boot.status = True
+        self.boot.save()
+        self.assertEqual(search.search('hiking'), [])
+
+        self.shoes.name = 'Sneakers'
+        self.shoes.save()
+        self.assertEqual(search.search('sneakers'), [self.runner])
+
+        self.runner.delete()
+        self.assertEqual(search.search('road'), [])
+
+    def test_views(self):
+        response = self.client.get(reverse('search'), {'q': 'watch'})
+        self.assertContains(response, 'Smart Watch')
+        data = self.client.get(reverse('search_suggest'), {'q': 'sm'}).json()
+        self.assertEqual(data['suggestions'], ['Smart Watch'])
+        self.assertEqual(search.search('"); DROP TABLE x; --'), [])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        self.shoes = make_category('Shoes')
+        self.cheap = make_product(self.shoes, 'Flip Flop', vendor='Bata', selling=100, original_price=200, quantity=1)
+        self.mid = make_product(self.shoes, 'Runner', vendor='Asics', selling=800, original_price=850, trending=True)
+        self.dear = make_product(self.shoes, 'Boot', vendor='Asics', selling=3000, original_price=4000, quantity=0)
+
+    def stored(self):
+        return facets.counts(self.shoes)
+
+    def test_counts_follow_writes(self):
+        counted = self.stored()
+        self.assertEqual(counted['vendor'], {'Asics': 2, 'Bata': 1})
+        self.assertEqual(counted['price'], {'0': 1, '500': 1, '2500': 1})
+        self.assertEqual(counted['discount'], {'0': 1, '25': 1, '50': 1})
+        self.assertEqual(counted['stock'], {'in': 2, 'out': 1})
+
+        self.mid.vendor = 'Bata'
+        self.mid.save()
+        self.dear.delete()
+        counted = self.stored()
+        self.assertEqual(counted['vendor'], {'Bata': 2})
+        self.assertEqual(counted['stock'], {'in': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.reserve({self.cheap.id: 1})
+        self.assertEqual(self.stored()['stock'], {'in': 1, 'out': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.restock({self.cheap.id: 1})
+        self.assertEqual(self.stored()['stock'], {'in': 2})
+
+        incremental = self.stored()
+        facets.rebuild()
+        self.assertEqual(self.stored(), incremental)
+
+    def test_filters_and_sorting(self):
+        url = reverse('product_feed')
+
+        def names(**params):
+            data = self.client.get(url, dict(category='shoes', **params)).json()
+            return [p['name'] for p in data['products']]
+
+        self.assertEqual(names(sort='price_asc'), ['Flip Flop', 'Runner', 'Boot'])
+        self.assertEqual(names(sort='price_desc'), ['Boot', 'Runner', 'Flip Flop'])
+        self.assertEqual(names(sort='discount'), ['Flip Flop', 'Boot', 'Runner'])
+        self.assertEqual(names(min_price=500, max_price=1000), ['Runner'])
+        self.assertEqual(names(price='2500-5000'), ['Boot'])
+        self.assertEqual(names(vendor='Asics', in_stock=1), ['Runner'])
+        self.assertEqual(names(trending=1), ['Runner'])
+        self.assertEqual(names(discount=25, sort='price_asc'), ['Flip Flop', 'Boot'])
+        self.assertEqual(names(min_price='abc', sort='bogus'), ['Boot', 'Runner', 'Flip Flop'])
+
+    def test_sorted_pages_walk_every_product_once(self):
+        for i in range(7):
+            make_product(self.shoes, 'p%d' % i, selling=100 + i % 3, original_price=300)
+        for sort in ('price_asc', 'price_desc', 'discount'):
+            seen, cursor = [], None
+            while True:
+                params = {'category': 'shoes', 'sort': sort, 'size': 3}
+                if cursor:
+                    params['after'] = cursor
+                data = self.client.get(reverse('product_feed'), params).json()
+                seen += [p['id'] for p in data['products']]
+                cursor = data['next']
+                if not cursor:
+                    break
+            self.assertEqual(len(seen), 10, sort)
+            self.assertEqual(len(set(seen)), 10, sort)
+
+    def test_page_reads_counts_without_counting(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('collections', args=['shoes']), {'vendor': 'Asics'})
+        self.assertContains(response, 'Asics (2)')
+        self.assertContains(response, 'In stock (2)')
+        self.assertNotContains(response, 'Flip Flop')
+        self.assertFalse([q for q in queries.captured_queries if 'COUNT(' in q['sql']])
+        self.assertIn('vendor=Asics', response.context['filter_query'])
+
+
+class AsyncEndpointTests(TestCase):
+    """The cart and favourites endpoints as an ASGI server runs them"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.product = make_product(make_category(), 'a')
+
+    async def post(self, name, body):
+        response = await self.async_client.post(
+            reverse(name), json.dumps(body), content_type='application/json',
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+        return response.status_code, response.json()['status']
+
+    async def test_add_and_remove(self):
+        self.assertEqual(await self.post('fav_page', {'pid': self.product.id}), (403, "Login to add to favourites"))
+        await self.async_client.aforce_login(self.user)
+
+        body = {'pid': self.product.id, 'product_qty': 2}
+        self.assertEqual(await self.post('addtocart', body), (200, "Product added to cart"))
+        self.assertEqual(await self.post('addtocart', body), (200, "Product already in cart"))
+        self.assertEqual(await self.post('addtocart', {'pid': 0}), (404, "Product not found"))
+        self.assertEqual(await self.post('addtocart', {'pid': 'x'}), (400, "Invalid data"))
+        self.assertEqual(await self.post('fav_page', body), (200, "Product added to favourites"))
+        self.assertEqual(await self.post('fav_page', body), (200, "Product already in favourites"))
+
+        item = await AddCart.objects.aget(user=self.user)
+        favourite = await Favourite.objects.aget(user=self.user)
+        response = await self.async_client.get(reverse('remove_from_cart', args=[item.id]))
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        response = await self.async_client.get(reverse('remove_from_favourites', args=[favourite.id]))
+        self.assertRedirects(response, reverse('favourites'), fetch_redirect_response=False)
+        self.assertFalse(await AddCart.objects.aexists())
+        self.assertFalse(await Favourite.objects.aexists())
+
+    async def test_cannot_remove_other_users_rows(self):
+        other = await User.objects.acreate(username='other')
+        item = await AddCart.objects.acreate(user=other, product=self.product, quantity=1)
+        favourite = await Favourite.objects.acreate(user=other, product=self.product)
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(reverse('remove_from_cart', args=[item.id]))
+        await self.async_client.get(reverse('remove_from_favourites', args=[favourite.id]))
+        self.assertEqual(await AddCart.objects.acount(), 1)
+        self.assertEqual(await Favourite.objects.acount(), 1)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        category = make_category()
+        self.a = make_product(category, 'a')
+        self.b = make_product(category, 'b')
+
+    def add(self, product, qty=1):
+        return self.client.post(
+            reverse('addtocart'), json.dumps({'pid': product.id, 'product_qty': qty}),
+            content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ).json()['status']
+
+    def test_guest_cart_never_touches_addcart(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.add(self.a, 2), "Product added to cart")
+            self.assertEqual(self.add(self.a), "Product already in cart")
+            self.add(self.b)
+            response = self.client.get(reverse('cart'))
+        self.assertFalse([q for q in queries.captured_queries if 'sample_django_addcart' in q['sql']])
+        self.assertEqual([(item.product, item.quantity) for item in response.context['cart']], [(self.a, 2), (self.b, 1)])
+
+        self.client.get(reverse('remove_from_cart', args=[self.a.id]))
+        self.assertEqual(carts.guest_lines(self.client.session), {self.b.id: 1})
+
+    def test_login_merges_in_one_upsert(self):
+        AddCart.objects.create(user=self.user, product=self.a, quantity=5)
+        gone = make_product(self.a.category, 'gone')
+        self.add(self.a, 2)
+        self.add(self.b, 3)
+        self.add(gone)
+        gone.delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret-pass-123'})
+        upserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "sample_django_addcart"')]
+        self.assertEqual(len(upserts), 1)
+        self.assertEqual(
+            dict(AddCart.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+            {self.a.id: 2, self.b.id: 3},
+        )
+        self.assertEqual(carts.guest_lines(self.client.session), {})
+
+
+class CartUpdateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.category = make_category()
+        self.products = [make_product(self.category, 'p%d' % i, quantity=5, selling=10) for i in range(6)]
+
+    def update(self, items):
+        return self.client.post(
+            reverse('update_cart'), json.dumps({'items': items}), content_type='application/json',
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+
+    def fill(self, products):
+        return [AddCart.objects.create(user=self.user, product=p, quantity=1) for p in products]
+
+    def test_batch_costs_the_same_as_one_change(self):
+        self.client.force_login(self.user)
+        items = self.fill(self.products)
+        promotions.plan()
+        with CaptureQueriesContext(connection) as one:
+            self.update({items[0].id: 2})
+        with CaptureQueriesContext(connection) as many:
+            response = self.update({items[1].id: 3, items[2].id: 4, items[3].id: 0, items[4].id: 0})
+        # The extra ones are the DELETE and the SELECT that feeds its signals
+        self.assertEqual(len(one) + 2, len(many))
+        data = response.json()
+        self.assertEqual((data['count'], data['quantity'], data['total']), (4, 10, '100.00'))
+        self.assertEqual(
+            dict(AddCart.objects.values_list('id', 'quantity')),
+            {items[0].id: 2, items[1].id: 3, items[2].id: 4, items[5].id: 1},
+        )
+
+    def test_over_stock_rejects_the_whole_batch(self):
+        self.client.force_login(self.user)
+        items = self.fill(self.products[:2])
+        other = AddCart.objects.create(user=User.objects.create_user('other'), product=self.products[0], quantity=1)
+        response = self.update({items[0].id: 2, items[1].id: 6})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['available'], {str(items[1].id): 5})
+        self.assertEqual(set(AddCart.objects.values_list('quantity', flat=True)), {1})
+
+        # Someone else's line is left alone
+        self.assertEqual(self.update({other.id: 3}).json()['count'], 2)
+        other.refresh_from_db()
+        self.assertEqual(other.quantity, 1)
+
+    @override_settings(MAX_ORDER_QUANTITY=3)
+    def test_quantities_are_capped_per_order(self):
+        items = self.fill(self.products[:2])
+        self.client.force_login(self.user)
+        response = self.update({items[0].id: 2, items[1].id: 4})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['available'], {str(items[1].id): 3})
+        self.assertEqual(set(AddCart.objects.values_list('quantity', flat=True)), {1})
+        self.assertEqual(self.update({items[1].id: 3}).status_code, 200)
+
+        self.client.logout()
+        self.client.post(
+            reverse('addtocart'), json.dumps({'pid': self.products[0].id, 'product_qty': 1}),
+            content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        response = self.update({self.products[0].id: 4})
+        self.assertEqual(response.json()['available'], {str(self.products[0].id): 3})
+        self.assertEqual(self.update({items[0].id: -1}).status_code, 400)
+
+    def test_guest_cart(self):
+        session = self.client.session
+        session[carts.SESSION_KEY] = {str(self.products[0].id): 1, str(self.products[1].id): 1}
+        session.save()
+        data = self.update({self.products[0].id: 3, self.products[1].id: 0}).json()
+        self.assertEqual(
+            data['items'], [{'id': self.products[0].id, 'quantity': 3, 'line_total': '30.00', 'discount': '0.00'}]
+        )
+        self.assertEqual(carts.guest_lines(self.client.session), {self.products[0].id: 3})
+        self.assertEqual(self.update({self.products[0].id: 9}).status_code, 409)
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        category = make_category()
+        self.a = make_product(category, 'a', selling=100)
+        self.b = make_product(category, 'b', selling=50)
+
+    def add(self, product, qty=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('addtocart'), json.dumps({'pid': product.id, 'product_qty': qty}),
+                content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+
+    def badge(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('collections'))
+        counted = [q for q in queries.captured_queries if 'sample_django_addcart' in q['sql']]
+        return response.context['cart_summary'], len(counted)
+
+    def test_summary_follows_cart_without_recounting(self):
+        share_cache(self)
+        self.client.force_login(self.user)
+        self.assertEqual(self.badge(), ({'count': 0, 'quantity': 0, 'total': 0}, 1))
+        self.assertEqual(self.badge()[1], 0)
+
+        self.add(self.a, 2)
+        self.add(self.b)
+        summary, queries = self.badge()
+        self.assertEqual((summary, queries), ({'count': 2, 'quantity': 3, 'total': 250}, 0))
+        self.assertContains(self.client.get(reverse('collections')), 'id="cart-badge">3<')
+
+        item = AddCart.objects.get(product=self.b)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('update_cart'), json.dumps({'items': {item.id: 4}}), content_type='application/json',
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        self.assertEqual(self.badge(), ({'count': 2, 'quantity': 6, 'total': 400}, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('remove_from_cart', args=[item.id]))
+        self.assertEqual(self.badge(), ({'count': 1, 'quantity': 2, 'total': 200}, 1))
+
+        self.a.selling = 80
+        self.a.save()
+        self.assertEqual(self.badge(), ({'count': 1, 'quantity': 2, 'total': 160}, 1))
+
+    def test_summary_is_counted_without_a_shared_cache(self):
+        # The default per-process cache: every page pays one aggregate over the user's cart
+        self.client.force_login(self.user)
+        self.add(self.a, 2)
+        for _ in range(2):
+            self.assertEqual(self.badge(), ({'count': 1, 'quantity': 2, 'total': 200}, 1))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('collections'))
+        counted = [q['sql'] for q in queries.captured_queries if 'sample_django_addcart' in q['sql']]
+        self.assertEqual(len(counted), 1)
+        self.assertIn('SUM(', counted[0])
+        # A change made by another worker, whose adjustments this process never sees
+        AddCart.objects.filter(user=self.user).update(quantity=5)
+        self.assertEqual(self.badge(), ({'count': 1, 'quantity': 5, 'total': 500}, 1))
+
+    def test_guest_summary_lives_in_the_session(self):
+        self.add(self.a, 2)
+        self.add(self.b)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('collections'))
+        self.assertEqual(response.context['cart_summary'], {'count': 2, 'quantity': 3, 'total': 250})
+        self.assertFalse([q for q in queries.captured_queries if 'sample_django_product' in q['sql']])
+        # A guest with a cart must not be served someone else's cached navbar
+        self.assertContains(self.client.get(reverse('collections')), 'id="cart-badge">3<')
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.category = make_category()
+
+    def test_amounts_are_exact(self):
+        self.assertEqual(pricing.to_money(0.1 + 0.2), Decimal('0.30'))
+        self.assertEqual(pricing.to_money('2.675'), Decimal('2.68'))
+        self.assertEqual(pricing.total([(3, 0.1), (1, '0.20'), (2, Decimal('19.99'))]), Decimal('40.48'))
+        self.assertEqual(pricing.to_minor(Decimal('19.99')), 1999)
+        self.assertEqual(pricing.from_minor(1999), Decimal('19.99'))
+        self.assertEqual(pricing.discounted('199.99', 10), Decimal('179.99'))
+        self.assertEqual(pricing.tax('100.00', '18'), Decimal('18.00'))
+        self.assertEqual(pricing.discount_percent(200, 150), 25.0)
+
+    def test_prices_are_stored_to_the_cent(self):
+        product = make_product(self.category, 'Sock', selling=Decimal('19.99'), original_price=Decimal('24.99'))
+        product.refresh_from_db()
+        self.assertEqual((product.selling, product.original_price), (Decimal('19.99'), Decimal('24.99')))
+
+    def test_database_totals_match_decimal_arithmetic(self):
+        order = Order.objects.create(user=self.user, order_number='T1', total_amount=0)
+        product = make_product(self.category, 'Sock')
+        prices = [Decimal(n).scaleb(-2) for n in range(1, 100_000, 997)]
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=i % 7 + 1, price=price) for i, price in enumerate(prices)
+        ])
+        exact = sum((i % 7 + 1) * price for i, price in enumerate(prices))
+        self.assertEqual(orders.refresh_total(order), exact)
+        self.assertEqual(
+            pricing.minor_total(order.items.values_list('quantity', pricing.minor_units('price'))), exact
+        )
+        minor = order.items.aggregate(total=pricing.minor_units_sum('quantity', 'price'))['total']
+        self.assertIs(type(minor), int)
+        self.assertEqual(pricing.from_minor(minor), exact)
+
+    def test_cart_totals_are_decimal(self):
+        AddCart.objects.create(user=self.user, product=make_product(self.category, 'a', selling=Decimal('0.10')), quantity=3)
+        AddCart.objects.create(user=self.user, product=make_product(self.category, 'b', selling=Decimal('0.20')), quantity=1)
+        self.assertEqual(carts.summary(self.user)['total'], Decimal('0.50'))
+        self.client.login(username='buyer', password='secret-pass-123')
+        response = self.client.get(reverse('checkout'))
+        self.assertEqual(response.context['total_amount'], Decimal('0.50'))
+
+    def test_price_cursor_round_trips(self):
+        for i in range(5):
+            make_product(self.category, 'p%d' % i, selling=Decimal('9.99') + i % 2)
+        seen, cursor = [], None
+        while True:
+            params = {'category': self.category.slug, 'sort': 'price_asc', 'size': 2}
+            if cursor:
+                params['after'] = cursor
+            data = self.client.get(reverse('product_feed'), params).json()
+            seen += [(Decimal(p['selling']), p['id']) for p in data['products']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(set(seen)), 5)
+
+
+class PromotionTests(TestCase):
+    def setUp(self):
+        promotions.expire_plan()
+        # The version lives in the DB, so the test's rollback takes it back; so must the plan
+        self.addCleanup(setattr, promotions, '_compiled', None)
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.client.login(username='buyer', password='secret-pass-123')
+        self.shoes = make_category('Shoes')
+        self.socks = make_category('Socks')
+        self.boot = make_product(self.shoes, 'Boot', selling=1000)
+        self.sock = make_product(self.socks, 'Sock', selling=100)
+
+    def promote(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Promotion.objects.create(**fields)
+
+    def quote(self, *lines, code=None):
+        return promotions.quote(
+            [(product.id, product.id, product.category_id, quantity, product.selling) for product, quantity in lines],
+            code,
+        )
+
+    def test_tiers_and_best_rule_per_line(self):
+        self.promote(name='Boot 5%', scope='product', product=self.boot, value=5)
+        self.promote(name='Boot 3+ 10%', scope='product', product=self.boot, value=10, min_quantity=3)
+        self.promote(name='Shoes 60 off', scope='category', category=self.shoes, kind='amount', value=60)
+        self.assertEqual(self.quote((self.boot, 1)).discount, 60)
+        self.assertEqual(self.quote((self.boot, 3)).discount, 300)
+        self.assertEqual(self.quote((self.sock, 3)).discount, 0)
+
+    def test_cart_rules_and_coupons(self):
+        self.promote(name='Big cart', scope='cart', kind='amount', value=50, min_total=1000)
+        self.promote(name='Welcome', code='hello', scope='cart', value=10, min_total=500)
+        self.promote(name='Sock coupon', code='HELLO', scope='category', category=self.socks, value=50)
+        self.assertEqual(self.quote((self.boot, 1)).discount, 50)
+        quote = self.quote((self.boot, 1), (self.sock, 2), code=' hello ')
+        # Socks at half price, then 10% of the 1100 left beats 50 off
+        self.assertEqual((quote.discount, quote.total, quote.code), (210, 990, 'HELLO'))
+        self.assertEqual(sorted(quote.applied), ['Sock coupon', 'Welcome'])
+        self.assertEqual(self.quote((self.boot, 1), code='nope').code, None)
+
+    def test_schedules_and_changes_recompile(self):
+        soon = timezone.now() + timedelta(hours=1)
+        self.promote(name='Later', scope='product', product=self.sock, value=20, starts_at=soon)
+        rule = self.promote(name='Now', scope='product', product=self.sock, value=10)
+        self.assertEqual(self.quote((self.sock, 1)).discount, 10)
+        self.assertEqual(promotions.plan().expires, soon)
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.delete()
+        self.assertEqual(self.quote((self.sock, 1)).discount, 0)
+
+    def test_changes_reach_other_processes(self):
+        self.promote(name='Now', scope='product', product=self.sock, value=10)
+        self.assertEqual(self.quote((self.sock, 1)).discount, 10)
+        # Edited through another worker: no signal here, and its cache is not this one's
+        Promotion.objects.update(value=30)
+        CacheGeneration.objects.filter(key=promotions.VERSION_KEY).update(value=F('value') + 1)
+        self.assertEqual(self.quote((self.sock, 1)).discount, 30)
+
+    def test_evaluation_only_checks_the_version(self):
+        for i in range(50):
+            self.promote(name='Tier %d' % i, scope='category', category=self.shoes, value=1 + i % 40, min_quantity=i)
+        self.promote(name='Cart', scope='cart', value=5, min_total=100)
+        promotions.plan()
+        lines = [(self.boot, i) for i in range(1, 200)]
+        # Only the promotions version, which lives in the DB while the cache is per process
+        with self.assertNumQueries(1):
+            quote = promotions.quote(
+                [(i, product.id, product.category_id, qty, product.selling) for i, (product, qty) in enumerate(lines)]
+            )
+        self.assertEqual(quote.lines[0], (1000, 20))
+        self.assertEqual(quote.lines[100], (101000, 40400))
+
+    def test_checkout_and_cart_apply_promotions(self):
+        self.promote(name='Sock sale', scope='category', category=self.socks, value=25)
+        self.promote(name='Welcome', code='WELCOME', scope='cart', kind='amount', value=100)
+        AddCart.objects.create(user=self.user, product=self.boot, quantity=1)
+        AddCart.objects.create(user=self.user, product=self.sock, quantity=2)
+        self.client.post(reverse('apply_coupon'), {'code': 'welcome'})
+        response = self.client.get(reverse('cart'))
+        self.assertEqual((response.context['quote'].discount, response.context['cart_total']), (150, 1050))
+        self.assertEqual(self.client.get(reverse('checkout')).context['total_amount'], 1050)
+        self.client.post(reverse('checkout'), {'shipping_address': '1, Main St'})
+        order = Order.objects.get(user=self.user)
+        self.assertEqual((order.total_amount, order.discount_amount, order.coupon_code), (1050, 150, 'WELCOME'))
+        self.assertEqual(orders.refresh_total(order), 1050)
+        self.client.post(reverse('apply_coupon'), {'code': 'bogus'})
+        self.assertEqual(self.client.session[promotions.SESSION_KEY], 'WELCOME')
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGBA', (width, height), (200, 30, 30, 128)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media, THUMBNAIL_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.name = default_storage.save('upload/red.png', ContentFile(_png(1200, 800)))
+
+    def test_variants_in_every_width_and_format(self):
+        self.assertEqual(thumbnails.generate(self.name), len(thumbnails.WIDTHS) * 2)
+        for width in thumbnails.WIDTHS:
+            with default_storage.open(thumbnails.variant_name(self.name, width, 'jpg')) as f:
+                image = Image.open(f)
+                self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (width, round(width * 2 / 3))))
+            self.assertTrue(default_storage.exists(thumbnails.variant_name(self.name, width, 'webp')))
+        self.assertEqual(thumbnails.generate(self.name), 0)
+
+    def test_tag_falls_back_until_variants_exist(self):
+        category = make_category()
+        product = make_product(category, 'Red', product_image='upload/missing.png')
+        render = lambda p: Template(
+            '{% load thumbnails %}{% responsive_image p.product_image sizes="50vw" alt=p.name %}'
+        ).render(Context({'p': p}))
+        self.assertHTMLEqual(render(product), '<img src="/images/upload/missing.png" alt="Red" loading="lazy">')
+        product.product_image = self.name
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        html = render(product)
+        self.assertIn('<source type="image/webp" srcset="/images/thumbs/upload/red-160w.webp 160w, ', html)
+        self.assertIn('src="/images/thumbs/upload/red-320w.jpg"', html)
+        self.assertIn('sizes="50vw"', html)
+
+    def test_backfill_command(self):
+        default_storage.save('upload/nested/blue.png', ContentFile(_png(100, 100)))
+        out = io.StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('of 2 of 2 image(s)', out.getvalue())
+        self.assertTrue(thumbnails.is_ready('upload/nested/blue.png'))
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media, THUMBNAIL_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.png = _png(40, 30)
+
+    def test_identical_uploads_are_stored_once(self):
+        category = make_category()
+        first = make_product(category, 'One')
+        second = make_product(category, 'Two')
+        first.product_image.save('a.PNG', ContentFile(self.png))
+        second.product_image.save('b.png', ContentFile(self.png))
+        self.assertEqual(first.product_image.name, second.product_image.name)
+        name = first.product_image.name
+        sha = name.rsplit('/', 1)[1][:-len('.png')]
+        self.assertEqual(name, 'upload/%s/%s/%s.png' % (sha[:2], sha[2:4], sha))
+        self.assertTrue(uploads.is_hashed(name))
+        self.assertEqual(len(list(uploads.upload_storage().listdir('upload/%s/%s' % (sha[:2], sha[2:4]))[1])), 1)
+
+    def test_hashed_files_are_immutable(self):
+        name = uploads.upload_storage().save('x.png', ContentFile(self.png))
+        response = self.client.get('/images/%s' % name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        default_storage.save('upload/legacy.png', ContentFile(self.png))
+        response = self.client.get('/images/upload/legacy.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response.get('Cache-Control', ''))
+
+    def test_command_repoints_fields_and_removes_duplicates(self):
+        default_storage.save('upload/a.png', ContentFile(self.png))
+        default_storage.save('upload/b.png', ContentFile(self.png))
+        default_storage.save('thumbs/upload/a-160w.jpg', ContentFile(b'old'))
+        category = make_category()
+        Catagory.objects.filter(pk=category.pk).update(image='upload/b.png')
+        product = make_product(category, 'Red', product_image='upload/a.png')
+
+        out = io.StringIO()
+        call_command('hash_uploads', '--dry-run', stdout=out)
+        self.assertIn('Would move 2 file(s) to 1 content-addressed name(s), %d byte(s)' % len(self.png), out.getvalue())
+        self.assertTrue(default_storage.exists('upload/a.png'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('hash_uploads', stdout=io.StringIO())
+        product.refresh_from_db()
+        category.refresh_from_db()
+        self.assertTrue(uploads.is_hashed(product.product_image.name))
+        self.assertEqual(product.product_image.name, category.image.name)
+        self.assertEqual(product.product_image.read(), self.png)
+        for old in ('upload/a.png', 'upload/b.png', 'thumbs/upload/a-160w.jpg'):
+            self.assertFalse(default_storage.exists(old))
+
+
+class StaticAssetTests(TestCase):
+    CSS = b"body { background: url('../fonts/f.ttf'); }\n" + b".card { margin: 0; }\n" * 200
+
+    def setUp(self):
+        source, self.root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for directory in (source, self.root):
+            self.addCleanup(shutil.rmtree, directory)
+        os.makedirs(os.path.join(source, 'css'))
+        os.makedirs(os.path.join(source, 'fonts'))
+        with open(os.path.join(source, 'css', 'site.css'), 'wb') as f:
+            f.write(self.CSS)
+        with open(os.path.join(source, 'fonts', 'f.ttf'), 'wb') as f:
+            f.write(b'font' * 100)
+        override = override_settings(STATICFILES_DIRS=[source], STATIC_ROOT=self.root, STORAGES={
+            **settings.STORAGES,
+            'staticfiles': {'BACKEND': 'sample_django.assets.CompressedManifestStaticFilesStorage'},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root, 'staticfiles.json')) as f:
+            self.hashed = json.load(f)['paths']['css/site.css']
+
+    def get(self, name, **headers):
+        return self.client.get('/static/%s' % name, **headers)
+
+    def test_collect_hashes_and_compresses(self):
+        self.assertRegex(self.hashed, r'^css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root, self.hashed), 'rb') as f:
+            collected = f.read()
+        self.assertRegex(collected, rb"url\(['\"]?\.\./fonts/f\.[0-9a-f]{12}\.ttf")
+        with gzip.open(os.path.join(self.root, self.hashed + '.gz')) as f:
+            self.assertEqual(f.read(), collected)
+
+    def test_serves_compressed_hashed_assets_for_a_year(self):
+        response = self.get(self.hashed, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn(b'.card', gzip.decompress(b''.join(response.streaming_content)))
+
+        response = self.get('css/site.css', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Cache-Control', response)
+        self.assertEqual(b''.join(response.streaming_content), self.CSS)
+        self.assertEqual(self.get('css/missing.css').status_code, 404)
+        self.assertEqual(self.get('../staticfiles.json').status_code, 404)
+
+    def test_byte_ranges_and_revalidation(self):
+        response = self.get('css/site.css', HTTP_RANGE='bytes=5-14', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 5-14/%d' % len(self.CSS))
+        self.assertEqual(b''.join(response.streaming_content), self.CSS[5:15])
+        response = self.get('css/site.css', HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), self.CSS[-4:])
+        response = self.get('css/site.css', HTTP_RANGE='bytes=%d-' % len(self.CSS))
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */%d' % len(self.CSS)))
+
+        modified = self.get('css/site.css')['Last-Modified']
+        self.assertEqual(self.get('css/site.css', HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+
+    def test_vendor_asset_falls_back_to_the_cdn(self):
+        render = lambda: Template("{% load assets %}{% vendor_asset 'bootstrap.js' %}").render(Context())
+        self.assertIn('src="https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/js/bootstrap.bundle.min.js"', render())
+        self.assertIn('integrity="sha384-', render())
+        files = dict(assets.vendor_files(assets.VENDOR['font-awesome.css']))
+        self.assertEqual(
+            files['vendor/font-awesome/fonts/fontawesome-webfont.woff2'],
+            'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/fonts/fontawesome-webfont.woff2',
+        )
+
+    def test_vendored_assets_are_picked_up_without_a_restart(self):
+        render = lambda: Template("{% load assets %}{% vendor_asset 'bootstrap.js' %}").render(Context())
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        plain = dict(settings.STORAGES, staticfiles={
+            'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+        })
+        with override_settings(STATICFILES_DIRS=[root], STORAGES=plain):
+            self.assertIn('cdn.jsdelivr.net', render())
+            path = os.path.join(root, assets.VENDOR['bootstrap.js'].path)
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write('/* bootstrap */')
+            self.assertIn('src="/static/vendor/bootstrap/js/bootstrap.bundle.min.js"', render())
+
+
+class AuthBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret-pass-123')
+        UserProfile.objects.create(user=self.user, contact_number='+15550001')
+        self.backend = auth_backend.ContactNumberAuthBackend()
+
+    def test_username_or_contact_number_in_one_indexed_query(self):
+        for identifier in ('alice', '+15550001'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(authenticate(None, username=identifier, password='secret-pass-123'), self.user)
+            self.assertEqual(len(queries), 1)
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + queries[0]['sql'])
+                plan = [row[-1] for row in cursor.fetchall()]
+            self.assertFalse([step for step in plan if step.startswith('SCAN') and 'USING' not in step], plan)
+        self.assertIsNone(authenticate(None, username='alice', password='wrong'))
+
+    def test_unknown_identifiers_are_remembered_until_someone_takes_them(self):
+        share_cache(self)
+        with self.assertNumQueries(1):
+            self.assertIsNone(authenticate(None, username='bob', password='x'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(authenticate(None, username='bob', password='x'))
+        User.objects.create_user('bob', password='secret-pass-123')
+        self.assertIsNotNone(authenticate(None, username='bob', password='secret-pass-123'))
+
+    def test_get_user_is_cached_until_the_user_is_saved(self):
+        share_cache(self)
+        self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+        self.assertIsNone(self.backend.get_user(self.user.pk + 1000))
+
+    def test_process_local_caches_are_bypassed(self):
+        # Another worker's LocMemCache would never hear of the registration or the deactivation
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertIsNone(authenticate(None, username='bob', password='x'))
+            with self.assertNumQueries(1):
+                self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        self.assertIsNone(cache.get(auth_backend.unknown_key('bob')))
+        self.assertIsNone(cache.get(auth_backend.user_key(self.user.pk)))
+
+    def test_contact_numbers_are_unique(self):
+        form = CustomUserForm({
+            'username': 'carol', 'email': 'c@x.com', 'contact_number': '+15550001',
+            'password1': 'Pa55-word-xyz', 'password2': 'Pa55-word-xyz',
+        })
+        self.assertIn('contact_number', form.errors)
+
+    def test_profile_updates_keep_contact_numbers_unique(self):
+        bob, carol = User.objects.create_user('bob'), User.objects.create_user('carol')
+        for user in (carol, bob):
+            self.client.force_login(user)
+            self.client.post(reverse('update_profile'), {'email': 'x@x.com', 'contact_number': ' '})
+        self.assertEqual(UserProfile.objects.filter(contact_number__isnull=True).count(), 2)
+
+        response = self.client.post(reverse('update_profile'), {'email': 'x@x.com', 'contact_number': '+15550001'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('already registered', str(list(get_messages(response.wsgi_request))[-1]))
+        self.assertIsNone(UserProfile.objects.get(user=bob).contact_number)
+
+
+class LoginRateLimitTests(TestCase):
+    def setUp(self):
+        ratelimit.local.clear()
+        self.addCleanup(ratelimit.local.clear)
+        cache.clear()
+
+    def test_token_bucket_refills_continuously(self):
+        buckets = ratelimit.TokenBuckets()
+        self.assertEqual([buckets.take('k', 3, 60, now=0) for _ in range(4)], [True, True, True, False])
+        self.assertFalse(buckets.take('k', 3, 60, now=10))
+        self.assertTrue(buckets.take('k', 3, 60, now=20))
+        self.assertTrue(buckets.take('other', 3, 60, now=20))
+
+    def test_shared_window_slides(self):
+        windows = ratelimit.CacheWindows()
+        self.assertEqual([windows.take('k', 3, 60, now=600) for _ in range(4)], [True, True, True, False])
+        # Halfway into the next window half of the last one still counts
+        self.assertEqual([windows.take('k', 3, 60, now=690) for _ in range(3)], [True, True, False])
+        self.assertTrue(windows.take('k', 3, 60, now=780))
+
+    @override_settings(LOGIN_RATE_LIMITS={'ip': (2, 60), 'identifier': (5, 300)})
+    def test_login_page_turns_away_a_spent_budget_without_hashing(self):
+        User.objects.create_user('alice', password='secret-pass-123')
+        post = lambda password: self.client.post(reverse('login'), {'username': 'alice', 'password': password})
+        self.assertEqual(post('wrong').status_code, 302)
+        self.assertEqual(post('wrong').status_code, 302)
+        verify = hashers.verify
+        calls = []
+        hashers.verify = lambda *args: calls.append(args) or verify(*args)
+        self.addCleanup(setattr, hashers, 'verify', verify)
+        response = post('secret-pass-123')
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '60'))
+        self.assertEqual(calls, [])
+        # Another address still has its own budget
+        response = self.client.post(
+            reverse('login'), {'username': 'alice', 'password': 'secret-pass-123'}, REMOTE_ADDR='10.0.0.2'
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('_auth_user_id', self.client.session)
+
+    def test_nobody_can_lock_out_another_client(self):
+        User.objects.create_user('alice', password='secret-pass-123')
+        # An attacker spends their own budget on alice's account, and on junk from many addresses
+        for n in range(20):
+            self.client.post(reverse('login'), {'username': 'alice', 'password': 'guess'}, REMOTE_ADDR='10.9.9.9')
+            self.client.post(reverse('login'), {'username': 'junk%d' % n, 'password': 'x'}, REMOTE_ADDR='10.8.0.%d' % n)
+        response = self.client.post(
+            reverse('login'), {'username': 'alice', 'password': 'secret-pass-123'}, REMOTE_ADDR='10.0.0.2'
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('_auth_user_id', self.client.session)
+
+    def test_hash_tiers_rehash_on_login(self):
+        with override_settings(PASSWORD_HASH_TIER='reduced'):
+            user = User.objects.create_user('bob', password='secret-pass-123')
+            self.assertTrue(user.password.startswith('pbkdf2_sha256$390000$'))
+            self.assertFalse(hashers.needs_rehash(user.password))
+        self.assertTrue(hashers.needs_rehash(user.password))
+        request = RequestFactory().post('/login/')
+        self.assertEqual(authenticate(request, username='bob', password='secret-pass-123'), user)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000000$'))
+
+
+class SessionEngineTests(TestCase):
+    def setUp(self):
+        # Lazy writeback needs a cache shared between processes; a file cache is one
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared = dict(settings.CACHES, sessions={
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        })
+        override = override_settings(CACHES=shared, SESSION_WRITEBACK_SECONDS=60)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('alice', password='secret-pass-123')
+
+    def session_queries(self, fn):
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        return [q['sql'].split()[0] for q in queries.captured_queries if 'django_session' in q['sql']]
+
+    def test_reads_come_from_the_cache(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.session_queries(lambda: self.client.get(reverse('cart'))), [])
+
+    def test_changes_reach_the_database_lazily(self):
+        session = SessionStore()
+        session['n'] = 1
+        self.assertEqual(self.session_queries(session.save)[-1], 'INSERT')
+        session['n'] = 2
+        self.assertEqual(self.session_queries(session.save), [])
+        self.assertEqual(SessionStore(session.session_key)['n'], 2)
+        with override_settings(SESSION_WRITEBACK_SECONDS=0):
+            session['n'] = 3
+            self.assertEqual(self.session_queries(session.save), ['UPDATE'])
+        caches['sessions'].clear()
+        self.assertEqual(SessionStore(session.session_key)['n'], 3)
+
+    def test_logins_are_written_through(self):
+        self.client.post(reverse('login'), {'username': 'alice', 'password': 'secret-pass-123'})
+        caches['sessions'].clear()
+        self.assertEqual(self.client.get(reverse('cart')).status_code, 200)
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.user.pk))
+
+    def test_expired_rows_are_cleared_in_batches(self):
+        model = SessionStore.get_model_class()
+        past, future = timezone.now() - timedelta(days=1), timezone.now() + timedelta(days=1)
+        model.objects.bulk_create(
+            [model(session_key='old%d' % n, session_data='', expire_date=past) for n in range(7)]
+            + [model(session_key='new%d' % n, session_data='', expire_date=future) for n in range(2)]
+        )
+        out = io.StringIO()
+        deletes = self.session_queries(
+            lambda: call_command('clear_expired_sessions', '--batch-size', '3', '--pause', '0', stdout=out)
+        ).count('DELETE')
+        self.assertEqual(deletes, 3)
+        self.assertIn('Deleted 7 expired session(s)', out.getvalue())
+        self.assertEqual(sorted(model.objects.values_list('session_key', flat=True)), ['new0', 'new1'])
+
+    def test_process_local_caches_are_bypassed(self):
+        local = dict(settings.CACHES, sessions={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'})
+        with override_settings(CACHES=local):
+            with self.assertRaises(ImproperlyConfigured):
+                SessionStore()
+            with override_settings(SESSION_WRITEBACK_SECONDS=0):
+                session = SessionStore()
+                session['n'] = 1
+                session.save()
+                self.assertEqual(SessionStore(session.session_key)['n'], 1)
+                # A logout in another worker deletes the row; this one must not serve its copy
+                SessionStore.get_model_class().objects.filter(session_key=session.session_key).delete()
+                self.assertNotIn('n', SessionStore(session.session_key))
+
+
+class SQLiteTuningTests(TransactionTestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            return cursor.execute('PRAGMA %s' % name).fetchone()[0]
+
+    def test_new_connections_are_configured(self):
+        connection.close()
+        self.assertEqual(self.pragma('busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+
+    @override_settings(DATABASE_WRITE_RETRIES=2, DATABASE_WRITE_RETRY_DELAY=0)
+    def test_locked_writes_are_retried(self):
+        calls = []
+
+        @db.retry_locked
+        def write(failures):
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        self.assertEqual(write(2), 'done')
+        self.assertEqual(len(calls), 3)
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            write(3)
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_and_nested_calls_are_not_retried(self):
+        calls = []
+
+        @db.retry_locked
+        def write(message):
+            calls.append(1)
+            raise OperationalError(message)
+
+        with self.assertRaises(OperationalError):
+            write('no such table: nowhere')
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write('database is locked')
+        self.assertEqual(len(calls), 2)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret-pass-123')
+        self.product = make_product(make_category(slug='shoes'), 'runner')
+
+    def queries(self, fn):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            fn()
+        # Cache generations are always read from the primary, which replicas lag
+        data = [q for q in primary.captured_queries if 'sample_django_cachegeneration' not in q['sql']]
+        return len(data), len(replica.captured_queries)
+
+    def test_reads_go_to_replicas_and_writes_to_the_primary(self):
+        router = routers.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), 'replica')
+        self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertEqual(Product.objects.get(pk=self.product.pk)._state.db, 'replica')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Product), 'default')
+        with routers.pinned():
+            self.assertEqual(router.db_for_read(Product), 'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_catalog_pages_read_from_replicas(self):
+        primary, replica = self.queries(lambda: self.client.get(reverse('collections')))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+        self.assertNotIn(routers.PIN_COOKIE, self.client.cookies)
+
+    def test_writers_read_their_own_writes(self):
+        self.client.login(username='alice', password='secret-pass-123')
+        response = self.client.post(
+            reverse('addtocart'), json.dumps({'pid': self.product.pk, 'product_qty': 1}),
+            content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        primary, replica = self.queries(lambda: self.client.get(reverse('cart')))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_sync_replica_copies_the_primary(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source, target = os.path.join(tmp, 'primary.sqlite3'), os.path.join(tmp, 'replica.sqlite3')
+            db = sqlite3.connect(source)
+            db.execute('CREATE TABLE t (n)')
+            db.execute('INSERT INTO t VALUES (1)')
+            db.commit()
+            db.close()
+            sync_replica.copy_database(source, target)
+            db = sqlite3.connect(target)
+            self.assertEqual(db.execute('SELECT n FROM t').fetchall(), [(1,)])
+            db.close()
@@ -0,0 +1,143 @@
+"""
+Resized WebP and JPEG variants of uploaded product and category images.
+
+Each upload gets one variant per width in WIDTHS and per format, stored next
+to the originals under thumbs/ (upload/x.jpeg -> thumbs/upload/x-320w.webp).
+They are made once, in a thread pool after the upload is committed (Pillow
+releases the GIL while it resizes and encodes), and by the
+generate_thumbnails command for files uploaded before this existed. The
+{% responsive_image %} tag points srcset at them once they exist and falls
+back to the original until then.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Card images are 200px tall and the cart shows 75px; 2x covers retina screens
+WIDTHS = (160, 320, 640, 960)
+# jpg last: its smallest variant is the last one written, which is_ready() looks for
+FORMATS = ('webp', 'jpg')
+PREFIX = 'thumbs'
+
+
+def variant_name(name, width, extension):
+    stem, _ = os.path.splitext(name)
+    return '%s/%s-%dw.%s' % (PREFIX, stem, width, extension)
+
+
+def srcset(name, extension, storage=None):
+    """The srcset attribute value for the variants of name in one format"""
+    storage = storage or default_storage
+    return ', '.join('%s %dw' % (storage.url(variant_name(name, width, extension)), width) for width in WIDTHS)
+
+
+def _encode(image, extension):
+    buffer = BytesIO()
+    if extension == 'jpg':
+        image.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=80, method=4)
+    return buffer.getvalue()
+
+
+def generate(name, storage=None, force=False):
+    """Write every variant of the original at name; returns how many were written"""
+    storage = storage or default_storage
+    if not force and _made(name, storage):
+        return 0
+    if not storage.exists(name):
+        logger.debug("No original at %s to make thumbnails of", name)
+        return 0
+    with storage.open(name, 'rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        # JPEG has no alpha; flatten onto white rather than black
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').split()[-1])
+        image = background
+    written = 0
+    # Largest first, each resized from the one before: cheaper than from the original
+    source = image
+    for width in sorted(WIDTHS, reverse=True):
+        if width < source.width:
+            # Height from the original, so rounding does not compound down the sizes
+            source = source.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for extension in FORMATS:
+            target = variant_name(name, width, extension)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(_encode(source, extension)))
+            written += 1
+    _ready.add(name)
+    return written
+
+
+# Originals known to have their variants, so templates need not stat for them
+_ready = set()
+
+
+def _made(name, storage):
+    # The last variant generate() writes
+    return storage.exists(variant_name(name, min(WIDTHS), FORMATS[-1]))
+
+
+def is_ready(name, storage=None):
+    if name in _ready:
+        return True
+    if _made(name, storage or default_storage):
+        _ready.add(name)
+        return True
+    return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=workers(), thread_name_prefix='thumbnails')
+        return _pool
+
+
+def workers():
+    return getattr(settings, 'THUMBNAIL_WORKERS', min(4, os.cpu_count() or 1))
+
+
+def _generate_logged(name, done):
+    try:
+        if generate(name) and done:
+            done()
+    except Exception:
+        logger.exception("Could not make thumbnails of %s", name)
+
+
+def _generate_in_pool(name, done):
+    try:
+        _generate_logged(name, done)
+    finally:
+        # done may have used the database; this thread's connection is nobody's to close otherwise
+        connections.close_all()
+
+
+def schedule(name, done=None):
+    """Make the variants of name in the pool; done is called if any were written"""
+    if not name or is_ready(name):
+        return
+    if workers() == 0:
+        _generate_logged(name, done)
+    else:
+        pool().submit(_generate_in_pool, name, done)
@@ -7,10 +7,15 @@ urlpatterns=[
     path('reg/',views.reg,name='reg'),
     path('',views.home,name='home'),
     path('collections/',views.collections,name="collections"),
-    path('collections/<str:name>/',views.collectionsview,name="collections"),
-    path('collections/<str:cname>/<str:pname>/',views.product_details,name="product_details"),
+    path('products/feed/',views.product_feed,name="product_feed"),
+    path('search/',views.search_page,name="search"),
+    path('search/suggest/',views.search_suggest,name="search_suggest"),
+    path('collections/<slug:slug>/',views.collectionsview,name="collections"),
+    path('collections/<slug:cslug>/<slug:pslug>/',views.product_details,name="product_details"),
     path('addtocart/',views.add_to_cart,name="addtocart"),
     path('cart',views.view_cart,name="cart"),
+    path('cart/update/',views.update_cart,name="update_cart"),
+    path('cart/coupon/',views.apply_coupon,name="apply_coupon"),
     path('fav_page',views.fav_page,name="fav_page"),
     path('favourites/', views.favourites, name="favourites"),
     path('remove-from-favourites/<int:fav_id>/', views.remove_from_favourites, name="remove_from_favourites"),
@@ -19,6 +24,7 @@ urlpatterns=[
     path('update-profile/',views.update_profile,name='update_profile'),
     path('change-password/',views.change_password,name='change_password'),
     path('checkout/',views.checkout,name='checkout'),
+    path('checkout/hold/',views.checkout_hold,name='checkout_hold'),
     path('checkout/buy-now/<int:product_id>/<int:quantity>/',views.checkout_buy_now,name='checkout_buy_now'),
     path('order-confirmation/<int:order_id>/',views.order_confirmation,name='order_confirmation'),
     path('my-orders/',views.my_orders,name='my_orders'),
@@ -2,56 +2,151 @@ from django.shortcuts import render, redirect, HttpResponse
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.http import JsonResponse
+from django.db import transaction, IntegrityError
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 import json
-from django.utils import timezone
+
+from asgiref.sync import sync_to_async
 
 from sample_django.Register import CustomUserForm
 from .models import Catagory, Product, UserProfile, AddCart, Order, OrderItem, Favourite, CustomerFeedback
+from . import assets, catalog, stock, orders, search, facets, carts, promotions, thumbnails
+from .caching import cache_anonymous_page
+from .storage import is_hashed
+from .pagination import keyset_page, InvalidCursor, PAGE_SIZE, NEWEST_FIRST
+
 
+def _page(queryset, request, order=NEWEST_FIRST):
+    """Keyset page of queryset for the ?after= cursor, restarting on a bad cursor"""
+    try:
+        return keyset_page(queryset, request.GET.get('after'), order=order)
+    except InvalidCursor:
+        return keyset_page(queryset, order=order)
 
+@cache_anonymous_page
 def home(request):
-    # Get all active products (status=0)
-    products = Product.objects.filter(status=0)
-    # Get trending products specifically
-    trending_products = Product.objects.filter(trending=1, status=0)
+    # Get active products (status=0), one keyset page at a time
+    products, next_cursor = _page(catalog.active_products(), request)
+    # Trending products only ever show their first page
+    trending_products, _ = keyset_page(catalog.trending_products())
     return render(request,'shop/home.html',{
         'products': products,
-        'trending_products': trending_products
+        'trending_products': trending_products,
+        'next_cursor': next_cursor,
     })
 
-def add_to_cart(request):
+def serve_upload(request, path):
+    """Uploaded images and their thumbnails; content-addressed ones never change"""
+    return assets.serve_file(request, assets.resolve(settings.MEDIA_ROOT, path), immutable=is_hashed(path))
+
+def serve_static(request, path):
+    """Collected assets; manifest-hashed names never change"""
+    return assets.serve_file(request, assets.static_path(path), immutable=assets.is_hashed_static(path))
+
+def _webp_srcset(image):
+    if image and thumbnails.is_ready(image.name):
+        return thumbnails.srcset(image.name, 'webp')
+    return None
+
+def product_feed(request):
+    """
+    JSON pages of product cards for infinite scroll on home and collections.
+
+    Takes the same filter and sort parameters as the collection pages; with
+    ?category= the response also carries that category's facet counts.
+    """
+    slug = request.GET.get('category')
+    category = catalog.visible_category(slug) if slug else None
+    if slug:
+        queryset = catalog.category_products(category)
+    else:
+        queryset = catalog.active_products()
+    queryset, order = facets.apply_filters(queryset, facets.parse(request.GET))
+    try:
+        products, next_cursor = keyset_page(
+            queryset, request.GET.get('after'), request.GET.get('size', PAGE_SIZE), order
+        )
+    except (InvalidCursor, ValueError):
+        return JsonResponse({"status": "Invalid cursor"}, status=400)
+
+    data = {
+        "products": [
+            {
+                "id": product.id,
+                "name": product.name,
+                "category": product.category.name,
+                "vendor": product.vendor,
+                "original_price": product.original_price,
+                "selling": product.selling,
+                "discount": round(product.discount, 1),
+                "in_stock": product.quantity > 0,
+                "trending": product.trending,
+                "image": product.product_image.url if product.product_image else None,
+                "image_srcset": _webp_srcset(product.product_image),
+                "url": product.get_absolute_url(),
+            }
+            for product in products
+        ],
+        "next": next_cursor,
+    }
+    if slug:
+        data["facets"] = facets.counts(category)
+    return JsonResponse(data)
+
+def search_page(request):
+    """Full-text product search results"""
+    query = request.GET.get('q', '').strip()
+    products = search.search(query) if query else []
+    return render(request, "shop/search.html", {"products": products, "query": query})
+
+def search_suggest(request):
+    """Autocomplete suggestions for the navbar search box"""
+    return JsonResponse({"suggestions": search.suggest(request.GET.get('q', ''))})
+
+@sync_to_async
+def _insert_once(model, **fields):
+    """
+    INSERT a row, returning False if a unique constraint already holds it.
+
+    The async ORM cannot open transactions, so this runs on the sync side
+    where the savepoint keeps a rejected INSERT from breaking any outer one.
+    """
+    try:
+        with transaction.atomic():
+            model.objects.create(**fields)
+    except IntegrityError:
+        return False
+    return True
+
+async def add_to_cart(request):
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
-        if request.user.is_authenticated:
-            try:
-                data = json.loads(request.body)
-                quantity = int(data.get("product_qty", 1))
-                product_id = int(data.get("pid"))
-                
-                product = Product.objects.get(id=product_id)
-                
-                # Check if already in cart
-                if AddCart.objects.filter(user=request.user, product=product).exists():
-                    return JsonResponse({"status": "Product already in cart"}, status=200)
+        user = await request.auser()
+        try:
+            data = json.loads(request.body)
+            quantity = int(data.get("product_qty", 1))
+            product_id = int(data.get("pid"))
+            
+            product = await Product.objects.only('id', 'quantity', 'selling').aget(id=product_id)
+            
+            if product.quantity < quantity:
+                return JsonResponse({"status": "Not enough stock"}, status=200)
+            if user.is_authenticated:
+                # The unique (user, product) constraint rejects duplicates in the same INSERT
+                added = await _insert_once(AddCart, user=user, product=product, quantity=quantity)
+            else:
+                # Guests cart into their session; it is merged into AddCart on login
+                added = await carts.aadd_guest_line(request.session, product, quantity)
+            if not added:
+                return JsonResponse({"status": "Product already in cart"}, status=200)
+            return JsonResponse({"status": "Product added to cart"}, status=200)
                 
-                if product.quantity >= quantity:
-                    AddCart.objects.create(
-                        user=request.user,
-                        product=product,
-                        quantity=quantity
-                    )
-                    return JsonResponse({"status": "Product added to cart"}, status=200)
-                else:
-                    return JsonResponse({"status": "Not enough stock"}, status=200)
-                    
-            except Product.DoesNotExist:
-                return JsonResponse({"status": "Product not found"}, status=404)
-            except (ValueError, json.JSONDecodeError):
-                return JsonResponse({"status": "Invalid data"}, status=400)
-        else:
-            return JsonResponse({"status": "Login to add to cart"}, status=403)
+        except Product.DoesNotExist:
+            return JsonResponse({"status": "Product not found"}, status=404)
+        except (ValueError, TypeError, json.JSONDecodeError):
+            return JsonResponse({"status": "Invalid data"}, status=400)
     
     return JsonResponse({"status": "Invalid access"}, status=400)
 
@@ -85,6 +180,12 @@ def login_page(request):
             login(request, user)
             messages.success(request, "Logged in Success")
             return redirect('/')
+        elif getattr(request, 'login_throttled', False):
+            # Kept cheap: under a credential-stuffing burst most POSTs end here
+            response = HttpResponse("Too many login attempts, please try again in a minute", status=429,
+                                    content_type='text/plain')
+            response['Retry-After'] = '60'
+            return response
         else:
             messages.error(request, "Invalid User Name or Password")
             return redirect('/login')
@@ -97,45 +198,111 @@ def logout_page(request):
         messages.success(request, "Logged out Successfully")
     return redirect('/')
 
+@cache_anonymous_page
 def collections(request):
-    catagory = Catagory.objects.filter(status=0)
+    catagory = catalog.visible_categories()
     return render(request, "shop/collections.html", {"catagory": catagory})
 
-def collectionsview(request, name):
-    if Catagory.objects.filter(name=name, status=0).exists():
-        products = Product.objects.filter(category__name=name)
-        return render(request, "shop/products/index.html", {"products": products, "category_name": name})
+@cache_anonymous_page
+def collectionsview(request, slug):
+    category = catalog.visible_category(slug)
+    if category:
+        selected = facets.parse(request.GET)
+        queryset, order = facets.apply_filters(catalog.category_products(category), selected)
+        products, next_cursor = _page(queryset, request, order)
+        return render(request, "shop/products/index.html", {
+            "products": products,
+            "category": category,
+            "category_name": category.name,
+            "next_cursor": next_cursor,
+            "facets": facets.options(facets.counts(category)),
+            "selected": selected,
+            "filter_query": facets.querystring(selected),
+            "sorts": facets.SORTS,
+        })
     else:
         messages.warning(request, "No Such Catagory Found")
         return redirect('collections')
 
-def product_details(request, cname, pname):
-    if Catagory.objects.filter(name=cname, status=0).exists():
-        product = Product.objects.filter(name=pname, status=0).first()
-        if product:
-            return render(request, "shop/products/productdetails.html", {"products": product})
-        else:
-            messages.error(request, "No such product found")
-            return redirect('collections')
+@cache_anonymous_page
+def product_details(request, cslug, pslug):
+    product = catalog.product_by_slugs(cslug, pslug)
+    if product:
+        return render(request, "shop/products/productdetails.html", {"products": product})
+    elif catalog.visible_category(cslug):
+        messages.error(request, "No such product found")
+        return redirect('collections')
     else:
         messages.error(request, "No such catagory Found")
         return redirect('collections')
 
+def _quote_cart(cart, code):
+    return promotions.quote(
+        ((item.id, item.product_id, item.product.category_id, item.quantity, item.product.selling) for item in cart),
+        code,
+    )
+
 def view_cart(request):
     if request.user.is_authenticated:
-        cart = AddCart.objects.filter(user=request.user)
-        return render(request, "shop/cart.html", {"cart": cart})
+        cart = list(catalog.cart_items(request.user))
     else:
-        return redirect('/login')
+        cart = carts.guest_cart_items(carts.guest_lines(request.session))
+    quote = _quote_cart(cart, promotions.session_code(request.session))
+    return render(request, "shop/cart.html", {
+        "cart": cart,
+        "cart_lines": [(item, quote.lines[item.id][1]) for item in cart],
+        "quote": quote,
+        "coupon": promotions.session_code(request.session),
+        "cart_total": quote.total,
+    })
 
-def remove_from_cart(request, item_id):
-    if request.user.is_authenticated:
-        try:
-            cart_item = AddCart.objects.get(id=item_id, user=request.user)
-            cart_item.delete()
-            messages.success(request, "Item removed from cart successfully!")
-        except AddCart.DoesNotExist:
-            messages.error(request, "Item not found in your cart!")
+def apply_coupon(request):
+    """Remember a coupon code for the cart and checkout; an empty code removes it"""
+    if request.method != "POST":
+        return redirect('cart')
+    code = promotions.normalize_code(request.POST.get('code'))
+    if not code:
+        request.session.pop(promotions.SESSION_KEY, None)
+        messages.success(request, "Coupon removed")
+    elif promotions.is_coupon(code):
+        request.session[promotions.SESSION_KEY] = code
+        messages.success(request, f"Coupon {code} applied")
+    else:
+        messages.error(request, "That coupon code is not valid")
+    return redirect('cart')
+
+def update_cart(request):
+    """
+    Apply a batch of {"items": {item_id: quantity}} changes to the cart, 0
+    removing a line, and answer with the recomputed totals. The cart page
+    debounces its quantity steppers into one call of this.
+    """
+    if request.method != "POST" or request.headers.get("x-requested-with") != "XMLHttpRequest":
+        return JsonResponse({"status": "Invalid access"}, status=400)
+    try:
+        changes = json.loads(request.body)["items"]
+        code = promotions.session_code(request.session)
+        if request.user.is_authenticated:
+            result = carts.update_quantities(request.user, changes, code)
+        else:
+            result = carts.update_guest_quantities(request.session, changes, code)
+    except carts.NotEnoughStock as e:
+        return JsonResponse({"status": "Not enough stock", "available": e.available}, status=409)
+    except (KeyError, AttributeError, ValueError, TypeError, json.JSONDecodeError):
+        return JsonResponse({"status": "Invalid data"}, status=400)
+    return JsonResponse({"status": "Cart updated", **result})
+
+async def remove_from_cart(request, item_id):
+    user = await request.auser()
+    if user.is_authenticated:
+        deleted, _ = await AddCart.objects.filter(id=item_id, user=user).adelete()
+    else:
+        # A guest cart is keyed by product id
+        deleted = await carts.aremove_guest_line(request.session, item_id)
+    if deleted:
+        messages.success(request, "Item removed from cart successfully!")
+    else:
+        messages.error(request, "Item not found in your cart!")
     return redirect('cart')
 
 def dashboard(request):
@@ -154,10 +321,19 @@ def update_profile(request):
         user.email = request.POST.get('email', '')
         
         # Update contact number in UserProfile
-        contact_number = request.POST.get('contact_number', '')
+        contact_number = request.POST.get('contact_number', '').strip() or None
+        if contact_number and UserProfile.objects.filter(contact_number=contact_number).exclude(user=user).exists():
+            messages.error(request, "This contact number is already registered.")
+            return redirect('dashboard')
         user_profile, created = UserProfile.objects.get_or_create(user=user)
         user_profile.contact_number = contact_number
-        user_profile.save()
+        try:
+            with transaction.atomic():
+                user_profile.save()
+        except IntegrityError:
+            # Taken by someone else since the check above
+            messages.error(request, "This contact number is already registered.")
+            return redirect('dashboard')
         
         user.save()
         messages.success(request, "Profile updated successfully!")
@@ -187,8 +363,7 @@ def checkout(request):
     
     if request.method == 'POST':
         # Handle checkout from cart
-        cart_items = AddCart.objects.filter(user=request.user)
-        if not cart_items:
+        if not AddCart.objects.filter(user=request.user).exists():
             messages.warning(request, "Your cart is empty")
             return redirect('cart')
         
@@ -203,47 +378,74 @@ def checkout(request):
             messages.error(request, "Shipping address must contain at least one special character: , . - / # @ & ( )")
             return redirect('checkout')
         
-        total_amount = sum(item.product.selling * item.quantity for item in cart_items)
-        
-        order_number = f"ORD-{request.user.id}-{timezone.now().strftime('%Y%m%d%H%M%S')}"
-        order = Order.objects.create(
-            user=request.user,
-            order_number=order_number,
-            total_amount=total_amount,
-            shipping_address=shipping_address,
-            status='pending'
-        )
-        
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.selling
+        try:
+            order = orders.place_cart_order(
+                request.user,
+                promotions.session_code(request.session),
+                shipping_address=shipping_address,
+                status='pending'
             )
-            
-            item.product.quantity -= item.quantity
-            item.product.save()
-        
-        cart_items.delete()
+        except stock.OutOfStock:
+            messages.error(request, "Some items in your cart are no longer in stock")
+            return redirect('cart')
+        except orders.EmptyOrder:
+            messages.warning(request, "Your cart is empty")
+            return redirect('cart')
         
-        messages.success(request, f"Order #{order_number} placed successfully!")
+        messages.success(request, f"Order #{order.order_number} placed successfully!")
         return redirect('order_confirmation', order_id=order.id)
     
-    cart_items = AddCart.objects.filter(user=request.user)
+    cart_items = catalog.cart_items(request.user)
     if not cart_items:
         messages.warning(request, "Your cart is empty")
         return redirect('cart')
     
-    total_amount = sum(item.product.selling * item.quantity for item in cart_items)
+    quote = _quote_cart(cart_items, promotions.session_code(request.session))
     context = {
         'cart_items': cart_items,
-        'total_amount': total_amount,
+        'quote': quote,
+        'total_amount': quote.total,
         'is_buy_now': False,
     }
     
     return render(request, 'shop/checkout.html', context)
 
+def checkout_hold(request):
+    """Hold the stock for a checkout, then show its form; the cart's or, with product_id, a buy now's"""
+    if not request.user.is_authenticated:
+        messages.warning(request, "Please login to proceed with checkout")
+        return redirect('login')
+    # A GET must not take stock off sale: links get prefetched, crawled and reloaded
+    if request.method != 'POST':
+        return redirect('cart')
+    
+    if request.POST.get('product_id'):
+        try:
+            product = Product.objects.get(id=int(request.POST['product_id']))
+            quantity = int(request.POST.get('quantity', 1))
+        except (Product.DoesNotExist, ValueError):
+            messages.error(request, "Product not found")
+            return redirect('home')
+        lines = {product.id: quantity}
+        target = redirect('checkout_buy_now', product_id=product.id, quantity=quantity)
+        failed = redirect(product)
+    else:
+        lines = stock.cart_lines(AddCart.objects.filter(user=request.user))
+        target, failed = redirect('checkout'), redirect('cart')
+        if not lines:
+            messages.warning(request, "Your cart is empty")
+            return failed
+    
+    try:
+        stock.hold(request.user, lines)
+    except stock.OutOfStock:
+        messages.error(request, "Not enough stock available")
+        return failed
+    except ValueError:
+        messages.error(request, f"You can order at most {stock.max_order_quantity()} of a product")
+        return failed
+    return target
+
 def checkout_buy_now(request, product_id, quantity):
     """Handle direct buy now checkout"""
     if not request.user.is_authenticated:
@@ -252,6 +454,9 @@ def checkout_buy_now(request, product_id, quantity):
     
     try:
         product = Product.objects.get(id=product_id)
+        if quantity > stock.max_order_quantity():
+            messages.error(request, f"You can order at most {stock.max_order_quantity()} of a product")
+            return redirect(product)
         
         if request.method == 'POST':
             # Get customer information and payment method
@@ -277,15 +482,12 @@ def checkout_buy_now(request, product_id, quantity):
                 messages.error(request, "Shipping address must contain at least one special character: , . - / # @ & ( )")
                 return redirect('checkout_buy_now', product_id=product_id, quantity=quantity)
             
-            quantity = int(quantity)
-            if product.quantity >= quantity:
-                order_number = f"ORD-{request.user.id}-{timezone.now().strftime('%Y%m%d%H%M%S')}"
-                total_amount = product.selling * quantity
-                
-                order = Order.objects.create(
-                    user=request.user,
-                    order_number=order_number,
-                    total_amount=total_amount,
+            try:
+                order = orders.place_order(
+                    request.user,
+                    [(product.id, int(quantity), product.selling)],
+                    promotions.session_code(request.session),
+                    {product.id: product.category_id},
                     customer_name=customer_name,
                     customer_email=customer_email,
                     customer_contact=customer_contact,
@@ -293,23 +495,12 @@ def checkout_buy_now(request, product_id, quantity):
                     shipping_address=shipping_address,
                     status='pending'
                 )
-                
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                    price=product.selling
-                )
-                
-                product.quantity -= quantity
-                product.save()
-                
-                messages.success(request, f"Order #{order_number} placed successfully!")
-                return redirect('order_confirmation', order_id=order.id)
-
-            else:
+            except (stock.OutOfStock, ValueError):
                 messages.error(request, "Not enough stock available")
-                return redirect('product_details', cname=product.category.name, pname=product.name)
+                return redirect(product)
+            
+            messages.success(request, f"Order #{order.order_number} placed successfully!")
+            return redirect('order_confirmation', order_id=order.id)
                 
     except Product.DoesNotExist:
         messages.error(request, "Product not found")
@@ -326,11 +517,15 @@ def checkout_buy_now(request, product_id, quantity):
     except UserProfile.DoesNotExist:
         pass
     
-    total_amount = product.selling * int(quantity)
+    quote = promotions.quote(
+        [(product.id, product.id, product.category_id, int(quantity), product.selling)],
+        promotions.session_code(request.session),
+    )
     context = {
         'product': product,
         'quantity': int(quantity),
-        'total_amount': total_amount,
+        'quote': quote,
+        'total_amount': quote.total,
         'is_buy_now': True,
         'customer_name': customer_name,
         'customer_email': customer_email,
@@ -347,7 +542,7 @@ def order_confirmation(request, order_id):
     
     try:
         order = Order.objects.get(id=order_id, user=request.user)
-        order_items = OrderItem.objects.filter(order=order)
+        order_items = catalog.order_items(order)
         
         context = {
             'order': order,
@@ -368,28 +563,24 @@ def my_orders(request):
     orders = Order.objects.filter(user=request.user).order_by('-created_at')
     return render(request, 'shop/my_orders.html', {'orders': orders})
 
-def fav_page(request):
+async def fav_page(request):
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
-        if request.user.is_authenticated:
+        user = await request.auser()
+        if user.is_authenticated:
             try:
                 data = json.loads(request.body)
                 product_id = int(data.get("pid"))
                 
-                product = Product.objects.get(id=product_id)
+                product = await Product.objects.only('id').aget(id=product_id)
                 
-                # Check if already in favourites
-                if Favourite.objects.filter(user=request.user, product=product).exists():
+                # The unique (user, product) constraint rejects duplicates in the same INSERT
+                if not await _insert_once(Favourite, user=user, product=product):
                     return JsonResponse({"status": "Product already in favourites"}, status=200)
-                
-                Favourite.objects.create(
-                    user=request.user,
-                    product=product
-                )
                 return JsonResponse({"status": "Product added to favourites"}, status=200)
                     
             except Product.DoesNotExist:
                 return JsonResponse({"status": "Product not found"}, status=404)
-            except (ValueError, json.JSONDecodeError):
+            except (ValueError, TypeError, json.JSONDecodeError):
                 return JsonResponse({"status": "Invalid data"}, status=400)
         else:
             return JsonResponse({"status": "Login to add to favourites"}, status=403)
@@ -407,18 +598,14 @@ def favourites(request):
     return render(request, 'shop/favourite.html', {'favourites': favourites})
 
 @login_required
-def remove_from_favourites(request, fav_id):
+async def remove_from_favourites(request, fav_id):
     """Remove a product from user's favourites"""
-    if not request.user.is_authenticated:
-        messages.warning(request, "Please login to modify your favourites")
-        return redirect('login')
-    
-    try:
-        favourite = Favourite.objects.get(id=fav_id, user=request.user)
-        product_name = favourite.product.name
-        favourite.delete()
+    user = await request.auser()
+    favourites = Favourite.objects.filter(id=fav_id, user=user)
+    product_name = await favourites.values_list('product__name', flat=True).afirst()
+    if product_name is not None and (await favourites.adelete())[0]:
         messages.success(request, f"{product_name} removed from favourites successfully!")
-    except Favourite.DoesNotExist:
+    else:
         messages.error(request, "Favourite item not found")
     
     return redirect('favourites')
@@ -495,7 +682,7 @@ def admin_feedback_list(request):
         messages.error(request, "You don't have permission to view this page")
         return redirect('home')
     
-    feedback_list = CustomerFeedback.objects.all()
+    feedback_list = CustomerFeedback.objects.select_related('product__category', 'order')
     unread_count = feedback_list.filter(is_read=False).count()
     
     context = {
@@ -525,7 +712,7 @@ def mark_feedback_read(request, feedback_id):
 def order_feedback(request, order_id):
     """Handle feedback specifically for an order"""
     try:
-        order = Order.objects.get(id=order_id, user=request.user)
+        order = catalog.orders_with_items(request.user).get(id=order_id)
     except Order.DoesNotExist:
         messages.error(request, "Order not found or you don't have permission to leave feedback for this order.")
         return redirect('my_orders')